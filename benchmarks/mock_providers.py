@@ -0,0 +1,292 @@
+"""
+Local stand-ins for the upstream chat APIs, speaking the same wire protocols as the real ones so the clients can be
+benchmarked without touching the vendors.
+
+    python -m benchmarks.mock_providers --port 8900 --latency 0.05 --jitter 0.02 --failure-rate 0.01
+
+Every provider lives under its own path prefix (/decagon, /mycity, /shopify, /att, /chatwith, /scoutly), use
+point_clients() to aim the client classes at them. GET /_stats returns upstream request counts per route and
+POST /_stats/reset clears them.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass, asdict
+
+from aiohttp import web
+
+
+@dataclass
+class MockSettings:
+    latency: float = 0.02  # seconds before any response starts
+    jitter: float = 0.01  # up to this many seconds added to latency, at random
+    failure_rate: float = 0.0  # fraction of requests answered with a 503
+    generation_time: float = 0.2  # seconds until a polled (Decagon/Shopify history) answer shows up
+    chunks: int = 8  # pieces a streamed answer is sent in
+    chunk_delay: float = 0.01  # seconds between streamed pieces
+    answer_words: int = 60
+    shopify_stream_complete: bool = True  # False cuts Shopify's event stream off halfway so the client falls back to polling
+
+
+STATS = web.AppKey("stats", Counter)
+SETTINGS = web.AppKey("settings", MockSettings)
+CONVERSATIONS = web.AppKey("conversations", dict)
+
+
+def answer_for(prompt: str, settings: MockSettings) -> str:
+    words = [f"word{i}" for i in range(settings.answer_words)]
+    return f"You asked: {prompt[:40]}. " + " ".join(words)
+
+
+def pieces(text: str, count: int):
+    size = max(1, -(-len(text) // max(1, count)))
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+@web.middleware
+async def upstream_conditions(request, handler):
+    """
+    Counts every request and applies the configured latency, jitter and failures before the real handler runs
+    """
+    settings = request.app[SETTINGS]
+    if request.path.startswith("/_stats"):
+        return await handler(request)
+    route = request.match_info.route.resource.canonical if request.match_info.route.resource else request.path
+    request.app[STATS][f"{request.method} {route}"] += 1
+    await asyncio.sleep(settings.latency + random.uniform(0, settings.jitter))
+    if random.random() < settings.failure_rate:
+        request.app[STATS]["failures injected"] += 1
+        return web.Response(status=503, text="injected failure")
+    return await handler(request)
+
+
+routes = web.RouteTableDef()
+
+
+# Decagon: create a conversation, post a message, then poll the history until the AI reply shows up
+
+@routes.post("/decagon/conversation/new")
+async def decagon_new(request):
+    conversation_id = str(uuid.uuid4())
+    request.app[CONVERSATIONS][conversation_id] = []
+    return web.json_response({"conversation_id": conversation_id})
+
+
+@routes.post("/decagon/chat/{conversation_id}/message")
+async def decagon_message(request):
+    settings = request.app[SETTINGS]
+    body = await request.json()
+    messages = request.app[CONVERSATIONS].setdefault(request.match_info["conversation_id"], [])
+    messages.append({"id": str(uuid.uuid4()), "role": "USER", "text": body["text"]})
+    messages.append({
+        "id": str(uuid.uuid4()),
+        "role": "AI",
+        "text": answer_for(body["text"], settings),
+        "ready_at": time.monotonic() + settings.generation_time,
+    })
+    return web.json_response({"status": "ok"})
+
+
+@routes.get("/decagon/conversation/history")
+async def decagon_history(request):
+    now = time.monotonic()
+    messages = request.app[CONVERSATIONS].get(request.query.get("conversation_id"), [])
+    visible = []
+    for message in messages:
+        if message.get("ready_at", 0) > now:
+            break
+        visible.append({k: v for k, v in message.items() if k != "ready_at"})
+    return web.json_response({"messages": visible})
+
+
+# MyCity: one POST answered with NDJSON chunks, each repeating the whole answer so far
+
+@routes.post("/mycity/conversation")
+async def mycity_conversation(request):
+    settings = request.app[SETTINGS]
+    body = await request.json()
+    answer = answer_for(body["messages"][-1]["content"], settings)
+    resp = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+    await resp.prepare(request)
+    chunk_id = str(uuid.uuid4())
+    so_far = ""
+    parts = pieces(answer, settings.chunks)
+    for i, part in enumerate(parts):
+        so_far += part
+        chunk = {
+            "model": "gpt-35-turbo-16k",
+            "is_last": i == len(parts) - 1,
+            "choices": [{"messages": [
+                {"role": "tool", "content": '{"citations": [], "intent": "", "search_intent": ""}'},
+                {"role": "assistant", "content": so_far},
+            ]}],
+            "id": chunk_id,
+            "created": int(time.time()),
+            "object": "chat.completion.chunk",
+        }
+        await resp.write((json.dumps(chunk) + "\n").encode())
+        await asyncio.sleep(settings.chunk_delay)
+    await resp.write_eof()
+    return resp
+
+
+# Shopify: anonymous user, a remix redirect naming the conversation, then an event stream (or history polling)
+
+@routes.post("/shopify/api/anonymous_user")
+async def shopify_anonymous_user(request):
+    return web.json_response({"identifier": str(uuid.uuid4())})
+
+
+@routes.post("/shopify/en/search/What")
+async def shopify_assistant(request):
+    conversation_id = uuid.uuid4().hex
+    request.app[CONVERSATIONS][conversation_id] = []
+    return web.Response(
+        status=204,
+        headers={"x-remix-redirect": f"/en/search/What.{conversation_id}?q="},
+    )
+
+
+@routes.post("/shopify/api/messages")
+async def shopify_messages(request):
+    settings = request.app[SETTINGS]
+    body = (await request.json())["message"]
+    messages = request.app[CONVERSATIONS].setdefault(body["conversation_id"], [])
+    answer = answer_for(body["content"], settings)
+    reply = {
+        "id": str(uuid.uuid4()),
+        "role": "assistant",
+        "content": [{"markdown": answer}],
+        "ready_at": time.monotonic() + settings.generation_time,
+    }
+    messages.append({"id": str(uuid.uuid4()), "role": "user", "content": body["content"]})
+    messages.append(reply)
+
+    resp = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+    await resp.prepare(request)
+    parts = pieces(answer, settings.chunks)
+    if not settings.shopify_stream_complete:
+        parts = parts[: len(parts) // 2]
+    for part in parts:
+        await resp.write(f"data: {json.dumps({'delta': part})}\n\n".encode())
+        await asyncio.sleep(settings.chunk_delay)
+    if not settings.shopify_stream_complete:
+        request.transport.close()  # drop the connection without ending the response
+        return resp
+    final = {k: v for k, v in reply.items() if k != "ready_at"}
+    await resp.write(f"data: {json.dumps({'message': {**final, 'status': 'completed'}})}\n\n".encode())
+    await resp.write(b"event: done\ndata: [DONE]\n\n")
+    await resp.write_eof()
+    return resp
+
+
+@routes.get("/shopify/api/conversations/{conversation_id}")
+async def shopify_conversation(request):
+    now = time.monotonic()
+    messages = request.app[CONVERSATIONS].get(request.match_info["conversation_id"], [])
+    visible = [{k: v for k, v in m.items() if k != "ready_at"} for m in messages if m.get("ready_at", 0) <= now]
+    return web.json_response({"conversation": {"messages": visible}})
+
+
+# AT&T: a single GET answered with JSON, the answer itself JSON encoded inside it
+
+@routes.get("/att/search/v2/answerextraction")
+async def att_answer(request):
+    settings = request.app[SETTINGS]
+    question = request.query.get("searchTerm", "")
+    answer = {"answer": answer_for(question, settings), "question": question, "articles": [], "score": 0.9}
+    return web.json_response({"response": {"docs": [{"answer": json.dumps(answer)}]}})
+
+
+# ChatWith: a POST answered with plain text, written out as it's generated
+
+@routes.post("/chatwith/chat")
+async def chatwith_chat(request):
+    settings = request.app[SETTINGS]
+    body = await request.json()
+    resp = web.StreamResponse(headers={"Content-Type": "text/plain; charset=utf-8"})
+    await resp.prepare(request)
+    for part in pieces(answer_for(body["messages"][-1]["content"], settings), settings.chunks):
+        await resp.write(part.encode())
+        await asyncio.sleep(settings.chunk_delay)
+    await resp.write_eof()
+    return resp
+
+
+# Scoutly: a POST with the whole history, answered with {"answer": ...}
+
+@routes.post("/scoutly/api/chat2")
+async def scoutly_chat(request):
+    body = await request.json()
+    return web.json_response({"answer": answer_for(body["question"], request.app[SETTINGS])})
+
+
+@routes.get("/_stats")
+async def stats(request):
+    return web.json_response({"requests": dict(request.app[STATS]), "settings": asdict(request.app[SETTINGS])})
+
+
+@routes.post("/_stats/reset")
+async def reset_stats(request):
+    request.app[STATS].clear()
+    return web.json_response({"status": "success"})
+
+
+def create_mock_app(settings: MockSettings | None = None) -> web.Application:
+    app = web.Application(middlewares=[upstream_conditions])
+    app[STATS] = Counter()
+    app[SETTINGS] = settings or MockSettings()
+    app[CONVERSATIONS] = {}
+    app.add_routes(routes)
+    return app
+
+
+def point_clients(base_url: str):
+    """
+    Aims every client class at the mocks served from base_url (e.g. "http://127.0.0.1:8900")
+    """
+    from openllms.clients.att.att_client import ATTClient
+    from openllms.clients.chatwith.chatwith_client import ChatWithClient
+    from openllms.clients.decagon.decagon_client import DecagonClient
+    from openllms.clients.mycity.mycity_client import MyCityClient
+    from openllms.clients.scoutly.scoutly_client import ScoutlyClient
+    from openllms.clients.shopify.shopify_client import ShopifyClient
+
+    DecagonClient.BASE_URL = f"{base_url}/decagon"
+    MyCityClient.BASE_URL = f"{base_url}/mycity"
+    ATTClient.BASE_URL = f"{base_url}/att/search/v2/answerextraction"
+    ChatWithClient.BASE_URL = f"{base_url}/chatwith"
+    ScoutlyClient.BASE_URL = f"{base_url}/scoutly"
+    ShopifyClient.BASE_URL = f"{base_url}/shopify/api/messages"
+    ShopifyClient.CONVERSATION_URL = f"{base_url}/shopify/api/conversations"
+    ShopifyClient.ANON_URL = f"{base_url}/shopify/api/anonymous_user"
+    ShopifyClient.ASSISTANT_URL = (
+        f"{base_url}/shopify/en/search/What?_data=routes%2F%28%24locale%29._assistant.search.%24searchId"
+    )
+
+
+def add_settings_arguments(parser: argparse.ArgumentParser):
+    defaults = MockSettings()
+    for name, value in asdict(defaults).items():
+        flag = f"--{name.replace('_', '-')}"
+        if isinstance(value, bool):
+            parser.add_argument(flag, type=lambda v: v.lower() in {"1", "true", "yes"}, default=value)
+        else:
+            parser.add_argument(flag, type=type(value), default=value)
+
+
+def settings_from_args(args) -> MockSettings:
+    return MockSettings(**{name: getattr(args, name) for name in asdict(MockSettings())})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve mock upstream providers")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    add_settings_arguments(parser)
+    args = parser.parse_args()
+    web.run_app(create_mock_app(settings_from_args(args)), host=args.host, port=args.port)
@@ -0,0 +1,233 @@
+"""
+Benchmarks every client, and ollama_server in front of them, against the local mock providers.
+
+    python -m benchmarks.run --queries 100 --concurrency 8 --latency 0.05 --jitter 0.02 --failure-rate 0.01
+
+The mocks run in their own process so their work doesn't show up in our numbers. For each target this reports
+throughput, p50/p95/p99 latency, upstream requests per query (as counted by the mocks, retries included) and the
+memory allocated per query (tracemalloc peak over a separate sequential pass, so tracing doesn't skew the timings).
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import socket
+import subprocess
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass, field, asdict
+from typing import Awaitable, Callable, List
+
+import aiohttp
+from aiohttp import web
+
+from benchmarks.mock_providers import MockSettings, add_settings_arguments, point_clients, settings_from_args
+
+CLIENTS = ["ATTClient", "SubstackClient", "MyCityClient", "ShopifyClient", "ChatWithClient", "ScoutlyClient"]
+
+
+@dataclass
+class BenchResult:
+    target: str
+    queries: int
+    errors: int
+    elapsed: float
+    latencies: List[float] = field(repr=False)
+    upstream_requests: int
+    alloc_kib: float  # mean tracemalloc peak per query
+
+    @property
+    def throughput(self) -> float:
+        return self.queries / self.elapsed if self.elapsed else 0.0
+
+    def percentile(self, p: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(int(len(ordered) * p), len(ordered) - 1)]
+
+    def summary(self) -> dict:
+        return {
+            "target": self.target,
+            "queries": self.queries,
+            "errors": self.errors,
+            "throughput": round(self.throughput, 2),
+            "p50_ms": round(self.percentile(0.50) * 1000, 1),
+            "p95_ms": round(self.percentile(0.95) * 1000, 1),
+            "p99_ms": round(self.percentile(0.99) * 1000, 1),
+            "upstream_per_query": round(self.upstream_requests / self.queries, 2) if self.queries else 0.0,
+            "alloc_kib_per_query": round(self.alloc_kib, 1),
+        }
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def start_mocks(settings: MockSettings, session: aiohttp.ClientSession):
+    port = free_port()
+    args = [sys.executable, "-m", "benchmarks.mock_providers", "--port", str(port)]
+    for name, value in asdict(settings).items():
+        args += [f"--{name.replace('_', '-')}", str(value)]
+    process = subprocess.Popen(args, stdout=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            async with session.get(f"{url}/_stats"):
+                return process, url
+        except aiohttp.ClientError:
+            await asyncio.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("Mock providers didn't start")
+
+
+async def upstream_requests(session: aiohttp.ClientSession, mock_url: str) -> int:
+    async with session.get(f"{mock_url}/_stats") as resp:
+        counts = (await resp.json())["requests"]
+    return sum(count for route, count in counts.items() if route != "failures injected")
+
+
+async def bench(
+    target: str,
+    query: Callable[[int], Awaitable],
+    queries: int,
+    concurrency: int,
+    alloc_queries: int,
+    session: aiohttp.ClientSession,
+    mock_url: str,
+) -> BenchResult:
+    await query(-1)  # Warm up imports, connections and the pollers' latency estimates
+    async with session.post(f"{mock_url}/_stats/reset") as resp:
+        resp.raise_for_status()
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(i):
+        nonlocal errors
+        async with semaphore:
+            start = time.monotonic()
+            try:
+                await query(i)
+                latencies.append(time.monotonic() - start)
+            except Exception:
+                errors += 1
+
+    start = time.monotonic()
+    await asyncio.gather(*(one(i) for i in range(queries)))
+    elapsed = time.monotonic() - start
+    upstream = await upstream_requests(session, mock_url)
+
+    peaks = []
+    tracemalloc.start()
+    try:
+        for i in range(alloc_queries):
+            tracemalloc.reset_peak()
+            baseline, _ = tracemalloc.get_traced_memory()
+            with contextlib.suppress(Exception):
+                await query(queries + i)
+            peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    finally:
+        tracemalloc.stop()
+
+    return BenchResult(
+        target=target,
+        queries=queries,
+        errors=errors,
+        elapsed=elapsed,
+        latencies=latencies,
+        upstream_requests=upstream,
+        alloc_kib=sum(peaks) / len(peaks) / 1024 if peaks else 0.0,
+    )
+
+
+def client_query(session: aiohttp.ClientSession, name: str):
+    from openllms.clients import providers
+
+    async def query(i):
+        # A fresh client per prompt, like a new conversation
+        client = providers.create(name, session)
+        return await client.query(f"Benchmark question {i}")
+    return query
+
+
+def server_query(session: aiohttp.ClientSession, server_url: str, name: str):
+    async def query(i):
+        payload = {"model": name, "prompt": f"Benchmark question {i}", "stream": False}
+        async with session.post(f"{server_url}/api/generate", json=payload) as resp:
+            resp.raise_for_status()
+            return await resp.json()
+    return query
+
+
+async def start_server():
+    import ollama_server
+    runner = web.AppRunner(ollama_server.create_web_app())
+    await runner.setup()
+    port = free_port()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner, f"http://127.0.0.1:{port}"
+
+
+async def main(args):
+    settings = settings_from_args(args)
+    results = []
+    async with aiohttp.ClientSession() as session:
+        process, mock_url = await start_mocks(settings, session)
+        try:
+            point_clients(mock_url)
+            if "clients" in args.targets:
+                from openllms.models import create_client_session
+                async with create_client_session() as client_session:
+                    for name in args.clients:
+                        result = await bench(
+                            name, client_query(client_session, name),
+                            args.queries, args.concurrency, args.alloc_queries, session, mock_url,
+                        )
+                        results.append(result)
+                        print(json.dumps(result.summary()), file=sys.stderr)
+
+            if "server" in args.targets:
+                # The server prints every prompt and response, keep that out of the report
+                with contextlib.redirect_stdout(io.StringIO()):
+                    runner, server_url = await start_server()
+                    try:
+                        for name in args.clients:
+                            result = await bench(
+                                f"ollama_server:{name}", server_query(session, server_url, name),
+                                args.queries, args.concurrency, args.alloc_queries, session, mock_url,
+                            )
+                            results.append(result)
+                            print(json.dumps(result.summary()), file=sys.stderr)
+                    finally:
+                        await runner.cleanup()
+        finally:
+            process.terminate()
+            process.wait()
+
+    summaries = [result.summary() for result in results]
+    if args.json:
+        print(json.dumps(summaries, indent=2))
+        return
+    columns = list(summaries[0]) if summaries else []
+    widths = {c: max(len(c), *(len(str(s[c])) for s in summaries)) for c in columns}
+    print("  ".join(c.ljust(widths[c]) for c in columns))
+    for summary in summaries:
+        print("  ".join(str(summary[c]).ljust(widths[c]) for c in columns))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark openllms against local mock providers")
+    parser.add_argument("--queries", type=int, default=50, help="Queries per target")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--alloc-queries", type=int, default=5, help="Sequential queries traced for allocations")
+    parser.add_argument("--clients", nargs="+", default=CLIENTS)
+    parser.add_argument("--targets", nargs="+", choices=["clients", "server"], default=["clients", "server"])
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON instead of a table")
+    add_settings_arguments(parser)
+    asyncio.run(main(parser.parse_args()))
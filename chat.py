@@ -1,61 +1,250 @@
 import asyncio
-import inspect
-from typing import List
-from openllms.clients import ScoutlyClient, ATTClient, SubstackClient, ChatWithClient, BKSafetyWearClient, \
-    MicroTikClient, PuzzlesUnlimitedClient, IntercomClient, ShopifyClient
+import sys
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, List, Optional
 import aiohttp
 
-from openllms.clients.decagon import WhopClient
-from openllms.clients import NotionClient, BiltClient, ClasspassClient, CurologyClient
-from openllms.clients.mycity import MyCityClient
-import openllms.clients as clients_module
+from openllms.clients import providers
 from openllms.models import LLM
+from openllms.models.deadline import Deadline, DeadlineExceeded
 
 
-async def chat_loop(clients: List):
-    print("LLM Chat (type 'exit' to quit)")
-    print("Address clients using @<name>, e.g. '@Scoutly Hello'")
+class Clients:
+    """
+    Clients by name (e.g. "scoutly"), each created (and so authenticated) the first time it's addressed
+    """
+
+    def __init__(self, session: aiohttp.ClientSession):
+        self.session = session
+        self.created: Dict[str, LLM] = {}
+        self.locks: Dict[str, asyncio.Lock] = {}
+
+    def names(self):
+        return providers.families()
+
+    def get(self, name: str) -> LLM | None:
+        if name not in self.created:
+            spec = providers.by_family(name)
+            if spec is None:
+                return None
+            self.created[name] = providers.create(spec.name, self.session)
+            self.locks[name] = asyncio.Lock()
+        return self.created[name]
+
+    def lock(self, name: str) -> asyncio.Lock:
+        """
+        Held while a client is answering, a conversation's turns have to go one after another
+        """
+        return self.locks[name]
+
+
+@dataclass
+class QueryTiming:
+    number: int
+    name: str
+    total: float
+    first_text: Optional[float] = None  # seconds until the first piece of the reply came in
+    phases: Dict[str, float] = field(default_factory=dict)
+    failed: bool = False
+
+    def describe(self) -> str:
+        first = f"{self.first_text:.2f}s" if self.first_text is not None else "-"
+        other = self.total - sum(self.phases.values())
+        phases = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.phases.items())
+        status = " (failed)" if self.failed else ""
+        return f"#{self.number} {self.name}{status}: {self.total:.2f}s, first text {first} | {phases or 'no phases'}, other {other:.2f}s"
+
+
+@dataclass
+class Reply:
+    label: str
+    parts: List[str] = field(default_factory=list)
+    footer: Optional[str] = None
+
+
+class Console:
+    """
+    Prints replies that come in at the same time without mixing them up. One reply at a time has the screen and is
+    printed as it streams in, the others are held back until it's done. The screen goes to whichever reply has
+    something to show first: a finished one, then one that has started coming in, then the next to arrive.
+    """
+
+    def __init__(self):
+        self.replies: Dict[int, Reply] = {}
+        self.owner: Optional[int] = None
+
+    def start(self, number: int, label: str):
+        self.replies[number] = Reply(label)
+
+    def write(self, number: int, text: str):
+        if self.owner is None:
+            self._show(number)
+        if self.owner == number:
+            sys.stdout.write(text)
+            sys.stdout.flush()
+        else:
+            self.replies[number].parts.append(text)
+
+    def end(self, number: int, footer: str):
+        self.replies[number].footer = footer
+        if self.owner is None:
+            self._show(number)
+        if self.owner == number:
+            self._finish(number)
+            self._next()
+
+    def prompt(self):
+        if not self.replies:
+            print("You: ", end="", flush=True)
 
-    while True:
-        user_input = input("You: ").strip()
-        if user_input.lower() in {"exit", "quit"}:
-            break
+    def _show(self, number: int):
+        reply = self.replies[number]
+        self.owner = number
+        print(f"{reply.label}: {''.join(reply.parts)}", end="", flush=True)
 
-        if not user_input.startswith("@"):
-            print("Error: Please address a client using @<name>")
-            continue
+    def _next(self):
+        while True:
+            finished = [number for number, reply in self.replies.items() if reply.footer is not None]
+            if not finished:
+                break
+            self._show(finished[0])
+            self._finish(finished[0])
+        self.owner = None
+        started = [number for number, reply in self.replies.items() if reply.parts]
+        if started:
+            self._show(started[0])
+        else:
+            self.prompt()
 
-        try:
-            at_name, message = user_input.split(" ", 1)
-            target_name = at_name[1:]  # remove @
-        except ValueError:
-            print("Error: Please provide a message after the client handle")
-            continue
+    def _finish(self, number: int):
+        print(self.replies.pop(number).footer, flush=True)
 
-        client = next((c for c in clients if c.name == target_name), None)
-        if not client:
-            print(f"Error: No client named '{target_name}'")
-            continue
 
-        try:
-            resp = await client.query(message)
-            print(f"{client.name}: {resp.message}")
-        except Exception as e:
-            print(f"{client.name} Error: {e}")
+async def read_lines() -> AsyncIterator[str]:
+    """
+    Lines typed on stdin, read on a thread so the event loop keeps running (and answering) while we wait for them
+    """
+    loop = asyncio.get_running_loop()
+    lines: asyncio.Queue = asyncio.Queue()
+
+    def read():
+        for line in sys.stdin:
+            loop.call_soon_threadsafe(lines.put_nowait, line)
+        loop.call_soon_threadsafe(lines.put_nowait, None)
+
+    threading.Thread(target=read, daemon=True, name="stdin").start()
+    while (line := await lines.get()) is not None:
+        yield line
+
+
+class Chat:
+    """
+    Runs the questions asked in the background. Like fan_out, at most `concurrency` are answered at a time and each
+    gets `timeout` seconds once it's started
+    """
+
+    def __init__(self, clients: Clients, keep_timings: int = 20, concurrency: int = 8, timeout: Optional[float] = 60):
+        self.clients = clients
+        self.slots = asyncio.Semaphore(concurrency)
+        self.timeout = timeout
+        self.console = Console()
+        self.timings: deque = deque(maxlen=keep_timings)
+        self.tasks = set()
+        self.asked = 0
+
+    def ask(self, name: str, message: str):
+        """
+        Starts a query in the background, its reply is printed when it arrives
+        """
+        self.asked += 1
+        task = asyncio.create_task(self._ask(self.asked, name, message))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _ask(self, number: int, name: str, message: str):
+        client = self.clients.get(name)
+        async with self.clients.lock(name), self.slots:
+            self.console.start(number, client.name)
+            start = time.monotonic()
+            mark = client.timings.snapshot()
+            timing = QueryTiming(number, client.name, 0.0)
+            deadline = Deadline(self.timeout) if self.timeout else None
+            try:
+                async for delta in Deadline.iterate(client.stream(message), deadline):
+                    if timing.first_text is None:
+                        timing.first_text = time.monotonic() - start
+                    self.console.write(number, delta)
+                footer = ""
+            except DeadlineExceeded:
+                timing.failed = True
+                footer = f" Error: no answer within {self.timeout:g}s"
+            except Exception as e:
+                timing.failed = True
+                footer = f" Error: {e!r}"
+            timing.total = time.monotonic() - start
+            timing.phases = client.timings.since(mark)
+            self.timings.append(timing)
+            self.console.end(number, f"{footer} [#{number}, {timing.total:.1f}s]")
+
+    def show_timings(self):
+        if not self.timings:
+            print("No queries yet")
+        for timing in self.timings:
+            print(timing.describe())
+
+    async def close(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+
+async def chat_loop(clients: Clients):
+    print("LLM Chat (type 'exit' to quit)")
+    print("Address clients using @<name>, e.g. '@Scoutly Hello'")
+    print("Ask several at once with '@all Hello' or '@scoutly,substack Hello'")
+    print("Questions run in the background, keep typing while they're answered. '/timings' shows where the time went")
+
+    chat = Chat(clients)
+    chat.console.prompt()
+    try:
+        async for line in read_lines():
+            user_input = line.strip()
+            if user_input.lower() in {"exit", "quit"}:
+                break
+
+            if user_input == "/timings":
+                chat.show_timings()
+            elif not user_input.startswith("@"):
+                print("Error: Please address a client using @<name>")
+            else:
+                try:
+                    at_name, message = user_input.split(" ", 1)
+                    target_name = at_name[1:]  # remove @
+                except ValueError:
+                    print("Error: Please provide a message after the client handle")
+                    chat.console.prompt()
+                    continue
+
+                names = clients.names() if target_name == "all" else [name for name in target_name.split(",") if name]
+                missing = set(names) - set(clients.names())
+                if missing:
+                    print(f"Error: No client named {', '.join(repr(m) for m in sorted(missing))}")
+                else:
+                    # Everyone is asked at once, answers are printed as they come in
+                    for name in names:
+                        chat.ask(name, message)
+                    continue
+            chat.console.prompt()
+    finally:
+        await chat.close()
 
 
 if __name__ == "__main__":
     async def main():
         async with aiohttp.ClientSession() as session:
-            # Instantiate clients
-            # Grab all classes in openllms.clients that inherit from LLM
-            all_client_classes = [
-                cls for name, cls in inspect.getmembers(clients_module, inspect.isclass)
-                if issubclass(cls, LLM)
-            ]
-
-            clients = [cls(client=session) for cls in all_client_classes]
-
-            await chat_loop(clients)
+            await chat_loop(Clients(session))
 
     asyncio.run(main())
@@ -1,21 +1,382 @@
+import argparse
+import asyncio
+import atexit
+import functools
 import hashlib
-import inspect
 import json
+import os
+import threading
 import time
+import uuid
+from dataclasses import asdict, dataclass
 from datetime import datetime, timezone
-import re
 import aiohttp
-from flask import Flask, jsonify, request
+from aiohttp import web
+from flask import Flask, Response, jsonify, request
 
 #from ollama_registry import OLLAMA_MODELS
-import openllms.clients as clients_module
-from openllms.models import LLM
+from openllms.clients import providers
+from openllms.clients import registry as provider_registry
+from openllms.models import LLM, LLMResponse, LRUCache, BatchRunner, CircuitBreakers, CircuitOpenError, HedgedLLM, Metrics, RateLimits, SessionPool, create_client_session, fan_out
+from openllms.models import ResponseCache, MemoryCacheBackend, SQLiteCacheBackend, TextResponse
+from openllms.models import RecordingTransport, ReplayTransport, recorded_queries
+from openllms.models import SessionStore, FileSessionStore, SingleFlight
+from openllms.models.deadline import Deadline, DeadlineExceeded
+from openllms.models.llm import AuthenticatedClient
+from openllms.models.json_scanner import JSONObjectScanner
+from openllms.models.model_registry import ModelRegistry
 
 app = Flask(__name__)
-DERIVED_MODELS = {}
-all_client_dict = {
-    name: cls for name, cls in inspect.getmembers(clients_module, inspect.isclass) if issubclass(cls, LLM)
-}
+# Models made with /api/create, in memory unless --models-db shares them between processes and restarts
+DERIVED_MODELS = ModelRegistry()
+
+
+class ConversationAffinity:
+    """
+    Remembers which client, and so which upstream session/conversation, answered a chat history.
+
+    Ollama clients resend the whole message list every turn. Histories are keyed by a rolling hash over their messages,
+    so when a request's messages start with a history we answered (including our reply) the same client can carry on
+    and only the newly appended messages need to be sent. Only providers that keep history upstream take part.
+
+    With a store, the sessions behind remembered histories are saved there as well. A history that isn't known in
+    memory (e.g. after a restart) is looked up in the store and its session resumed on a new client.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 1800):
+        self.cache = LRUCache(max_entries=max_entries, ttl=ttl)
+        self.ttl = ttl
+        self.store: SessionStore | None = None
+        self.transport = None # what resumed clients send their requests through
+        self.hits = 0
+        self.misses = 0
+        self.resumed = 0
+
+    @staticmethod
+    def seed(model, system_prompt, tools) -> str:
+        # A different model, system prompt or tool set is a different conversation even with the same messages
+        model_hash = hashlib.sha256(model.encode()).hexdigest()
+        return ConversationAffinity.extend(model_hash, system_prompt, json.dumps(tools or [], sort_keys=True))
+
+    @staticmethod
+    def extend(prefix_hash: str, role: str, content) -> str:
+        h = hashlib.sha256(prefix_hash.encode())
+        h.update(b"\0" + (role or "").encode() + b"\0" + (content or "").strip().encode())
+        return h.hexdigest()
+
+    def prefix_hashes(self, seed: str, messages) -> list[str]:
+        """
+        hashes[n] identifies the conversation made of the first n messages
+        """
+        hashes = [seed]
+        for m in messages:
+            hashes.append(self.extend(hashes[-1], m.get("role"), m.get("content")))
+        return hashes
+
+    def checkout(self, seed: str, messages):
+        """
+        Returns (client, new_messages) for the longest known history these messages continue, or (None, messages).
+        The entry is taken out of the cache so two requests can't talk over each other in one upstream conversation
+        """
+        hashes = self.prefix_hashes(seed, messages)
+        for n in range(len(messages) - 1, 0, -1):
+            client = self.cache.pop(hashes[n])
+            if self.store is not None:
+                saved = self.store.pop(f"chat/{hashes[n]}")
+                if client is None and saved is not None and saved["model"] in providers:
+                    client = providers.create(saved["model"], self.transport)
+                    client.restore_session(saved["state"])
+                    self.resumed += 1
+            if client is not None:
+                self.hits += 1
+                return client, messages[n:]
+        self.misses += 1
+        return None, messages
+
+    def remember(self, seed: str, messages, reply, client: LLM):
+        if not client.keeps_history:
+            return
+        key = self.extend(self.prefix_hashes(seed, messages)[-1], "assistant", reply)
+        self.cache.put(key, client)
+        if self.store is not None and isinstance(client, AuthenticatedClient):
+            saved = {"model": type(client).__name__, "state": client.session_state()}
+            self.store.put(f"chat/{key}", saved, ttl=self.ttl)
+
+
+class Runtime:
+    """
+    Everything that should live as long as the server process rather than a single request.
+
+    Both serving modes run their requests on one long-lived event loop, so a single connection-pooled
+    ClientSession can be shared by every LLM instance and keep-alive connections get reused between prompts.
+    """
+
+    def __init__(self):
+        self.session: aiohttp.ClientSession | None = None
+        self.pool: SessionPool | None = None
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.pool_size = 2
+        self.prewarm: dict[str, int | None] = {} # model name -> warm sessions to keep from startup
+        self.affinity = ConversationAffinity()
+        self.cache_ttls: dict[str, float | None] = {} # models with response caching on -> their TTL
+        self.derived_cache_ttls: set[str] = set() # the cache_ttls that came from derived models' definitions
+        self.cache_ttl = 300
+        self.cache_path: str | None = None # SQLite file to share cached responses across processes and restarts
+        self.response_cache: ResponseCache | None = None
+        self.request_timeout: float | None = 120 # seconds a generate/chat request gets before its upstream work is abandoned
+        self.coalesce = True # identical queries in flight at the same time share one upstream call
+        self.flights = SingleFlight()
+        self.batch_dir: str | None = None # where /api/batch keeps checkpoint files
+        self.record_path: str | None = None # cassette to record upstream traffic to
+        self.replay_path: str | None = None # cassette to answer upstream requests from instead of the network
+        self.replay_speed = 1.0 # replayed timings are divided by this, 0 plays back instantly
+        self.warm_cache_path: str | None = None # cassette whose recorded answers are loaded into the response cache
+        self.transport = None # what clients send requests through, the session itself unless recording/replaying
+        self.session_store_path: str | None = None # file to keep upstream sessions in across restarts
+        self.session_store: SessionStore | None = None
+
+    async def startup(self):
+        if self.session is None:
+            self.loop = asyncio.get_running_loop()
+            self.session = create_client_session()
+            if self.replay_path:
+                self.transport = ReplayTransport(self.replay_path, time_scale=1 / self.replay_speed if self.replay_speed else 0)
+            elif self.record_path:
+                self.transport = RecordingTransport(self.session, self.record_path)
+            else:
+                self.transport = self.session
+            if self.session_store_path:
+                # Nothing is resumed yet, sessions are only taken back from the store once their model is asked for
+                self.session_store = FileSessionStore(self.session_store_path)
+                self.affinity.store, self.affinity.transport = self.session_store, self.transport
+            self.pool = SessionPool(self.transport, size=self.pool_size, store=self.session_store)
+            backend = SQLiteCacheBackend(self.cache_path) if self.cache_path else MemoryCacheBackend()
+            self.response_cache = ResponseCache(backend, ttl=self.cache_ttl, ttls=self.cache_ttls)
+            if self.warm_cache_path:
+                await self.warm_cache(self.warm_cache_path)
+            for model, size in self.prewarm.items():
+                self.warm(model, size)
+
+    async def shutdown(self):
+        if self.response_cache is not None:
+            self.response_cache.backend.close()
+            self.response_cache = None
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+        if self.session_store is not None:
+            self.session_store.close()
+            self.affinity.store = self.session_store = None
+        if self.transport is not None and self.transport is not self.session:
+            await self.transport.close()
+        self.transport = None
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def set_cache_ttls(self, ttls: dict[str, float | None]):
+        """
+        Swaps in a new cache_ttls whole (it may be called from another thread), so requests never see one half changed
+        """
+        self.cache_ttls = ttls
+        if self.response_cache is not None:
+            self.response_cache.ttls = ttls
+
+    def cache_name(self, raw_model: str) -> str | None:
+        """
+        The name responses for a model are cached under, or None if caching isn't on for it.
+        Derived models use their own setting if they have one and otherwise share their base model's
+        """
+        name = raw_model.split(":")[0]
+        if name in self.cache_ttls:
+            return name
+        base, _ = resolve_model(name)
+        return base if base in self.cache_ttls else None
+
+    def note_query(self, name: str, prompt: str, resp: LLMResponse):
+        if isinstance(self.transport, RecordingTransport):
+            self.transport.note_query(name, prompt, resp.message)
+
+    async def warm_cache(self, path: str):
+        """
+        Loads the answers recorded in a cassette into the response cache, for the models caching is on for
+        """
+        loaded = 0
+        for entry in recorded_queries(path):
+            name = self.cache_name(entry["model"])
+            if name:
+                await self.response_cache.put(name, entry["prompt"], TextResponse.from_raw({"message": entry["message"]}))
+                loaded += 1
+        print(f"Loaded {loaded} cached responses from {path}")
+
+    async def make_client(self, model: str, hedge: dict | None = None) -> LLM:
+        # Authenticated clients come out of the pool with their session already set up when one is warm
+        client = await self.pool.checkout(providers.load(model))
+        if not hedge:
+            return client
+        # Backups are only checked out (and their pool refilled) if a hedge actually goes to them
+        backups = [functools.partial(self.pool.checkout, providers.load(name)) for name in hedge["models"]]
+        return HedgedLLM([client] + backups, release=self.pool.checkin, percentile=hedge.get("percentile", 0.9), delay=hedge.get("delay", 2.0))
+
+    def warm(self, raw_model: str, size: int | None = None):
+        """
+        Starts keeping warm sessions for a model (derived models warm their base). Safe to call from any thread
+        """
+        model, _ = resolve_model(raw_model)
+        if model not in providers or self.pool is None:
+            return
+        self.loop.call_soon_threadsafe(self.pool.warm, providers.load(model), size)
+
+
+class ModelCall:
+    """
+    One prompt sent to a model on behalf of a request.
+
+    Answered from the response cache when caching is enabled for the model. Otherwise identical calls that are in
+    flight at the same time (same model, system prompt and prompt) share one upstream call. `client` continues an
+    existing upstream conversation, those turns depend on history so they're never cached or shared. Afterwards
+    self.client is the client that answered, or None if the answer came from the cache or another call.
+
+    `timeout` (by default the server's --request-timeout) is a deadline for the whole call. The provider's requests,
+    retries and polls all stop once it passes, as they do when the request is cancelled (e.g. the client went away).
+    """
+
+    def __init__(self, raw_model: str, model: str, prompt: str, client: LLM | None = None, timeout: float | None = None):
+        self.name = raw_model.split(":")[0]
+        self.model = model
+        self.prompt = prompt
+        self.client = client
+        self.cache_name = None if client is not None else runtime.cache_name(raw_model)
+        self.hedge = DERIVED_MODELS.get(raw_model.split(":")[0], {}).get("hedge")
+        self.key = None
+        if client is None and runtime.coalesce:
+            self.key = (model, resolve_model(raw_model)[1], json.dumps(self.hedge, sort_keys=True), prompt)
+        self.queue_wait = 0.0 # seconds spent waiting on rate/concurrency limits, reported apart from upstream time
+        # The whole call, polling included, is abandoned once this passes
+        timeout = timeout or runtime.request_timeout
+        self.deadline = Deadline(timeout) if timeout else None
+        self.phases = {} # seconds the client spent in each phase (see PhaseTimer) answering this call
+
+    async def query(self) -> LLMResponse:
+        with metrics.track(self.name):
+            if self.cache_name:
+                resp = await runtime.response_cache.get(self.cache_name, self.prompt)
+                if resp is not None:
+                    return resp
+            if self.key is None:
+                return await Deadline.run(self.ask(), self.deadline)
+            return await Deadline.run(runtime.flights.run(self.key, self.ask), self.deadline)
+
+    async def stream(self):
+        with metrics.track(self.name):
+            if self.cache_name:
+                resp = await runtime.response_cache.get(self.cache_name, self.prompt)
+                if resp is not None:
+                    yield resp.message
+                    return
+            deltas = self.ask_stream() if self.key is None else runtime.flights.stream(self.key, self.ask_stream)
+            async for delta in Deadline.iterate(deltas, self.deadline):
+                yield delta
+
+    async def ask(self) -> LLMResponse:
+        self.client = self.client or await runtime.make_client(self.model, self.hedge)
+        queue_wait, mark = self.client.queue_wait, self.client.timings.snapshot()
+        try:
+            resp = await self.client.query(self.prompt)
+        finally:
+            self.finish(queue_wait, mark)
+        runtime.note_query(self.name, self.prompt, resp)
+        if self.cache_name:
+            await runtime.response_cache.put(self.cache_name, self.prompt, resp)
+        return resp
+
+    async def ask_stream(self):
+        self.client = self.client or await runtime.make_client(self.model, self.hedge)
+        queue_wait, mark = self.client.queue_wait, self.client.timings.snapshot()
+        deltas = []
+        try:
+            async for delta in self.client.stream(self.prompt):
+                deltas.append(delta)
+                yield delta
+        finally:
+            self.finish(queue_wait, mark)
+        resp = TextResponse.from_raw({"message": "".join(deltas)})
+        runtime.note_query(self.name, self.prompt, resp)
+        if self.cache_name:
+            await runtime.response_cache.put(self.cache_name, self.prompt, resp)
+
+    def finish(self, queue_wait, mark):
+        self.queue_wait = self.client.queue_wait - queue_wait
+        self.phases = self.client.timings.since(mark)
+        metrics.observe_phases(self.name, self.phases)
+
+    def durations(self, total: float) -> dict:
+        """
+        Maps the phase timings onto Ollama's duration fields (in ns). Session setup and waiting on limits or retries
+        is load time, sending up to the first byte back is prompt evaluation, and receiving, polling and parsing is
+        generation. All zero for an answer from the cache
+        """
+        phases = self.phases
+        ns = lambda *names: int(sum(phases.get(name, 0.0) for name in names) * 1e9)
+        return {
+            "total_duration": int(total * 1e9),
+            "load_duration": ns("auth", "queue", "retry"),
+            "prompt_eval_duration": ns("send"),
+            "eval_duration": ns("receive", "poll", "parse"),
+            "queue_duration": int(self.queue_wait * 1e9),
+        }
+
+
+runtime = Runtime()
+metrics = Metrics()
+
+# Flask runs each request on a worker thread, so in flask mode the runtime lives on a background loop thread
+_background_loop: asyncio.AbstractEventLoop | None = None
+_background_lock = threading.Lock()
+
+
+def get_background_loop() -> asyncio.AbstractEventLoop:
+    global _background_loop
+    with _background_lock:
+        if _background_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="openllms-loop", daemon=True).start()
+            asyncio.run_coroutine_threadsafe(runtime.startup(), loop).result()
+            atexit.register(stop_background_loop)
+            _background_loop = loop
+    return _background_loop
+
+
+def stop_background_loop():
+    global _background_loop
+    with _background_lock:
+        if _background_loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(runtime.shutdown(), _background_loop).result(timeout=10)
+        _background_loop.call_soon_threadsafe(_background_loop.stop)
+        _background_loop = None
+
+
+def run_sync(coro):
+    """
+    Runs a coroutine on the shared background loop and blocks the calling (Flask) thread until it finishes
+    """
+    return asyncio.run_coroutine_threadsafe(coro, get_background_loop()).result()
+
+
+def iterate_sync(agen):
+    """
+    Drives an async generator on the shared background loop from a (Flask) thread, one item at a time
+    """
+    try:
+        while True:
+            try:
+                yield run_sync(agen.__anext__())
+            except StopAsyncIteration:
+                return
+    finally:
+        run_sync(agen.aclose())
+
 
 def get_fake_digest(name):
     h = hashlib.sha256(name.encode()).hexdigest()
@@ -25,13 +386,126 @@ def now_iso():
     return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
 
 
+@dataclass(frozen=True)
+class CatalogTags:
+    """
+    One version of the /api/tags answer. Swapped in whole, so a request never pairs a body with another one's ETag
+    """
+    tags: dict
+    body: bytes
+    digests: dict  # model name -> digest
+    etag: str
+
+
+class ModelCatalog:
+    """
+    The /api/tags and /api/show answers, worked out once instead of on every poll and only rebuilt when a model is
+    created or deleted.
+
+    Base model digests come from their provider spec and modified_at from when the provider registry last changed,
+    so both stay the same between polls and restarts. Derived models are stamped when they're created. The ETags let
+    clients skip re-downloading an unchanged answer
+    """
+
+    def __init__(self):
+        mtime = os.path.getmtime(provider_registry.__file__)
+        self.base_modified_at = datetime.fromtimestamp(mtime, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+        self.derived = {}  # name -> (digest, modified_at)
+        self.rebuild()
+
+    def entry(self, name, base, digest, modified_at):
+        family = providers[base].family
+        return {
+            "name": f"{name}:latest",
+            "model": f"{name}:latest",
+            "modified_at": modified_at,
+            "size": 6591830464, #TODO: Does this matter?
+            "digest": digest,
+            "details": {
+                "format": "gguf",
+                "family": family,
+                "families": [family],
+                "parameter_size": "4.3B",
+                "quantization_level": "Q4_K_M",
+            },
+        }
+
+    def rebuild(self):
+        models = [self.entry(name, name, spec.digest, self.base_modified_at) for name, spec in providers.items()]
+        for name, (digest, modified_at) in self.derived.items():
+            models.append(self.entry(name, resolve_model(name)[0], digest, modified_at))
+        tags = {"models": models}
+        body = json.dumps(tags).encode()
+        self.tags = CatalogTags(
+            tags=tags,
+            body=body,
+            digests={entry["name"].split(":")[0]: entry["digest"] for entry in models},
+            etag=f'"{hashlib.sha256(body).hexdigest()[:32]}"',
+        )
+        # TODO: Stole a lot of these values from the output of a real model. Should probably look into what they do
+        self.show = {
+            name: {
+                "modelfile": f"FROM {name}\nPARAMETER temperature 0.7",
+                "parameters": "temperature 0.7\nnum_ctx 4096",
+                "template": "{{ .System }}\nUSER: {{ .Prompt }}\nASSISTANT: ",
+                "details": {
+                    "format": "gguf",
+                    "family": spec.family,
+                    "families": spec.family,
+                    "parameter_size": "4.3B",
+                    "quantization_level": "Q4_K_M",
+                },
+            }
+            for name, spec in providers.items()
+        }
+
+    def show_etag(self, raw_model):
+        digest = self.tags.digests.get(raw_model.split(":")[0])
+        return digest and f'"{digest.split(":")[-1][:32]}"'
+
+    def sync(self, models):
+        """
+        Takes on the derived models' current definitions. Digests and modified_at come from the stored definitions
+        so every worker sharing a --models-db gives the same answers (and ETags)
+        """
+        derived = {}
+        for name, definition in models.items():
+            definition = {k: v for k, v in definition.items() if k != "modified"}
+            modified = datetime.fromtimestamp(models[name].get("modified", 0), timezone.utc)
+            derived[name] = (
+                get_fake_digest(json.dumps([name, definition], sort_keys=True)),
+                modified.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z",
+            )
+        if derived != self.derived:
+            self.derived = derived
+            self.rebuild()
+
+
 def resolve_model(model_name):
     clean_name = model_name.split(":")[0]
-    if clean_name in DERIVED_MODELS:
-        return DERIVED_MODELS[clean_name]["base"], DERIVED_MODELS[clean_name]["system"]
+    derived = DERIVED_MODELS.get(clean_name)
+    if derived is not None:
+        return derived["base"], derived["system"]
     return clean_name, ""
 
 
+catalog = ModelCatalog()
+
+
+def sync_derived_models(models):
+    """
+    Brings everything worked out from the derived models up to date, whichever process created or deleted one
+    """
+    ttls = {name: definition["cache_ttl"] for name, definition in models.items() if definition.get("cache_ttl") is not None}
+    kept = {name: ttl for name, ttl in runtime.cache_ttls.items() if name not in runtime.derived_cache_ttls}
+    runtime.derived_cache_ttls = set(ttls)
+    runtime.set_cache_ttls({**kept, **ttls})
+    catalog.sync(models)
+
+
+DERIVED_MODELS.subscribe(sync_derived_models)
+
+
 def base_response(model):
     return {
         "model": model,
@@ -47,89 +521,175 @@ def base_response(model):
     }
 
 
-@app.route("/", methods=["GET", "HEAD"])
-def index():
-    return "Ollama is running"
-
-@app.route("/api/version", methods=["GET"])
-def version():
-    # Nothing would work unless this endpoint was working
-    # Entirely possible this, the show, and the chat endpoints are the only *necessary* ones
-    return jsonify({"version": "0.5.7"})
-
-
-@app.route("/api/tags", methods=["GET"])
-def tags():
-
-    #clients = [cls(client=session) for cls in all_client_classes]
+# Request handlers shared by both serving modes. Each returns (body, status)
 
+def handle_ps():
+    """
+    Lists the models that have sent requests, with the state (closed, open or half_open) of their provider's circuit
+    breaker for each host it has sent requests to
+    """
+    breakers = CircuitBreakers.snapshot()
     models = []
-    # Include both base and derived models
-    all_names = list(all_client_dict.keys()) + list(DERIVED_MODELS.keys())
-
-    for name in all_names:
-        family = all_client_dict.get(name, {}).name
+    for name, spec in providers.items():
+        family = spec.family
+        if family not in breakers:
+            continue
         models.append(
             {
                 "name": f"{name}:latest",
                 "model": f"{name}:latest",
-                "modified_at": now_iso(),
-                "size": 6591830464, #TODO: Does this matter?
-                "digest": get_fake_digest(name),
-                "details": {
-                    "format": "gguf",
-                    "family": family,
-                    "families": [family],
-                    "parameter_size": "4.3B",
-                    "quantization_level": "Q4_K_M",
-                },
+                "size": 0,
+                "digest": spec.digest,
+                "details": {"format": "gguf", "family": family, "families": [family]},
+                "expires_at": now_iso(),
+                "size_vram": 0,
+                "circuit": breakers[family],
+                "rate_limit": RateLimits.snapshot().get(family),
             }
         )
-    return jsonify({"models": models})
+    return {"models": models}, 200
 
-@app.route("/api/generate", methods=["POST"])
-async def generate():
-    data = request.json
-    raw_model = data["model"]
-    model, system_prompt = resolve_model(raw_model)
+
+def handle_metrics():
+    """
+    Prometheus text format: per-model latency and phase histograms, error counts and in-flight requests, plus the
+    state of each provider's circuit breaker
+    """
+    lines = [
+        "# HELP openllms_circuit_open Whether the provider's circuit breaker for a host is failing requests fast (1) or not (0)",
+        "# TYPE openllms_circuit_open gauge",
+    ]
+    for provider, hosts in sorted(CircuitBreakers.snapshot().items()):
+        for host, breaker in sorted(hosts.items()):
+            lines.append(f'openllms_circuit_open{{provider="{provider}",host="{host}"}} {int(breaker["state"] == "open")}')
+    flights = runtime.flights.stats
+    lines += [
+        "# HELP openllms_upstream_calls_total Upstream calls made for queries that weren't answered from the cache",
+        "# TYPE openllms_upstream_calls_total counter",
+        f"openllms_upstream_calls_total {flights.calls}",
+        "# HELP openllms_coalesced_requests_total Requests that shared an identical request's upstream call",
+        "# TYPE openllms_coalesced_requests_total counter",
+        f"openllms_coalesced_requests_total {flights.coalesced}",
+        "# HELP openllms_abandoned_calls_total Shared upstream calls cancelled because every request waiting on them left",
+        "# TYPE openllms_abandoned_calls_total counter",
+        f"openllms_abandoned_calls_total {flights.abandoned}",
+        "# HELP openllms_deadline_exceeded_total Waits on a provider cut short because the request's deadline passed",
+        "# TYPE openllms_deadline_exceeded_total counter",
+        f"openllms_deadline_exceeded_total {Deadline.stats.exceeded}",
+        "# HELP openllms_upstream_cancelled_total Upstream requests abandoned mid-flight (cancelled or out of time), per provider",
+        "# TYPE openllms_upstream_cancelled_total counter",
+    ]
+    for provider, count in sorted(Deadline.stats.cancelled.items()):
+        lines.append(f'openllms_upstream_cancelled_total{{provider="{provider}"}} {count}')
+    return metrics.render() + "\n".join(lines) + "\n"
+
+
+def wants_stream(data):
+    # Ollama streams unless the client explicitly asks it not to
+    return data.get("stream", True)
+
+
+def ndjson_line(obj) -> bytes:
+    return (json.dumps(obj) + "\n").encode()
+
+
+def stream_response(model):
+    return {
+        "model": model,
+        "created_at": now_iso(),
+        "done": False,
+    }
+
+
+def final_stream_response(model, start, count, call):
+    """
+    The closing chunk of a stream, with the call's phase timings and the number of deltas sent as the eval count
+    """
+    out = base_response(model)
+    out.update(call.durations(time.time() - start))
+    out["eval_count"] = count
+    return out
+
+
+def stream_error(error: Exception) -> dict:
+    """
+    The last line of a stream whose model call failed part way, as Ollama reports errors once a stream has started
+    """
+    if isinstance(error, DeadlineExceeded):
+        return {"error": "timed out waiting for the model"}
+    if isinstance(error, CircuitOpenError):
+        return {"error": str(error)}
+    return {"error": type(error).__name__ + (f": {error}" if str(error) else "")}
+
+
+def model_not_found(data):
+    model, _ = resolve_model(data["model"])
+    if model not in providers:
+        return {"error": "model not found"}, 404
+    return None
+
+
+def build_generate_prompt(data, system_prompt):
     prompt = data.get("prompt", "")
     print(prompt)
+    return f"{system_prompt}\n{prompt}" if system_prompt else prompt
 
-    entry = all_client_dict.get(model)
-    if not entry:
-        return jsonify({"error": "model not found"}), 404
 
-    async with aiohttp.ClientSession() as session:
-        client = entry(client=session)
+async def handle_generate(data):
+    raw_model = data["model"]
+    model, system_prompt = resolve_model(raw_model)
 
-        start = time.time()
+    if model not in providers:
+        return {"error": "model not found"}, 404
 
-        full_prompt = f"{system_prompt}\n{prompt}" if system_prompt else prompt
-        resp = await client.query(full_prompt)
-        duration = int((time.time() - start) * 1e9)
+    start = time.time()
 
+    full_prompt = build_generate_prompt(data, system_prompt)
+    call = ModelCall(raw_model, model, full_prompt, timeout=data.get("timeout"))
+    try:
+        resp = await call.query()
+    except CircuitOpenError as e:
+        return {"error": str(e)}, 503
+    except DeadlineExceeded:
+        return {"error": "timed out waiting for the model"}, 504
     out = base_response(raw_model)
-    out.update({
-        "response": resp.message,
-        "total_duration": duration,
-    })
+    out.update(call.durations(time.time() - start))
+    out["response"] = resp.message
     print(out)
-    return jsonify(out)
+    return out, 200
 
 
-@app.route("/api/chat", methods=["POST"])
-async def chat():
-    data = request.json
-
+async def stream_generate(data):
     raw_model = data["model"]
     model, system_prompt = resolve_model(raw_model)
+    call = ModelCall(raw_model, model, build_generate_prompt(data, system_prompt), timeout=data.get("timeout"))
 
-    messages = data.get("messages", [])
-    tools = data.get("tools", []) # TODO: Look into how tools are formatted, this was just quickly put in place to get Homeassistant working
+    start = time.time()
+    count = 0
+    try:
+        async for delta in call.stream():
+            if not delta:
+                continue
+            count += 1
+            chunk = stream_response(raw_model)
+            chunk["response"] = delta
+            yield chunk
+    except Exception as e:
+        yield stream_error(e)
+        return
+
+    out = final_stream_response(raw_model, start, count, call)
+    out["response"] = ""
+    yield out
 
-    entry = all_client_dict.get(model)
-    if not entry:
-        return jsonify({"error": "model not found"}), 404
+
+def build_chat_prompt(data, system_prompt, new_messages=None):
+    """
+    Flattens the chat into one prompt. new_messages are the only turns to send when continuing a conversation the
+    provider already has, in which case the system prompt and tools already went out with its first turn
+    """
+    messages = data.get("messages", []) if new_messages is None else new_messages
+    tools = data.get("tools", []) # TODO: Look into how tools are formatted, this was just quickly put in place to get Homeassistant working
 
     convo = []
     for m in messages:
@@ -139,156 +699,717 @@ async def chat():
             convo.append(f"{role.upper()}: {content}")
 
     prompt = "\n".join(convo)
+    if new_messages is not None:
+        print("CONTINUING CONVERSATION:\n", prompt)
+        return prompt
 
-    tool_block = ""
-    if tools:
-        # TODO: Probably not useful to hardcode the TOols prompt in here
-        tool_block = "\n\nAVAILABLE TOOLS:\n"
-        for t in tools:
-            fn = t.get("function", {})
-            tool_block += (
-                f"- name: {fn.get('name')}\n"
-                f"  description: {fn.get('description','')}\n"
-                f"  parameters: {json.dumps(fn.get('parameters', {}))}\n"
-            )
+    tool_block = compile_tool_block(tools) if tools else ""
+    full_prompt = f"{system_prompt}\n{tool_block}\n{prompt}" if system_prompt else f"{tool_block}\n{prompt}"
 
+    print("FULL PROMPT:\n", full_prompt)
+    return full_prompt
+
+
+# Tool blocks by tool set, a client (e.g. Home Assistant) sends the same tools with every request
+tool_blocks = LRUCache(max_entries=64)
+
+
+def compile_tool_block(tools) -> str:
+    """
+    The part of the prompt describing the tools and how to call them, built once per distinct tool set
+    """
+    key = json.dumps(tools, sort_keys=True)
+    tool_block = tool_blocks.get(key)
+    if tool_block is not None:
+        return tool_block
+
+    # TODO: Probably not useful to hardcode the TOols prompt in here
+    tool_block = "\n\nAVAILABLE TOOLS:\n"
+    for t in tools:
+        fn = t.get("function", {})
         tool_block += (
-            "\nWhen an action is required, respond ONLY with valid JSON in this format:\n"
-            "{\n"
-            '  "tool": "<tool name>",\n'
-            '  "arguments": { <arguments> }\n'
-            "}\n"
-            "Do NOT include any extra text.\n"
+            f"- name: {fn.get('name')}\n"
+            f"  description: {fn.get('description','')}\n"
+            f"  parameters: {json.dumps(fn.get('parameters', {}))}\n"
         )
 
-    full_prompt = f"{system_prompt}\n{tool_block}\n{prompt}" if system_prompt else f"{tool_block}\n{prompt}"
+    tool_block += (
+        "\nWhen an action is required, respond ONLY with valid JSON in this format:\n"
+        "{\n"
+        '  "tool": "<tool name>",\n'
+        '  "arguments": { <arguments> }\n'
+        "}\n"
+        "To call several tools, write one such object per call.\n"
+        "Do NOT include any extra text.\n"
+    )
+    tool_blocks.put(key, tool_block)
+    return tool_block
+
+
+class ToolCallScanner:
+    """
+    Picks tool calls ({"tool": ..., "arguments": ...} objects) out of a reply as it streams in, each with its own id
+    """
+
+    def __init__(self):
+        self.scanner = JSONObjectScanner()
+        self.calls = []
+
+    def feed(self, text: str) -> list:
+        """
+        Returns the tool calls completed by this piece of the reply
+        """
+        # TODO: I'm parsing the tool out manually here, not sure if this is the best way to go about it
+        # Ideally the model would just return a response already in the right format?
+        calls = []
+        for source in self.scanner.feed(text):
+            try:
+                tool_json = json.loads(source)
+            except json.JSONDecodeError as e:
+                print("Tool parse error:", e)
+                continue
+            tool_name = tool_json.get("tool")
+            if not tool_name:
+                continue
+            arguments = tool_json.get("arguments", {})
+            print("RETURNING TOOL CALL:", tool_name, arguments)
+            calls.append({
+                "id": f"call_{uuid.uuid4().hex[:16]}",
+                "type": "function",
+                "function": {
+                    "name": tool_name,
+                    "arguments": arguments,
+                },
+            })
+        self.calls += calls
+        return calls
+
+    def message(self):
+        """
+        The assistant message carrying the tool calls found so far, or None if there are none
+        """
+        if not self.calls:
+            return None
+        return {"role": "assistant", "content": None, "tool_calls": self.calls}
+
+
+async def read_tool_reply(call, data):
+    """
+    Reads a reply that may hold tool calls. Unless the request says "stop_at_tool_call": false, the reply is cut off
+    as soon as a complete tool call has come in (along with any others completed by the same piece of it), rather
+    than waiting for the model to finish. Returns (the deltas read, the ToolCallScanner)
+    """
+    scanner = ToolCallScanner()
+    deltas = []
+    stream = call.stream()
+    try:
+        async for delta in stream:
+            if not delta:
+                continue
+            deltas.append(delta)
+            if scanner.feed(delta) and data.get("stop_at_tool_call", True):
+                break
+    finally:
+        await stream.aclose()
+    return deltas, scanner
 
-    print("FULL PROMPT:\n", full_prompt)
 
-    async with aiohttp.ClientSession() as session:
-        client = entry(client=session)
-        start = time.time()
-        resp = await client.query(full_prompt)
-        duration = int((time.time() - start) * 1e9)
+def chat_call(data, model, system_prompt) -> ModelCall:
+    """
+    Sets up the call for a chat request. A follow-up turn of a conversation we've already answered goes back to the
+    same client (so the same upstream session) with just the new messages
+    """
+    messages = data.get("messages", [])
+    seed = ConversationAffinity.seed(data["model"], system_prompt, data.get("tools"))
+    client, new_messages = runtime.affinity.checkout(seed, messages)
+    if client is not None:
+        prompt = build_chat_prompt(data, system_prompt, new_messages)
+        return ModelCall(data["model"], model, prompt, client, timeout=data.get("timeout"))
+    return ModelCall(data["model"], model, build_chat_prompt(data, system_prompt), timeout=data.get("timeout"))
+
+
+def remember_chat(data, system_prompt, call, reply):
+    if call.client is None:
+        return  # Answered from the cache, there's no upstream conversation to continue
+    seed = ConversationAffinity.seed(data["model"], system_prompt, data.get("tools"))
+    runtime.affinity.remember(seed, data.get("messages", []), reply, call.client)
+
+
+async def handle_chat(data):
+    raw_model = data["model"]
+    model, system_prompt = resolve_model(raw_model)
+
+    if model not in providers:
+        return {"error": "model not found"}, 404
+
+    call = chat_call(data, model, system_prompt)
+    start = time.time()
+    tool_message = None
+    try:
+        if data.get("tools"):
+            deltas, scanner = await read_tool_reply(call, data)
+            raw_response = "".join(deltas).strip()
+            tool_message = scanner.message()
+        else:
+            raw_response = (await call.query()).message.strip()
+    except CircuitOpenError as e:
+        return {"error": str(e)}, 503
+    except DeadlineExceeded:
+        return {"error": "timed out waiting for the model"}, 504
+    durations = call.durations(time.time() - start)
 
-    raw_response = resp.message.strip()
     print("MODEL RESPONSE:", raw_response)
 
     out = base_response(raw_model)
+    message = tool_message or {
+        "role": "assistant",
+        "content": raw_response,
+    }
+    out.update(durations)
+    out["message"] = message
+    remember_chat(data, system_prompt, call, message["content"])
+    return out, 200
 
-    # TODO: I'm parsing the tool out manually here, not sure if this is the best way to go about it
-    # Ideally the model would just return a response already in the right format?
-    tool_match = re.search(r"\{.*\}", raw_response, re.DOTALL)
-    if tool_match:
-        try:
-            tool_json = json.loads(tool_match.group())
-            tool_name = tool_json.get("tool")
-            arguments = tool_json.get("arguments", {})
 
-            if tool_name:
-                out.update(
-                    {
-                        "message": {
-                            "role": "assistant",
-                            "content": None,
-                            "tool_calls": [
-                                {
-                                    "id": "call_1",
-                                    "type": "function",
-                                    "function": {
-                                        "name": tool_name,
-                                        "arguments": arguments,
-                                    },
-                                }
-                            ],
-                        },
-                        "total_duration": duration,
-                    }
-                )
-                print("RETURNING TOOL CALL:", tool_name, arguments)
-                return jsonify(out)
-        except Exception as e:
-            print("Tool parse error:", e)
-
-    out.update(
-        {
-            "message": {
-                "role": "assistant",
-                "content": raw_response,
-            },
-            "total_duration": duration,
-        }
+async def stream_chat(data):
+    raw_model = data["model"]
+    model, system_prompt = resolve_model(raw_model)
+    call = chat_call(data, model, system_prompt)
+
+    start = time.time()
+    count = 0
+    try:
+        if data.get("tools"):
+            # A reply might turn out to be a tool call, so it's sent in one piece once that's decided
+            deltas, scanner = await read_tool_reply(call, data)
+            raw_response = "".join(deltas).strip()
+            message = scanner.message() or {"role": "assistant", "content": raw_response}
+            if raw_response:
+                print("MODEL RESPONSE:", raw_response)
+                count = len(deltas)
+                chunk = stream_response(raw_model)
+                chunk["message"] = message
+                yield chunk
+        else:
+            deltas = []
+            async for delta in call.stream():
+                if not delta:
+                    continue
+                count += 1
+                deltas.append(delta)
+                chunk = stream_response(raw_model)
+                chunk["message"] = {"role": "assistant", "content": delta}
+                yield chunk
+            message = {"role": "assistant", "content": "".join(deltas).strip()}
+    except Exception as e:
+        yield stream_error(e)
+        return
+    remember_chat(data, system_prompt, call, message["content"])
+
+    out = final_stream_response(raw_model, start, count, call)
+    out["message"] = {"role": "assistant", "content": ""}
+    yield out
+
+
+async def prompted_client(name) -> LLM:
+    """
+    A client for a base or derived model, with the derived model's system prompt put in front of every prompt
+    """
+    model, system_prompt = resolve_model(name)
+    if model not in providers:
+        raise KeyError(f"model not found: {name}")
+    client = await runtime.make_client(model, DERIVED_MODELS.get(name.split(":")[0], {}).get("hedge"))
+    if system_prompt:
+        client.prepend_prompt = f"{system_prompt}\n"
+    return client
+
+
+def fanout_error(data):
+    unknown = [m for m in data.get("models") or [] if resolve_model(m)[0] not in providers]
+    if unknown:
+        return {"error": f"model not found: {', '.join(unknown)}"}, 404
+    return None
+
+
+async def stream_fanout(data):
+    """
+    Sends one prompt to several models at once ("models", default every base model) and streams each one's result as
+    soon as it's in, followed by a final done chunk
+    """
+    names = data.get("models") or list(providers)
+    prompt = data.get("prompt", "")
+    clients = {}
+    for name in names:
+        clients[await prompted_client(name)] = name
+
+    start = time.time()
+    async for result in fan_out(
+        clients,
+        prompt,
+        concurrency=data.get("concurrency", 8),
+        timeout=data.get("timeout", 60),
+    ):
+        metrics.observe(clients[result.llm], result.elapsed)
+        if not result.ok:
+            metrics.error(clients[result.llm], result.error)
+        chunk = stream_response(clients[result.llm])
+        chunk.update({
+            "response": getattr(result.response, "message", None),
+            "error": None if result.ok else type(result.error).__name__ + (f": {result.error}" if str(result.error) else ""),
+            "total_duration": int(result.elapsed * 1e9),
+        })
+        yield chunk
+
+    out = {
+        "models": names,
+        "created_at": now_iso(),
+        "done": True,
+        "total_duration": int((time.time() - start) * 1e9),
+    }
+    yield out
+
+
+def batch_checkpoint(name):
+    """
+    Checkpoint files live in --batch-dir, requests only get to pick the file name
+    """
+    if not name or runtime.batch_dir is None:
+        return None
+    return os.path.join(runtime.batch_dir, os.path.basename(name))
+
+
+def batch_error(options):
+    try:
+        concurrency = int(options.get("concurrency", 4))
+        timeout = float(options.get("timeout", 60))
+    except ValueError:
+        return {"error": "concurrency must be a whole number and timeout a number of seconds"}, 400
+    if concurrency < 1 or not 0 < timeout < float("inf"):
+        return {"error": "concurrency and timeout must be positive"}, 400
+    return None
+
+
+async def stream_batch(records, options):
+    """
+    Runs a batch of {"model", "prompt"} records, a few at a time per model, and streams each result (with the record's
+    index) as soon as it's in, followed by a final done chunk with the totals. options are checked by batch_error first
+    """
+    concurrency = int(options.get("concurrency", 4))
+    warmed = set()
+
+    async def client(name):
+        # Every prompt gets its own conversation, but from the model's first prompt on the pool keeps enough sessions
+        # warm for the batch so the rest don't each handshake inline
+        if name not in warmed:
+            warmed.add(name)
+            runtime.warm(name, concurrency)
+        return await prompted_client(name)
+
+    runner = BatchRunner(
+        client,
+        concurrency=concurrency,
+        timeout=float(options.get("timeout", 60)),
+        checkpoint=batch_checkpoint(options.get("checkpoint")),
     )
-    return jsonify(out)
+    async for result in runner.run(records):
+        metrics.observe(result.model.split(":")[0], result.elapsed)
+        if not result.ok:
+            metrics.error(result.model.split(":")[0], result.error)
+        yield result.to_json()
+    yield {"done": True, "created_at": now_iso(), **asdict(runner.stats)}
 
 
-@app.route("/api/show", methods=["POST"])
-def show():
-    data = request.json
+def parse_batch_line(line):
+    line = line.strip()
+    return json.loads(line) if line else None
+
+
+def handle_show(data):
     raw_model = data.get("model", "")
     model, _ = resolve_model(raw_model)
 
-    entry = all_client_dict.get(model)
-    if not entry:
-        return jsonify({"error": "model not found"}), 404
-    # TODO: Stole a lot of these values from the output of a real model. Should probably look into what they do
-    return jsonify(
-        {
-            "modelfile": f"FROM {model}\nPARAMETER temperature 0.7",
-            "parameters": "temperature 0.7\nnum_ctx 4096",
-            "template": "{{ .System }}\nUSER: {{ .Prompt }}\nASSISTANT: ",
-            "details": {
-                "format": "gguf",
-                "family": entry.name,
-                "families": entry.name,
-                "parameter_size": "4.3B",
-                "quantization_level": "Q4_K_M",
-            },
+    if model not in catalog.show:
+        return {"error": "model not found"}, 404
+    # Clients look a model up before talking to it, so get a session ready for the chat that's probably coming
+    runtime.warm(model)
+    return catalog.show[model], 200
+
+
+def handle_create(data):
+    # TODO: I think ideally I would set this up so you can "create" individual instances of each model, e.g. a Coding Shopify model vs a Chat SHopify model
+    base = data.get("from", "").split(":")[0]
+    model = data.get("model", "").split(":")[0]
+    system = data.get("system", "")
+
+    if base not in providers:
+        return {"error": "base model not found"}, 404
+
+    parameters = data.get("parameters") or {}
+    definition = {"base": base, "system": system}
+
+    # A hedged model sends to the base first and to these backups in order when it's slow,
+    # e.g. "parameters": {"hedge": ["NotionClient", "WhopClient"], "hedge_percentile": 0.9}
+    if parameters.get("hedge"):
+        unknown = [name for name in parameters["hedge"] if name.split(":")[0] not in providers]
+        if unknown:
+            return {"error": f"hedge model not found: {', '.join(unknown)}"}, 404
+        definition["hedge"] = {
+            "models": [name.split(":")[0] for name in parameters["hedge"]],
+            "percentile": float(parameters.get("hedge_percentile", 0.9)),
+            "delay": float(parameters.get("hedge_delay", 2.0)),
         }
-    )
+
+    # Response caching for the derived model, e.g. "parameters": {"cache_ttl": 600}
+    cache_ttl = parameters.get("cache_ttl")
+    if cache_ttl is not None:
+        definition["cache_ttl"] = float(cache_ttl)
+
+    # Written in one go, the catalog and cache settings follow through sync_derived_models (in every worker)
+    DERIVED_MODELS.create(model, definition)
+    return {"status": "success"}, 200
+
+
+def handle_pull(data):
+    # Nothing to download, but "pulling" a model is a good hint it's about to be used
+    runtime.warm(data.get("model") or data.get("name", ""))
+    return {"status": "success", "completed": True}, 200
+
+
+def handle_cache_stats():
+    if runtime.response_cache is None:
+        return {"enabled": {}}, 200
+    return {"enabled": runtime.cache_ttls, **runtime.response_cache.snapshot()}, 200
+
+
+def handle_delete(data):
+    model = data.get("model", "").split(":")[0]
+    DERIVED_MODELS.delete(model)
+    return {"status": "success"}, 200
+
+
+# Flask (default) serving mode
+
+NDJSON = "application/x-ndjson"
+PROMETHEUS = "text/plain; version=0.0.4"
+
+
+def flask_ndjson(agen):
+    return Response((ndjson_line(chunk) for chunk in iterate_sync(agen)), mimetype=NDJSON)
+
+
+@app.route("/", methods=["GET", "HEAD"])
+def index():
+    return "Ollama is running"
+
+@app.route("/api/version", methods=["GET"])
+def version():
+    # Nothing would work unless this endpoint was working
+    # Entirely possible this, the show, and the chat endpoints are the only *necessary* ones
+    return jsonify({"version": "0.5.7"})
+
+
+@app.route("/api/tags", methods=["GET"])
+def tags():
+    tags = catalog.tags
+    if request.headers.get("If-None-Match") == tags.etag:
+        return Response(status=304, headers={"ETag": tags.etag})
+    return Response(tags.body, mimetype="application/json", headers={"ETag": tags.etag})
+
+@app.route("/api/generate", methods=["POST"])
+def generate():
+    data = request.json
+    if wants_stream(data) and not model_not_found(data):
+        return flask_ndjson(stream_generate(data))
+    out, status = run_sync(handle_generate(data))
+    return jsonify(out), status
+
+
+@app.route("/api/chat", methods=["POST"])
+def chat():
+    data = request.json
+    if wants_stream(data) and not model_not_found(data):
+        return flask_ndjson(stream_chat(data))
+    out, status = run_sync(handle_chat(data))
+    return jsonify(out), status
+
+
+@app.route("/api/fanout", methods=["POST"])
+def fanout():
+    data = request.json
+    error = fanout_error(data)
+    if error:
+        return jsonify(error[0]), error[1]
+    return flask_ndjson(stream_fanout(data))
+
+
+@app.route("/api/batch", methods=["POST"])
+def batch():
+    error = batch_error(request.args)
+    if error:
+        return jsonify(error[0]), error[1]
+    # The JSONL body is read up front here, aiohttp mode streams it in as the batch runs
+    lines = (parse_batch_line(line) for line in request.get_data().splitlines())
+    return flask_ndjson(stream_batch([record for record in lines if record], request.args))
+
+
+@app.route("/api/show", methods=["POST"])
+def show():
+    get_background_loop()
+    data = request.json
+    out, status = handle_show(data)
+    etag = catalog.show_etag(data.get("model", "")) if status == 200 else None
+    if etag and request.headers.get("If-None-Match") == etag:
+        return Response(status=304, headers={"ETag": etag})
+    return jsonify(out), status, {"ETag": etag} if etag else {}
 
 
 @app.route("/api/ps", methods=["GET"])
 def ps():
-    # Return empty if nothing is "running" or mimic current model
-    return jsonify({"models": []})
+    out, status = handle_ps()
+    return jsonify(out), status
 
 
 @app.route("/api/create", methods=["POST"])
 def create():
-    # TODO: I think ideally I would set this up so you can "create" individual instances of each model, e.g. a Coding Shopify model vs a Chat SHopify model
-    data = request.json
-    base = data.get("from", "").split(":")[0]
-    model = data.get("model", "").split(":")[0]
-    system = data.get("system", "")
+    out, status = handle_create(request.json)
+    return jsonify(out), status
 
-    if base not in all_client_dict:
-        return jsonify({"error": "base model not found"}), 404
 
-    DERIVED_MODELS[model] = {"base": base, "system": system}
-    return jsonify({"status": "success"})
+@app.route("/api/pull", methods=["POST"])
+def pull():
+    get_background_loop()
+    out, status = handle_pull(request.json)
+    return jsonify(out), status
 
 
-@app.route("/api/pull", methods=["POST"])
 @app.route("/api/push", methods=["POST"])
-def pull_push():
+def push():
     # Just tell the clients we did it
     return jsonify({"status": "success", "completed": True})
 
 
+@app.route("/api/cache", methods=["GET"])
+def cache_stats():
+    get_background_loop()
+    out, status = handle_cache_stats()
+    return jsonify(out), status
+
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    return Response(handle_metrics(), content_type=PROMETHEUS)
+
+
 @app.route("/api/delete", methods=["DELETE"])
 def delete():
-    data = request.json
-    model = data.get("model", "").split(":")[0]
-    DERIVED_MODELS.pop(model, None)
-    return jsonify({"status": "success"})
+    out, status = handle_delete(request.json)
+    return jsonify(out), status
 
 
 @app.after_request
 def add_headers(resp):
-    resp.headers["Content-Type"] = "application/json"
+    if resp.mimetype not in (NDJSON, "text/plain"):
+        resp.headers["Content-Type"] = "application/json"
+    return resp
+
+
+# aiohttp.web serving mode: requests run directly on the app's event loop, no thread hop
+
+async def web_ndjson(req, agen):
+    resp = web.StreamResponse(headers={"Content-Type": NDJSON})
+    await resp.prepare(req)
+    async for chunk in agen:
+        await resp.write(ndjson_line(chunk))
+    await resp.write_eof()
     return resp
 
 
+def create_web_app() -> web.Application:
+    routes = web.RouteTableDef()
+
+    @routes.get("/")
+    async def web_index(req):
+        return web.Response(text="Ollama is running", content_type="application/json")
+
+    @routes.get("/api/version")
+    async def web_version(req):
+        return web.json_response({"version": "0.5.7"})
+
+    @routes.get("/api/tags")
+    async def web_tags(req):
+        tags = catalog.tags
+        if req.headers.get("If-None-Match") == tags.etag:
+            return web.Response(status=304, headers={"ETag": tags.etag})
+        return web.Response(body=tags.body, content_type="application/json", headers={"ETag": tags.etag})
+
+    @routes.post("/api/generate")
+    async def web_generate(req):
+        data = await req.json()
+        if wants_stream(data) and not model_not_found(data):
+            return await web_ndjson(req, stream_generate(data))
+        out, status = await handle_generate(data)
+        return web.json_response(out, status=status)
+
+    @routes.post("/api/chat")
+    async def web_chat(req):
+        data = await req.json()
+        if wants_stream(data) and not model_not_found(data):
+            return await web_ndjson(req, stream_chat(data))
+        out, status = await handle_chat(data)
+        return web.json_response(out, status=status)
+
+    @routes.post("/api/fanout")
+    async def web_fanout(req):
+        data = await req.json()
+        error = fanout_error(data)
+        if error:
+            return web.json_response(error[0], status=error[1])
+        return await web_ndjson(req, stream_fanout(data))
+
+    @routes.post("/api/batch")
+    async def web_batch(req):
+        error = batch_error(req.query)
+        if error:
+            return web.json_response(error[0], status=error[1])
+
+        async def records():
+            async for line in req.content:
+                record = parse_batch_line(line)
+                if record:
+                    yield record
+        return await web_ndjson(req, stream_batch(records(), req.query))
+
+    @routes.post("/api/show")
+    async def web_show(req):
+        data = await req.json()
+        out, status = handle_show(data)
+        etag = catalog.show_etag(data.get("model", "")) if status == 200 else None
+        if etag and req.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers={"ETag": etag})
+        return web.json_response(out, status=status, headers={"ETag": etag} if etag else None)
+
+    @routes.get("/api/ps")
+    async def web_ps(req):
+        out, status = handle_ps()
+        return web.json_response(out, status=status)
+
+    @routes.post("/api/create")
+    async def web_create(req):
+        out, status = handle_create(await req.json())
+        return web.json_response(out, status=status)
+
+    @routes.post("/api/pull")
+    async def web_pull(req):
+        out, status = handle_pull(await req.json())
+        return web.json_response(out, status=status)
+
+    @routes.post("/api/push")
+    async def web_push(req):
+        return web.json_response({"status": "success", "completed": True})
+
+    @routes.get("/api/cache")
+    async def web_cache_stats(req):
+        out, status = handle_cache_stats()
+        return web.json_response(out, status=status)
+
+    @routes.get("/metrics")
+    async def web_metrics(req):
+        return web.Response(body=handle_metrics().encode(), headers={"Content-Type": PROMETHEUS})
+
+    @routes.delete("/api/delete")
+    async def web_delete(req):
+        out, status = handle_delete(await req.json())
+        return web.json_response(out, status=status)
+
+    async def runtime_ctx(web_app):
+        await runtime.startup()
+        yield
+        await runtime.shutdown()
+
+    web_app = web.Application()
+    web_app.add_routes(routes)
+    web_app.cleanup_ctx.append(runtime_ctx)
+    return web_app
+
+
 if __name__ == "__main__":
-    app.run(host="127.0.0.1", port=11434, debug=False)
+    parser = argparse.ArgumentParser(description="Mimics the Ollama API on top of openllms")
+    parser.add_argument("--mode", choices=["flask", "aiohttp"], default="flask")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--pool-size", type=int, default=2, help="Warm sessions to keep per model once it's been used")
+    parser.add_argument(
+        "--session-store", metavar="PATH",
+        help="Keep upstream sessions in this file so they're resumed after a restart instead of set up again",
+    )
+    parser.add_argument(
+        "--prewarm", action="append", default=[], metavar="MODEL[=N]",
+        help="Keep warm sessions for MODEL from startup, can be repeated",
+    )
+    parser.add_argument(
+        "--cache", action="append", default=[], metavar="MODEL[=TTL]",
+        help="Cache responses for MODEL, for TTL seconds (default --cache-ttl), can be repeated",
+    )
+    parser.add_argument("--cache-ttl", type=float, default=300)
+    parser.add_argument(
+        "--rate-limit", action="append", default=[], metavar="KEY=RATE[:BURST[:CONCURRENCY]]",
+        help="Limit requests to a provider name or host (e.g. api.decagon.ai=10:20:16), leave parts empty to skip them",
+    )
+    parser.add_argument("--batch-dir", help="Directory /api/batch checkpoint files are kept in, enables ?checkpoint=")
+    parser.add_argument("--cache-db", help="SQLite file to keep cached responses in, shared by every process using it")
+    parser.add_argument(
+        "--models-db", help="SQLite file to keep models made with /api/create in, shared by every process using it",
+    )
+    parser.add_argument(
+        "--raw-retention", choices=["none", "lazy", "full"], default="full",
+        help="How much of each provider's raw JSON responses keep: none, compact bytes decoded on access, or all of it",
+    )
+    parser.add_argument("--record", metavar="CASSETTE", help="Record upstream traffic to CASSETTE (gzipped if it ends in .gz)")
+    parser.add_argument("--replay", metavar="CASSETTE", help="Answer upstream requests from CASSETTE, no network needed")
+    parser.add_argument("--replay-speed", type=float, default=1.0, help="Replay this many times faster, 0 for no delays")
+    parser.add_argument("--warm-cache", metavar="CASSETTE", help="Load the answers recorded in CASSETTE into the response cache")
+    parser.add_argument(
+        "--request-timeout", type=float, default=120,
+        help="Seconds a generate/chat request gets before its upstream work is abandoned (0 for no limit)",
+    )
+    parser.add_argument(
+        "--no-coalesce", action="store_true", help="Send every request upstream, even identical ones that are in flight",
+    )
+    args = parser.parse_args()
+
+    runtime.pool_size = args.pool_size
+    runtime.session_store_path = args.session_store
+    for spec in args.prewarm:
+        name, _, size = spec.partition("=")
+        runtime.prewarm[name] = int(size) if size else None
+    runtime.cache_ttl = args.cache_ttl
+    runtime.cache_path = args.cache_db
+    runtime.coalesce = not args.no_coalesce
+    runtime.request_timeout = args.request_timeout or None
+    if args.models_db:
+        DERIVED_MODELS.open(args.models_db)
+    runtime.batch_dir = args.batch_dir
+    LLMResponse.raw_retention = args.raw_retention
+    runtime.record_path = args.record
+    runtime.replay_path = args.replay
+    runtime.replay_speed = args.replay_speed
+    runtime.warm_cache_path = args.warm_cache
+    for spec in args.rate_limit:
+        key, _, settings = spec.partition("=")
+        rate, burst, concurrency = (settings.split(":") + ["", ""])[:3]
+        RateLimits.configure(
+            key,
+            rate=float(rate) if rate else None,
+            burst=int(burst) if burst else None,
+            concurrency=int(concurrency) if concurrency else None,
+        )
+    for spec in args.cache:
+        name, _, ttl = spec.partition("=")
+        runtime.cache_ttls[name] = float(ttl) if ttl else args.cache_ttl
+
+    if args.mode == "aiohttp":
+        # Cancel a request's handler when its client disconnects, so the upstream work for it stops too
+        web.run_app(create_web_app(), host=args.host, port=args.port, handler_cancellation=True)
+    else:
+        get_background_loop()
+        app.run(host=args.host, port=args.port, debug=False)
@@ -1,14 +1,10 @@
-from .att import ATTClient
-from .decagon.notion_client import NotionClient
-from .scoutly import ScoutlyClient
-from .decagon import DecagonClient, SubstackClient, BiltClient, ClasspassClient, CurologyClient, WhopClient
-from .chatwith import ChatWithClient, PuzzlesUnlimitedClient, BKSafetyWearClient, MicroTikClient
-from .mycity import MyCityClient
-from .intercom import IntercomClient
-from .shopify import ShopifyClient
+from .registry import ProviderRegistry, ProviderSpec, providers
 
-__all__ = ["ATTClient", "ScoutlyClient", "DecagonClient",
-           "SubstackClient", "BiltClient", "ClasspassClient",
-           "CurologyClient", "NotionClient", "WhopClient", "MyCityClient",
-           "ChatWithClient", "MicroTikClient", "PuzzlesUnlimitedClient", "BKSafetyWearClient", "IntercomClient",
-           "ShopifyClient"]
\ No newline at end of file
+__all__ = ["providers", "ProviderRegistry", "ProviderSpec", *providers]
+
+
+def __getattr__(name):
+    # Providers are only imported when they're first asked for, e.g. `from openllms.clients import SubstackClient`
+    if name in providers:
+        return providers.load(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -37,6 +37,10 @@ class ATTClient(LLM):
             "responseSignal": str(response_signal).lower(),
         }
 
-        data = await self._get(self.BASE_URL, params=params)
+        # Kept as bytes, ATTResponse only parses what it needs out of the (large) search payload
+        async with self._request("GET", self.BASE_URL, params=params) as resp:
+            resp.raise_for_status()
+            data = await resp.read()
 
-        return ATTResponse.from_raw(data)
\ No newline at end of file
+        with self.timings.phase("parse"):
+            return ATTResponse.from_raw(data)
\ No newline at end of file
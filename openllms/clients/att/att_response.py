@@ -1,29 +1,76 @@
 import json
+import re
 from dataclasses import dataclass
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Union
 
 from openllms.models.llm import LLMResponse
 
 
-@dataclass
+@dataclass(slots=True)
 class ATTResponse(LLMResponse):
     question: Optional[str] = None
     score: Optional[float] = None
     citations: Optional[List[Dict]] = None
 
+    # Keys, other strings and brackets: enough to follow the body's nesting without decoding any of it
+    TOKENS = re.compile(r'"(?:[^"\\]|\\.)*"\s*:|"(?:[^"\\]|\\.)*"|[{}\[\]]')
+    DOCS_PATH = [("{", None), ("{", '"response"'), ("[", '"docs"')]
+    SPACE = re.compile(r"\s*")
+
+    @classmethod
+    def docs_start(cls, text: str) -> Optional[int]:
+        """
+        Where the response.docs list's first item starts in the raw body, found without parsing anything before it
+        (e.g. fusion data, which also has a docs list) or after it
+        """
+        path = []
+        key = None
+        for token in cls.TOKENS.finditer(text):
+            value = token.group()
+            if value in "{[":
+                path.append((value, key))
+                key = None
+                if path == cls.DOCS_PATH:
+                    return cls.SPACE.match(text, token.end()).end()
+            elif value in "}]":
+                if not path:
+                    return None
+                path.pop()
+            elif value.endswith(":"):
+                key = value[:-1].rstrip()
+            else:
+                key = None
+        return None
+
+    @classmethod
+    def first_doc(cls, data: Union[dict, bytes]) -> Optional[dict]:
+        if not isinstance(data, bytes):
+            docs = data.get("response", {}).get("docs", [])
+            return docs[0] if docs else None
+        text = data.decode()
+        start = cls.docs_start(text)
+        if start is None:
+            return cls.first_doc(json.loads(text))
+        if text.startswith("]", start):
+            return None
+        try:
+            doc, _ = json.JSONDecoder().raw_decode(text, start)
+        except json.JSONDecodeError:
+            return cls.first_doc(json.loads(text))
+        return doc
+
     @classmethod
-    def from_raw(cls, data: dict) -> "ATTResponse":
+    def from_raw(cls, data: Union[dict, bytes]) -> "ATTResponse":
         """
-        Parse AT&T API JSON into a standardized response object.
+        Parse AT&T API JSON into a standardized response object. Given the raw body, only the first doc is parsed
         """
         # TODO: AT&T Also returns a fusion object, might as well parse that as well
 
-        docs = data.get("response", {}).get("docs", [])
-        if not docs:
+        first_doc = cls.first_doc(data)
+        if first_doc is None:
             #TODO: Probably should standardize a way to handle when the llm does not give a valid response
             return cls(message="", raw=data)
 
-        first_doc = docs[0]
         raw_answer = first_doc.get("answer")
         try:
             parsed = json.loads(raw_answer) if isinstance(raw_answer, str) else raw_answer
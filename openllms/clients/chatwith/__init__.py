@@ -1,6 +1,11 @@
+from openllms.clients.registry import providers
 from .chatwith_client import ChatWithClient
-from .bksafetywear_client import BKSafetyWearClient
-from .microtik_client import MicroTikClient
-from .puzzlesunlimited_client import PuzzlesUnlimitedClient
 
-__all__ = ["ChatWithClient", "PuzzlesUnlimitedClient", "BKSafetyWearClient", "MicroTikClient"]
\ No newline at end of file
+__all__ = ["ChatWithClient", "PuzzlesUnlimitedClient", "BKSafetyWearClient", "MicroTikClient"]
+
+
+def __getattr__(name):
+    # The bots are declared in openllms.clients.registry and built on first use
+    if name in __all__:
+        return providers.load(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
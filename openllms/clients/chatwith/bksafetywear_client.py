@@ -1,5 +1,4 @@
-from openllms.clients.chatwith.chatwith_client import ChatWithClient
+# Declared in openllms.clients.registry, kept so existing imports keep working
+from openllms.clients.registry import providers
 
-class BKSafetyWearClient(ChatWithClient):
-    name = "bksafetywear"
-    chatbot_id = "0db8cddc-ee18-498a-929f-bd46c5f0a0cf"
\ No newline at end of file
+BKSafetyWearClient = providers.load("BKSafetyWearClient")
@@ -1,13 +1,14 @@
+import codecs
 import uuid
 import json
 from dataclasses import dataclass
-from typing import List, Dict, Any
+from typing import AsyncIterator, List, Dict, Any
 
 from openllms.models import LLMResponse
 from openllms.models.llm import AuthenticatedClient
 
 
-@dataclass
+@dataclass(slots=True)
 class ChatWithResponse(LLMResponse):
 
     @classmethod
@@ -24,12 +25,10 @@ class ChatWithClient(AuthenticatedClient):
     BASE_URL = "https://api0.chatwith.tools"
     chatbot_id: str = "d653985a-3e95-42b8-a726-d7a4173c3b55" # Default to ChatWith's chat bot (so I don't have to make ChatWithChatWithClient)
 
-    async def query(
-        self, user_message: str
-    ) -> ChatWithResponse:
+    def _chat_request(self, user_message: str):
         url = f"{self.BASE_URL}/chat"
 
-        messages = [{"role": "user", "content": user_message}] # TODO: Optionally load in longer history
+        messages = [{"role": "user", "content": self.build_prompt(user_message)}] # TODO: Optionally load in longer history
 
         payload = {
             "id": self.session_id,
@@ -40,11 +39,29 @@ class ChatWithClient(AuthenticatedClient):
 
         headers = {}
 
-        async with self.client.post(url, json=payload, headers=headers) as response:
+        return self._request("POST", url, json=payload, headers=headers)
+
+    async def query(
+        self, user_message: str
+    ) -> ChatWithResponse:
+        async with self._chat_request(user_message) as response:
             # I think chatwith just returns the raw text as message
             text = await response.text()
 
-        return ChatWithResponse.from_raw({"message": text})
+        with self.timings.phase("parse"):
+            return ChatWithResponse.from_raw({"message": text})
+
+    async def stream(self, user_message: str) -> AsyncIterator[str]:
+        # The reply is plain text written out as it's generated, so pass the body through as it arrives
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        async with self._chat_request(user_message) as response:
+            async for chunk in response.content.iter_any():
+                text = decoder.decode(chunk)
+                if text:
+                    yield text
+        text = decoder.decode(b"", final=True)
+        if text:
+            yield text
 
     async def fetch_session_id(self):
         # I think we can just generate a random session id
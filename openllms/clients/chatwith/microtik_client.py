@@ -1,5 +1,4 @@
-from openllms.clients.chatwith.chatwith_client import ChatWithClient
+# Declared in openllms.clients.registry, kept so existing imports keep working
+from openllms.clients.registry import providers
 
-class MicroTikClient(ChatWithClient):
-    name = "microtik"
-    chatbot_id: str = "9f026067-9e1a-46c6-84a7-6d9c5ad3cab6"
\ No newline at end of file
+MicroTikClient = providers.load("MicroTikClient")
@@ -1,5 +1,4 @@
-from openllms.clients.chatwith.chatwith_client import ChatWithClient
+# Declared in openllms.clients.registry, kept so existing imports keep working
+from openllms.clients.registry import providers
 
-class PuzzlesUnlimitedClient(ChatWithClient):
-    name = "puzzlesunlimited"
-    chatbot_id: str = "effdfce8-0cef-45c8-8463-98d9c5909efb"
+PuzzlesUnlimitedClient = providers.load("PuzzlesUnlimitedClient")
@@ -1,9 +1,11 @@
-from .bilt_client import BiltClient
-from .classpass_client import ClasspassClient
-from .curology_client import CurologyClient
+from openllms.clients.registry import providers
 from .decagon_client import DecagonClient
-from .substack_client import SubstackClient
-from .whop_client import WhopClient
-from .notion_client import NotionClient
 
-__all__ = ["DecagonClient", "SubstackClient", "WhopClient", "CurologyClient", "BiltClient", "ClasspassClient", "NotionClient"]
\ No newline at end of file
+__all__ = ["DecagonClient", "SubstackClient", "WhopClient", "CurologyClient", "BiltClient", "ClasspassClient", "NotionClient"]
+
+
+def __getattr__(name):
+    # The brands are declared in openllms.clients.registry and built on first use
+    if name in __all__:
+        return providers.load(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
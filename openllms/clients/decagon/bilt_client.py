@@ -1,6 +1,4 @@
-from openllms.clients.decagon.decagon_client import DecagonClient
+# Declared in openllms.clients.registry, kept so existing imports keep working
+from openllms.clients.registry import providers
 
-class BiltClient(DecagonClient):
-    name = "bilt"
-    team_id = "5"
-    flow_id = "bilt"
\ No newline at end of file
+BiltClient = providers.load("BiltClient")
@@ -1,6 +1,4 @@
-from openllms.clients.decagon.decagon_client import DecagonClient
+# Declared in openllms.clients.registry, kept so existing imports keep working
+from openllms.clients.registry import providers
 
-class ClasspassClient(DecagonClient):
-    name = "classpass"
-    team_id = "17"
-    flow_id = "classpass"
\ No newline at end of file
+ClasspassClient = providers.load("ClasspassClient")
@@ -1,6 +1,4 @@
-from openllms.clients.decagon.decagon_client import DecagonClient
+# Declared in openllms.clients.registry, kept so existing imports keep working
+from openllms.clients.registry import providers
 
-class CurologyClient(DecagonClient):
-    name = "curology"
-    team_id = "60"
-    flow_id = "curology"
\ No newline at end of file
+CurologyClient = providers.load("CurologyClient")
@@ -1,12 +1,12 @@
-import asyncio
 import time
 from dataclasses import dataclass
 import uuid
 
 from openllms.models.llm import LLMResponse, AuthenticatedClient
+from openllms.models.polling import AdaptivePoller
 
 
-@dataclass
+@dataclass(slots=True)
 class DecagonResponse(LLMResponse):
     decagon_id: str
     role: str
@@ -25,6 +25,8 @@ class DecagonResponse(LLMResponse):
 
 class DecagonClient(AuthenticatedClient):
     name = "decagon"
+    keeps_history = True
+    session_fields = ("session_id", "_user_id", "last_message_id")
 
     # All companies that use decagon have the same base endpoint, the metadata requires the website URL though
     BASE_URL = "https://api.decagon.ai"
@@ -33,6 +35,7 @@ class DecagonClient(AuthenticatedClient):
 
     team_id: str
     _user_id: str = None
+    last_message_id: str = None # id of the last AI message we returned, so it isn't mistaken for the next answer
 
     # Metadata
     flow_id: str # This seems to be required, none of the other metadata is
@@ -97,25 +100,32 @@ class DecagonClient(AuthenticatedClient):
         }
         return await self._get(full_url, headers=self.get_headers(), params=params)
 
-    async def poll_history_for_response(self, poll_interval=3, timeout=60):
-        start = time.monotonic()
+    @staticmethod
+    def find_ai_response(history: dict):
+        messages = history.get("messages", [])
+        if messages:
+            most_recent_message = messages[-1]
+            if most_recent_message.get("role") == "AI":
+                return most_recent_message.get("id"), most_recent_message
+        return None
 
-        # Perhaps not the best solution, but sleep briefly for user to load in
-
-        while True:
-            history = await self.get_history()
-            messages = history.get("messages", [])
-
-            if messages:
-                # Reverse like your working sync version
-                most_recent_message = messages[-1]
-                if most_recent_message.get("role") == "AI":
-                    return most_recent_message
-
-            if time.monotonic() - start > timeout:
-                raise TimeoutError("Timed out waiting for Decagon response")
-
-            await asyncio.sleep(poll_interval)
+    async def poll_history_for_response(self, poll_interval=3, timeout=60, started=None):
+        """
+        Polls the conversation history until a new AI message shows up. poll_interval is the longest gap between polls,
+        the shared AdaptivePoller decides when to actually poll based on how long this provider usually takes
+        """
+        poller = AdaptivePoller.for_provider(self.name)
+        with self.timings.phase("poll"):
+            message_id, message = await poller.poll(
+                self.get_history,
+                self.find_ai_response,
+                last_seen_id=self.last_message_id,
+                timeout=timeout,
+                max_interval=poll_interval,
+                started=started,
+            )
+        self.last_message_id = message_id
+        return message
 
     async def query(
         self,
@@ -136,13 +146,16 @@ class DecagonClient(AuthenticatedClient):
         payload["type"] = chat_type
         payload["text"] = prompt
 
+        sent = time.monotonic()
         await self._post(full_url, headers=self.get_headers(), json=payload)
 
         # Unlike other clients, decagon seems to require us to poll an endpoint until the AI response is generated
         response = await self.poll_history_for_response(
             timeout=timeout,
             poll_interval=poll_interval,
+            started=sent,
         )
 
 
-        return DecagonResponse.from_raw(response)
\ No newline at end of file
+        with self.timings.phase("parse"):
+            return DecagonResponse.from_raw(response)
\ No newline at end of file
@@ -1,6 +1,4 @@
-from openllms.clients.decagon.decagon_client import DecagonClient
+# Declared in openllms.clients.registry, kept so existing imports keep working
+from openllms.clients.registry import providers
 
-class NotionClient(DecagonClient):
-    name = "notion"
-    team_id = "31"
-    flow_id = "notion"
\ No newline at end of file
+NotionClient = providers.load("NotionClient")
@@ -1,10 +1,4 @@
-from openllms.clients.decagon.decagon_client import DecagonClient
+# Declared in openllms.clients.registry, kept so existing imports keep working
+from openllms.clients.registry import providers
 
-class SubstackClient(DecagonClient):
-    name = "substack"
-    team_id: str = "14"
-    #user_id: str = "decagon_anonymous_721489be-79d3-4014-bd66-f2736d3ab6c5"
-
-    # Metadata (TODO: Test if METADATA is even required)
-    flow_id: str = "substack"
-    metadata_url: str = "https://substack.com/support"
\ No newline at end of file
+SubstackClient = providers.load("SubstackClient")
@@ -1,6 +1,4 @@
-from openllms.clients.decagon.decagon_client import DecagonClient
+# Declared in openllms.clients.registry, kept so existing imports keep working
+from openllms.clients.registry import providers
 
-class WhopClient(DecagonClient):
-    name = "whop"
-    team_id = "443"
-    flow_id = "whop"
\ No newline at end of file
+WhopClient = providers.load("WhopClient")
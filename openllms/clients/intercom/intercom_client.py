@@ -6,7 +6,7 @@ from openllms.models import LLMResponse
 from openllms.models.llm import AuthenticatedClient
 
 
-@dataclass
+@dataclass(slots=True)
 class IntercomResponse(LLMResponse):
     conversation_id: str | None = None
 
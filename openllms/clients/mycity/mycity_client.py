@@ -1,24 +1,25 @@
 import json
+import re
 import uuid
 from dataclasses import dataclass
-from typing import List, Dict
+from typing import AsyncIterator, List, Dict, Optional
 
 from openllms.models import LLMResponse
 from openllms.models.llm import AuthenticatedClient
+from openllms.models.ndjson import iter_lines
 
 """
 {"model": "gpt-35-turbo-16k", "is_last": false, "choices": [{"messages": [{"role": "tool", "content": "{\"citations\": [], \"intent\": \"\", \"search_intent\": \"\"}"}, {"role": "assistant", "content": "I can provide information on New York City government topics. I can help with questions related to opening and operating a business in NYC or services covered by NYC311. If you have any specific questions, feel free to ask!"}]}], "id": "880b9253-e8b4-4bbb-8034-9216ddef9703", "created": 1765976302, "object": "chat.completion.chunk"}
 {"model": "gpt-35-turbo-16k", "is_last": true, "choices": [{"messages": [{"role": "tool", "content": "{\"citations\": [], \"intent\": \"\", \"search_intent\": \"\"}"}, {"role": "assistant", "content": "I can provide information on New York City government topics. I can help with questions related to opening and operating a business in NYC or services covered by NYC311. If you have any specific questions, feel free to ask!"}]}], "id": "880b9253-e8b4-4bbb-8034-9216ddef9703", "created": 1765976302, "object": "chat.completion.chunk"}
 """
-@dataclass
+@dataclass(slots=True)
 class MyCityResponse(LLMResponse):
-    choices: List[Dict]
-
     model: str
     is_last: bool
     mycity_id: str
     created: int
     object_type: str
+    choices: List[Dict]
 
     @classmethod
     def from_raw(cls, data: dict) -> "MyCityResponse":
@@ -38,23 +39,92 @@ class MyCityResponse(LLMResponse):
 
         return cls(
             message=message,
-            choices=choices,
             model=model,
             is_last=is_last,
             mycity_id=mycity_id,
             created=created,
             object_type=object_type,
+            choices=choices,
             raw=data,
         )
 
 
+class MyCityDeltaDecoder:
+    """
+    Turns MyCity's NDJSON chunks into the text each one adds to the answer.
+
+    Every chunk repeats the whole answer so far, so parsing each one in full costs quadratic time and memory in the
+    answer's length. Instead this finds the assistant's content string in the raw line, checks (without copying) that
+    it starts with the same bytes as the previous chunk's, and only decodes the JSON escaped bytes past those. Lines
+    that don't look as expected are parsed in full, and from then on every line is. The is_last line is kept so the
+    final response can be built from it once.
+    """
+
+    ASSISTANT_CONTENT = re.compile(rb'"role"\s*:\s*"assistant"\s*,\s*"content"\s*:\s*"')
+    IS_LAST = re.compile(rb'"is_last"\s*:\s*(true|false)')
+
+    def __init__(self):
+        self.last: Optional[bytes] = None
+        self._previous = memoryview(b"")  # the escaped content string of the previous chunk
+        self._sent = 0  # characters of the answer already returned
+        self._incremental = True
+
+    def feed(self, line: bytes) -> str:
+        last = self.IS_LAST.search(line)
+        if last is not None and last.group(1) == b"true":
+            self.last = line
+
+        match = self.ASSISTANT_CONTENT.search(line) if self._incremental else None
+        if match is None:
+            self._incremental = False
+            return self._parse(line)
+
+        content, start = match.end(), match.end() + len(self._previous)
+        end = _string_end(line, start) if line.startswith(self._previous, content) else None
+        if end is None:
+            # Not a continuation of the previous chunk after all (rewritten, shorter, or escaped differently)
+            self._incremental = False
+            return self._parse(line)
+
+        delta = json.loads(b'"' + line[start:end] + b'"') if end > start else ""
+        self._previous = memoryview(line)[content:end]
+        self._sent += len(delta)
+        return delta
+
+    def _parse(self, line: bytes) -> str:
+        message = MyCityResponse.from_raw(json.loads(line)).message
+        delta = message[self._sent:]
+        self._sent = max(self._sent, len(message))
+        return delta
+
+
+def _string_end(line: bytes, start: int) -> Optional[int]:
+    """
+    Where the JSON string that `start` is inside of ends (the index of its closing quote)
+    """
+    while True:
+        end = line.find(b'"', start)
+        if end == -1:
+            return None
+        backslashes = 0
+        while line[end - 1 - backslashes] == 0x5C:  # \
+            backslashes += 1
+        if backslashes % 2 == 0:
+            return end
+        start = end + 1
+
+
 class MyCityClient(AuthenticatedClient):
     name = "mycity"
 
     BASE_URL = "https://chat.nyc.gov"
     chat_uuid: str
+    session_fields = ("session_id", "chat_uuid")
 
-    async def query(self, prompt: str) -> MyCityResponse:
+    async def _conversation_lines(self, prompt: str) -> AsyncIterator[bytes]:
+        """
+        Posts the prompt and yields every raw NDJSON chunk as it arrives. Each chunk repeats the full text generated so far
+        """
         await self.authenticate()
 
         prompt = self.build_prompt(prompt)
@@ -80,25 +150,34 @@ class MyCityClient(AuthenticatedClient):
 
         headers = {} # Headers do not seem to be required
 
-        async with self.client.post(url, json=payload, headers=headers) as response:
-            final_response: MyCityResponse | None = None
+        async with self._request("POST", url, json=payload, headers=headers) as response:
+            async for line in iter_lines(response.content):
+                yield line
 
-            async for raw_line in response.content:
-                line = raw_line.decode().strip()
-                if not line:
-                    continue
+    async def query(self, prompt: str) -> MyCityResponse:
+        # Only the is_last chunk matters here, the others aren't parsed at all
+        final_line: bytes | None = None
+        async for line in self._conversation_lines(prompt):
+            last = MyCityDeltaDecoder.IS_LAST.search(line)
+            if last is not None and last.group(1) == b"true":
+                final_line = line
+
+        if final_line is None:
+            raise RuntimeError("No completed response found")
 
-                data = json.loads(line)
-                parsed = MyCityResponse.from_raw(data)
+        with self.timings.phase("parse"):
+            return MyCityResponse.from_raw(json.loads(final_line))
 
-                if parsed.is_last:
-                    final_response = parsed
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        decoder = MyCityDeltaDecoder()
+        async for line in self._conversation_lines(prompt):
+            delta = decoder.feed(line)
+            if delta:
+                yield delta
 
-        if final_response is None:
+        if decoder.last is None:
             raise RuntimeError("No completed response found")
 
-        return final_response
-
     async def fetch_session_id(self):
         # I believe we can just generate our own session UUID and chatUUID
         self.chat_uuid = str(uuid.uuid4())
@@ -0,0 +1,103 @@
+import hashlib
+import importlib
+import json
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Mapping, Optional, Type
+
+import aiohttp
+
+from openllms.models.llm import LLM
+
+
+@dataclass(frozen=True)
+class ProviderSpec:
+    """
+    Everything we know about a provider without importing it.
+
+    `base` is "module:Class". With no `attrs` that class is the provider itself, otherwise the provider is a subclass
+    of it with `attrs` as class attributes (which is all most of the Decagon and ChatWith brands are).
+    """
+    name: str  # model/class name, e.g. "SubstackClient"
+    family: str  # LLM.name, e.g. "substack"
+    base: str
+    attrs: Mapping[str, object] = field(default_factory=dict)
+
+    @property
+    def digest(self) -> str:
+        """
+        Changes only when the spec does, so it's stable across restarts
+        """
+        raw = json.dumps([self.name, self.family, self.base, dict(self.attrs)], sort_keys=True)
+        return f"sha256:{hashlib.sha256(raw.encode()).hexdigest()}"
+
+
+class ProviderRegistry(Mapping[str, ProviderSpec]):
+    """
+    The providers openllms knows about, keyed by name. A provider's module is only imported (and a declarative
+    provider's class only built) the first time load() or create() asks for it.
+    """
+
+    def __init__(self):
+        self._specs: Dict[str, ProviderSpec] = {}
+        self._classes: Dict[str, Type[LLM]] = {}
+
+    def __getitem__(self, name: str) -> ProviderSpec:
+        return self._specs[name]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._specs)
+
+    def __len__(self) -> int:
+        return len(self._specs)
+
+    def register(self, name: str, family: str, base: str, **attrs) -> ProviderSpec:
+        spec = ProviderSpec(name=name, family=family, base=base, attrs=attrs)
+        self._specs[name] = spec
+        self._classes.pop(name, None)
+        return spec
+
+    def by_family(self, family: str) -> Optional[ProviderSpec]:
+        return next((spec for spec in self._specs.values() if spec.family == family), None)
+
+    def families(self) -> List[str]:
+        return [spec.family for spec in self._specs.values()]
+
+    def load(self, name: str) -> Type[LLM]:
+        if name not in self._classes:
+            spec = self._specs[name]
+            module, _, attr = spec.base.partition(":")
+            cls = getattr(importlib.import_module(module), attr)
+            if spec.attrs:
+                # Resolvable as openllms.clients.<name>, like the hand written providers
+                cls = type(spec.name, (cls,), {"__module__": "openllms.clients", "name": spec.family, **spec.attrs})
+            self._classes[name] = cls
+        return self._classes[name]
+
+    def create(self, name: str, client: aiohttp.ClientSession, **kwargs) -> LLM:
+        return self.load(name)(client, **kwargs)
+
+
+providers = ProviderRegistry()
+
+providers.register("ATTClient", "att", "openllms.clients.att.att_client:ATTClient")
+providers.register("ScoutlyClient", "scoutly", "openllms.clients.scoutly.scoutly_client:ScoutlyClient")
+providers.register("MyCityClient", "mycity", "openllms.clients.mycity.mycity_client:MyCityClient")
+providers.register("IntercomClient", "intercom", "openllms.clients.intercom.intercom_client:IntercomClient")
+providers.register("ShopifyClient", "shopify", "openllms.clients.shopify.shopify_client:ShopifyClient")
+
+DECAGON = "openllms.clients.decagon.decagon_client:DecagonClient"
+providers.register("DecagonClient", "decagon", DECAGON)
+providers.register("SubstackClient", "substack", DECAGON, team_id="14", flow_id="substack",
+                   metadata_url="https://substack.com/support")
+providers.register("BiltClient", "bilt", DECAGON, team_id="5", flow_id="bilt")
+providers.register("ClasspassClient", "classpass", DECAGON, team_id="17", flow_id="classpass")
+providers.register("CurologyClient", "curology", DECAGON, team_id="60", flow_id="curology")
+providers.register("NotionClient", "notion", DECAGON, team_id="31", flow_id="notion")
+providers.register("WhopClient", "whop", DECAGON, team_id="443", flow_id="whop")
+
+CHATWITH = "openllms.clients.chatwith.chatwith_client:ChatWithClient"
+providers.register("ChatWithClient", "chatwith", CHATWITH)
+providers.register("BKSafetyWearClient", "bksafetywear", CHATWITH, chatbot_id="0db8cddc-ee18-498a-929f-bd46c5f0a0cf")
+providers.register("MicroTikClient", "microtik", CHATWITH, chatbot_id="9f026067-9e1a-46c6-84a7-6d9c5ad3cab6")
+providers.register("PuzzlesUnlimitedClient", "puzzlesunlimited", CHATWITH,
+                   chatbot_id="effdfce8-0cef-45c8-8463-98d9c5909efb")
@@ -1,4 +1,6 @@
-from .scoutly_client import ScoutlyClient, ScoutlyRole, ScoutlyHistoryItem
+from .scoutly_client import ScoutlyClient
+from .scoutly_history import ScoutlyRole, ScoutlyHistoryItem, ScoutlyHistory, HistoryPolicy, list_questions
 from .scoutly_response import ScoutlyResponse
 
-__all__ = ["ScoutlyClient", "ScoutlyRole", "ScoutlyHistoryItem", "ScoutlyResponse"]
\ No newline at end of file
+__all__ = ["ScoutlyClient", "ScoutlyRole", "ScoutlyHistoryItem", "ScoutlyHistory", "HistoryPolicy", "list_questions",
+           "ScoutlyResponse"]
\ No newline at end of file
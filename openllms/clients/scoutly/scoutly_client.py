@@ -1,9 +1,9 @@
+import json
 import uuid
-from dataclasses import dataclass
-from typing import List
-from enum import Enum
+from typing import List, Optional
 import aiohttp
 
+from openllms.clients.scoutly.scoutly_history import HistoryPolicy, ScoutlyHistory, ScoutlyHistoryItem, ScoutlyRole
 from openllms.clients.scoutly.scoutly_response import ScoutlyResponse
 from openllms.models import LLM
 
@@ -11,54 +11,28 @@ from openllms.models import LLM
 # This should probably be implemented directly with everything else so it's easier to manage
 # Right now I set it up to inherit from LLM but it should be inheriting from the AuthenticatedLLM class
 
-API_ENDPOINT = "https://scoutly.scouting.org/api/chat2"
-
-
-class ScoutlyRole(Enum):
-    USER = "user"
-    SYSTEM = "system"
-    ASSISTANT = "assistant"
-
-
-@dataclass
-class ScoutlyHistoryItem:
-    role: ScoutlyRole
-    content: str
-    answer: str = ""
-
-    def to_dict(self):
-        return {
-            "role": self.role.value,
-            "content": self.content,
-            "answer": self.answer,
-        }
-
 class ScoutlyClient(LLM):
     """
     Scoutly integration as an LLM-compatible class.
     """
     name = "scoutly"
+    keeps_history = True
+    BASE_URL = "https://scoutly.scouting.org"
 
     def __init__(
         self,
         client: aiohttp.ClientSession,
-        session: str = str(uuid.uuid4()),
+        session: Optional[str] = None,
         language: str = "en-US",
         initial_prompt: str = "",
+        history_policy: Optional[HistoryPolicy] = None,
     ):
         super().__init__(client)
-        self.session = session
+        self.session = session or str(uuid.uuid4()) # Each client is its own upstream conversation
         self.language = language
-        self.history: List[ScoutlyHistoryItem] = [] # History items seem to be present, but I think the current session id is what impacts the history so who knows why they pass this through?
-
-        if initial_prompt:
-            self.history.append(
-                ScoutlyHistoryItem(
-                    role=ScoutlyRole.SYSTEM,
-                    content=initial_prompt,
-                    answer="@system, Understood.",
-                )
-            )
+        # History items seem to be present, but I think the current session id is what impacts the history so who knows why they pass this through?
+        # Either way only a bounded window of it is sent, see HistoryPolicy
+        self.history = ScoutlyHistory(history_policy, initial_prompt=initial_prompt)
 
     def load_history(self, history_items: List[ScoutlyHistoryItem]):
         """Load prior chat history items."""
@@ -68,28 +42,27 @@ class ScoutlyClient(LLM):
         """Send a question to Scoutly and return a standardized response."""
         question = self.build_prompt(question)
         user_item = ScoutlyHistoryItem(role=ScoutlyRole.USER, content=question, answer="")
-        self.history.append(user_item)
 
-        payload = {
-            "question": question,
-            "language": self.language,
-            "session": self.session,
-            "history": [h.to_dict() for h in self.history],
-        }
+        # Earlier items are already encoded, only the new question needs to be
+        payload = json.dumps({"question": question, "language": self.language, "session": self.session})
+        body = payload[:-1].encode() + b', "history": ' + self.history.encode(user_item) + b"}"
+        headers = {"Content-Type": "application/json"}
 
-        async with self.client.post(API_ENDPOINT, json=payload) as resp:
+        async with self._request("POST", f"{self.BASE_URL}/api/chat2", data=body, headers=headers) as resp:
             resp.raise_for_status()
             data = await resp.json()
 
         answer = data.get("answer", "")
 
         user_item.answer = answer
-        self.history.append(
+        self.history.add_turn(
+            user_item,
             ScoutlyHistoryItem(
                 role=ScoutlyRole.ASSISTANT,
                 content=question,
                 answer=answer,
-            )
+            ),
         )
 
-        return ScoutlyResponse.from_raw(data)
+        with self.timings.phase("parse"):
+            return ScoutlyResponse.from_raw(data)
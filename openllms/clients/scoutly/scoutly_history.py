@@ -0,0 +1,141 @@
+import json
+from dataclasses import dataclass
+from enum import Enum
+from typing import Callable, Iterator, List, Optional
+
+
+class ScoutlyRole(Enum):
+    USER = "user"
+    SYSTEM = "system"
+    ASSISTANT = "assistant"
+
+
+@dataclass
+class ScoutlyHistoryItem:
+    role: ScoutlyRole
+    content: str
+    answer: str = ""
+
+    def to_dict(self):
+        return {
+            "role": self.role.value,
+            "content": self.content,
+            "answer": self.answer,
+        }
+
+    def encode(self) -> bytes:
+        return json.dumps(self.to_dict()).encode()
+
+
+# (summary so far, items being dropped from the window) -> new summary
+Summarizer = Callable[[str, List[ScoutlyHistoryItem]], str]
+
+
+def list_questions(summary: str, dropped: List[ScoutlyHistoryItem], limit: int = 2000) -> str:
+    """
+    A summarizer that needs no model: remembers which questions were asked, most recent last, up to `limit` characters
+    """
+    questions = [item.content for item in dropped if item.role == ScoutlyRole.USER]
+    if not questions:
+        return summary
+    summary = "; ".join(filter(None, [summary, *questions]))
+    return summary[-limit:]
+
+
+@dataclass
+class HistoryPolicy:
+    """
+    How much history is sent along with each question. The oldest turns are dropped once there are more than
+    max_turns of them or the encoded history is over max_bytes (None for no limit). With a summarizer, dropped turns
+    are folded into the system item instead of being forgotten.
+    """
+    max_turns: Optional[int] = 20
+    max_bytes: Optional[int] = 32_000
+    summarize: Optional[Summarizer] = None
+
+
+class ScoutlyHistory:
+    """
+    The history items sent with every Scoutly question, kept within a HistoryPolicy.
+
+    Each item is JSON encoded once when it's added and the encoded bytes are reused for every later request, so a
+    long conversation doesn't re-encode all of its earlier turns on each question.
+    """
+
+    SUMMARY_HEADER = "Earlier in this conversation: "
+    SYSTEM_ANSWER = "@system, Understood."
+
+    def __init__(self, policy: Optional[HistoryPolicy] = None, initial_prompt: str = ""):
+        self.policy = policy or HistoryPolicy()
+        self.initial_prompt = initial_prompt
+        self.summary = ""
+        self.system: Optional[ScoutlyHistoryItem] = None  # always sent first, never dropped
+        self._system_encoded = b""
+        self.items: List[ScoutlyHistoryItem] = []
+        self._encoded: List[bytes] = []
+        self._size = 0  # bytes of the encoded items, separators included
+        self._update_system()
+
+    def __iter__(self) -> Iterator[ScoutlyHistoryItem]:
+        if self.system is not None:
+            yield self.system
+        yield from self.items
+
+    def __len__(self) -> int:
+        return len(self.items) + (self.system is not None)
+
+    @property
+    def size(self) -> int:
+        return self._size + len(self._system_encoded)
+
+    def extend(self, items: List[ScoutlyHistoryItem]):
+        for item in items:
+            encoded = item.encode()
+            self.items.append(item)
+            self._encoded.append(encoded)
+            self._size += len(encoded) + 2
+        self._trim()
+
+    def add_turn(self, question: ScoutlyHistoryItem, answer: ScoutlyHistoryItem):
+        self.extend([question, answer])
+
+    def encode(self, pending: Optional[ScoutlyHistoryItem] = None) -> bytes:
+        """
+        The history as a JSON array, with `pending` (the question being asked) at the end
+        """
+        parts = ([self._system_encoded] if self.system is not None else []) + self._encoded
+        if pending is not None:
+            parts.append(pending.encode())
+        return b"[" + b", ".join(parts) + b"]"
+
+    def _over(self) -> bool:
+        policy = self.policy
+        turns = sum(1 for item in self.items if item.role == ScoutlyRole.USER)
+        return bool(self.items) and (
+            (policy.max_turns is not None and turns > policy.max_turns)
+            or (policy.max_bytes is not None and self.size > policy.max_bytes)
+        )
+
+    def _trim(self):
+        dropped = []
+        while self._over():
+            # A question goes together with the answer that follows it
+            count = 2 if len(self.items) > 1 and self.items[0].role == ScoutlyRole.USER \
+                and self.items[1].role == ScoutlyRole.ASSISTANT else 1
+            dropped += self.items[:count]
+            self._size -= sum(len(encoded) + 2 for encoded in self._encoded[:count])
+            del self.items[:count]
+            del self._encoded[:count]
+            if self.policy.summarize is not None:
+                # Re-summarising as we go keeps a growing summary counted against max_bytes
+                self.summary = self.policy.summarize(self.summary, dropped)
+                dropped = []
+                self._update_system()
+
+    def _update_system(self):
+        content = self.initial_prompt
+        if self.summary:
+            content = f"{content}\n\n{self.SUMMARY_HEADER}{self.summary}" if content else self.SUMMARY_HEADER + self.summary
+        if content:
+            self.system = ScoutlyHistoryItem(role=ScoutlyRole.SYSTEM, content=content, answer=self.SYSTEM_ANSWER)
+            self._system_encoded = self.system.encode()
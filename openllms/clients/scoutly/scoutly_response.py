@@ -3,7 +3,7 @@ from dataclasses import dataclass
 from openllms.models import LLMResponse
 
 
-@dataclass
+@dataclass(slots=True)
 class ScoutlyResponse(LLMResponse):
 
     @classmethod
@@ -1,19 +1,25 @@
 import urllib
 
 import asyncio
+import json
 import time
 import uuid
+from typing import AsyncIterator
+
+import aiohttp
 from openllms.models.llm import AuthenticatedClient, LLMResponse
+from openllms.models.polling import AdaptivePoller
+from openllms.models.sse import SSEEvent, iter_sse
 from dataclasses import dataclass
 
-@dataclass
+@dataclass(slots=True)
 class ShopifyResponse(LLMResponse):
     _id: str
     turn_number: int
     sequence_number: int
     created_at: str
     role: str
-    content: str
+    content: object  # the message's content as sent, a list of parts (each with its markdown) or a plain string
 
     @classmethod
     def from_raw(cls, data) -> "ShopifyResponse":
@@ -36,33 +42,118 @@ class ShopifyResponse(LLMResponse):
             raw=data
         )
 
+class ShopifyStreamAssembler:
+    """
+    Builds the assistant's reply out of the event stream /api/messages answers with.
+
+    The event format isn't documented, so this accepts both full message snapshots (a message dict with role/content,
+    either bare or under "message") and plain markdown deltas. The reply is complete once a "done"-style event or a
+    message with a completed status comes in, or when the stream ends cleanly (see end()) with some reply in it.
+    """
+    DONE_EVENTS = {"done", "complete", "completed", "message_complete", "end"}
+    DONE_STATUSES = {"done", "complete", "completed", "finished"}
+
+    def __init__(self):
+        self.markdown = ""
+        self.message: dict | None = None
+        self.completed = False
+        self.ended = False
+
+    @staticmethod
+    def message_markdown(message: dict) -> str | None:
+        content = message.get("content")
+        if isinstance(content, list) and content and isinstance(content[0], dict):
+            return content[0].get("markdown")
+        if isinstance(content, str):
+            return content
+        return None
+
+    def feed(self, event: SSEEvent) -> str:
+        """
+        Takes one event and returns whatever new markdown it added to the reply
+        """
+        if event.event in self.DONE_EVENTS or event.data.strip() == "[DONE]":
+            self.completed = True
+        try:
+            data = json.loads(event.data)
+        except json.JSONDecodeError:
+            return ""
+        if not isinstance(data, dict):
+            return ""
+
+        message = data.get("message") if isinstance(data.get("message"), dict) else data
+        if message.get("status") in self.DONE_STATUSES or data.get("done") is True:
+            self.completed = True
+
+        delta = data.get("delta")
+        if isinstance(delta, dict):
+            delta = delta.get("markdown") or delta.get("content")
+        if isinstance(delta, str):
+            self.markdown += delta
+            return delta
+
+        if message.get("role") != "assistant":
+            return ""
+        self.message = message
+        markdown = self.message_markdown(message)
+        if markdown is None or not markdown.startswith(self.markdown):
+            return ""
+        new, self.markdown = markdown[len(self.markdown):], markdown
+        return new
+
+    def end(self):
+        """
+        Marks the stream as having ended normally, rather than being cut off
+        """
+        self.ended = True
+
+    def final_message(self) -> dict | None:
+        """
+        The finished assistant message, or None if the stream was cut off or ended without any reply
+        """
+        if not (self.completed or self.ended):
+            return None
+        message = dict(self.message or {"role": "assistant"})
+        if self.message_markdown(message) is None:
+            message["content"] = [{"markdown": self.markdown}]
+        if not self.message_markdown(message):
+            return None
+        return message
+
+
 class ShopifyClient(AuthenticatedClient):
     name = "shopify"
+    keeps_history = True
     BASE_URL = "https://sidekick.shopify.com/api/messages"
     CONVERSATION_URL = "https://sidekick.shopify.com/api/conversations"
     ANON_URL = "https://sidekick.shopify.com/api/anonymous_user"
+    ASSISTANT_URL = "https://help.shopify.com/en/search/What?_data=routes%2F%28%24locale%29._assistant.search.%24searchId"
 
     conversation_id: str | None = None
     user_id: str | None = None
+    last_message_id: str | None = None # id of the last assistant message we returned
+    session_fields = ("session_id", "user_id", "conversation_id", "last_message_id")
 
     headers = {
         "Accept": "text/event-stream",
         "Content-Type": "application/json",
     }
 
+    def restore_session(self, state: dict):
+        super().restore_session(state)
+        if self.user_id:
+            self.headers = {**self.headers, "x-anonymous-user-id": self.user_id}
+
     async def fetch_session_id(self):
         """Create anonymous user + conversation if not already set."""
 
         if not self.user_id:
             data = await self._post(self.ANON_URL, headers={**self.headers, "Accept": "application/json"}, json={})
             self.user_id = data.get("identifier")
-            self.headers["x-anonymous-user-id"] = self.user_id
+            # Copy rather than mutate the class level headers, otherwise every instance shares the last user id
+            self.headers = {**self.headers, "x-anonymous-user-id": self.user_id}
 
         if not self.conversation_id:
-            assistant_url = (
-                "https://help.shopify.com/en/search/What"
-                "?_data=routes%2F%28%24locale%29._assistant.search.%24searchId"
-            )
             form_data = {
                 "actionName": "createSidekickConversation",
                 "query": "",
@@ -70,9 +161,10 @@ class ShopifyClient(AuthenticatedClient):
                 "anonymousUserId": self.user_id
             }
 
-            # Use parent's client directly for raw request to get headers
-            async with self.client.post(
-                assistant_url,
+            # Raw request (still through the rate limits) since we need the response headers
+            async with self._request(
+                "POST",
+                self.ASSISTANT_URL,
                 headers={**self.headers, "Content-Type": "application/x-www-form-urlencoded;charset=UTF-8"},
                 data=urllib.parse.urlencode(form_data),
                 allow_redirects=False  # we only want headers
@@ -88,8 +180,12 @@ class ShopifyClient(AuthenticatedClient):
                     self.conversation_id = conv_id
         return self.user_id
 
-    async def post_message(self, user_message: str) -> None:
-        user_message = self.build_prompt(user_message)
+    async def _message_events(self, user_message: str, assembler: ShopifyStreamAssembler) -> AsyncIterator[SSEEvent]:
+        """
+        Posts the message and yields the server-sent events the reply is streamed back as, telling assembler when
+        the stream is over. A stream that's cut off once it has started just ends, since the reply can still be
+        polled for, while failing to send the message raises
+        """
         request_id = str(uuid.uuid4())
         payload = {
             "message": {
@@ -101,23 +197,41 @@ class ShopifyClient(AuthenticatedClient):
             }
         }
 
-        # Make raw POST using parent's client
-        async with self.client.post(
-                self.BASE_URL, headers=self.headers, json=payload
-        ) as resp:
-            if resp.status != 200:
-                raise RuntimeError(f"Shopify API /messages returned {resp.status}")
-            # just read & ignore event stream; no JSON decoding
-            await resp.release()
+        streaming = False
+        try:
+            # Raw POST since the reply is an event stream rather than JSON
+            async with self._request(
+                    "POST", self.BASE_URL, headers=self.headers, json=payload
+            ) as resp:
+                if resp.status != 200:
+                    raise RuntimeError(f"Shopify API /messages returned {resp.status}")
+                streaming = True
+                async for event in iter_sse(resp.content):
+                    yield event
+        except aiohttp.ClientError as e:
+            if not streaming or isinstance(e, asyncio.TimeoutError):
+                raise
+            self.logger.warning("Shopify event stream was cut off, polling for the reply: %s", e)
+            return
+        assembler.end()
+
+    async def post_message(self, user_message: str) -> dict | None:
+        """
+        Sends the (already built) prompt and returns the assistant message assembled from the event stream, or None
+        if the stream was cut off or had no reply in it
+        """
+        assembler = ShopifyStreamAssembler()
+        async for event in self._message_events(user_message, assembler):
+            assembler.feed(event)
+        return assembler.final_message()
 
     async def get_history(self) -> dict:
         conversation_url = f"{self.CONVERSATION_URL}/{self.conversation_id}?features[]=help/search/default"
         return await self._get(conversation_url, headers={**self.headers, "Accept": "application/json"})
 
-    async def poll_history_for_response(self, last_query: str, poll_interval=2, timeout=60) -> dict:
-        start = time.monotonic()
-        while True:
-            history = await self.get_history()
+    @staticmethod
+    def find_response_to(last_query: str):
+        def find(history: dict):
             messages = history.get("conversation", {}).get("messages", [])
             # scan backwards to match the last user message
             for i in range(len(messages) - 1, 0, -1):
@@ -128,13 +242,58 @@ class ShopifyClient(AuthenticatedClient):
                     and user_msg.get("content") == last_query
                     and assistant_msg.get("role") == "assistant"
                 ):
-                    return assistant_msg
-            if time.monotonic() - start > timeout:
-                raise TimeoutError("Timed out waiting for Shopify AI response")
-            await asyncio.sleep(poll_interval)
+                    return assistant_msg.get("id"), assistant_msg
+            return None
+        return find
+
+    async def poll_history_for_response(self, last_query: str, poll_interval=2, timeout=60, started=None) -> dict:
+        """
+        Polls the conversation until the assistant answers last_query. poll_interval is the longest gap between polls,
+        the shared AdaptivePoller decides when to actually poll based on how long this provider usually takes
+        """
+        poller = AdaptivePoller.for_provider(self.name)
+        with self.timings.phase("poll"):
+            message_id, message = await poller.poll(
+                self.get_history,
+                self.find_response_to(last_query),
+                last_seen_id=self.last_message_id, # Asking the same thing twice shouldn't return the first answer
+                timeout=timeout,
+                max_interval=poll_interval,
+                started=started,
+            )
+        self.last_message_id = message_id
+        return message
 
     async def query(self, user_message: str, timeout: int = 60, poll_interval: int = 2) -> ShopifyResponse:
         await self.authenticate()
-        await self.post_message(user_message)
-        message_data = await self.poll_history_for_response(user_message, timeout=timeout, poll_interval=poll_interval)
-        return ShopifyResponse.from_raw(message_data)
+        prompt = self.build_prompt(user_message)
+        sent = time.monotonic()
+        message_data = await self.post_message(prompt)
+        if message_data is None:
+            # Stream was cut off or empty, the answer should still end up in the conversation history
+            message_data = await self.poll_history_for_response(
+                prompt, timeout=timeout, poll_interval=poll_interval, started=sent
+            )
+        self.last_message_id = message_data.get("id") or self.last_message_id
+        with self.timings.phase("parse"):
+            return ShopifyResponse.from_raw(message_data)
+
+    async def stream(self, user_message: str, timeout: int = 60, poll_interval: int = 2) -> AsyncIterator[str]:
+        await self.authenticate()
+        prompt = self.build_prompt(user_message)
+        sent = time.monotonic()
+        assembler = ShopifyStreamAssembler()
+        async for event in self._message_events(prompt, assembler):
+            delta = assembler.feed(event)
+            if delta:
+                yield delta
+
+        message_data = assembler.final_message()
+        if message_data is None:
+            message_data = await self.poll_history_for_response(
+                prompt, timeout=timeout, poll_interval=poll_interval, started=sent
+            )
+            markdown = ShopifyResponse.from_raw(message_data).message
+            if markdown.startswith(assembler.markdown):
+                yield markdown[len(assembler.markdown):]
+        self.last_message_id = message_data.get("id") or self.last_message_id
@@ -1,4 +1,24 @@
 from .llm import LLM
 from .llm import LLMResponse
+from .batch import BatchRunner, BatchResult, BatchStats
+from .cache import LRUCache
+from .fanout import fan_out, FanoutResult
+from .hedging import HedgedLLM
+from .metrics import Metrics
+from .polling import AdaptivePoller, PollStats
+from .rate_limit import RateLimits, LimitSettings
+from .resilience import RetryPolicy, CircuitBreakers, CircuitOpenError
+from .response_cache import ResponseCache, CacheBackend, MemoryCacheBackend, SQLiteCacheBackend, TextResponse
+from .session import create_client_session
+from .session_pool import SessionPool, PoolStats
+from .session_store import SessionStore, MemorySessionStore, FileSessionStore
+from .single_flight import SingleFlight, FlightStats
+from .timing import PhaseTimer
+from .transport import Transport, MemoryTransport, MemoryResponse, RecordingTransport, ReplayTransport, recorded_queries
 
-__all__ = ["LLM", "LLMResponse"]
\ No newline at end of file
+__all__ = ["LLM", "LLMResponse", "LRUCache", "AdaptivePoller", "PollStats", "fan_out", "FanoutResult", "HedgedLLM",
+           "ResponseCache", "CacheBackend", "MemoryCacheBackend", "SQLiteCacheBackend", "TextResponse",
+           "RateLimits", "LimitSettings", "RetryPolicy", "CircuitBreakers", "CircuitOpenError", "create_client_session", "SessionPool", "PoolStats",
+           "SessionStore", "MemorySessionStore", "FileSessionStore",
+           "Metrics", "PhaseTimer", "BatchRunner", "BatchResult", "BatchStats",
+           "SingleFlight", "FlightStats", "Transport", "MemoryTransport", "MemoryResponse", "RecordingTransport", "ReplayTransport", "recorded_queries"]
\ No newline at end of file
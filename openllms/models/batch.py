@@ -0,0 +1,222 @@
+import asyncio
+import inspect
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from typing import AsyncIterable, AsyncIterator, Awaitable, Callable, Dict, Iterable, Mapping, Optional, Sequence, Set, Union
+
+from openllms.models.llm import LLM, LLMResponse
+
+ClientSource = Union[Mapping[str, Union[LLM, Sequence[LLM]]], Callable[[str], Union[LLM, Awaitable[LLM]]]]
+
+
+@dataclass
+class BatchResult:
+    index: int
+    model: str
+    response: Optional[LLMResponse] = None
+    error: Optional[BaseException] = None
+    elapsed: float = 0.0  # seconds spent on the query itself, not waiting for a slot
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def to_json(self) -> dict:
+        return {
+            "index": self.index,
+            "model": self.model,
+            "response": getattr(self.response, "message", None),
+            "error": None if self.ok else type(self.error).__name__ + (f": {self.error}" if str(self.error) else ""),
+            "elapsed": self.elapsed,
+        }
+
+
+@dataclass
+class BatchStats:
+    completed: int = 0
+    failed: int = 0
+    skipped: int = 0  # already done according to the checkpoint
+    elapsed: float = 0.0
+
+
+class _ModelSlots:
+    """
+    Hands out clients for one model, at most `concurrency` prompts at a time
+    """
+
+    def __init__(self, source, model: str, concurrency: int):
+        self.source = source
+        self.model = model
+        self.idle: Optional[asyncio.Queue] = None
+        if isinstance(source, Mapping):
+            clients = source[model]
+            clients = list(clients) if isinstance(clients, Sequence) else [clients]
+            # Given instances are reused, each only answering one prompt at a time since they hold conversation state
+            self.idle = asyncio.Queue()
+            for client in clients:
+                self.idle.put_nowait(client)
+        else:
+            self.semaphore = asyncio.Semaphore(concurrency)
+
+    async def acquire(self) -> LLM:
+        if self.idle is not None:
+            return await self.idle.get()
+        await self.semaphore.acquire()
+        try:
+            client = self.source(self.model)
+            return await client if inspect.isawaitable(client) else client
+        except BaseException:
+            self.semaphore.release()
+            raise
+
+    def release(self, client: LLM):
+        if self.idle is not None:
+            self.idle.put_nowait(client)
+        else:
+            self.semaphore.release()
+
+
+class BatchRunner:
+    """
+    Runs a stream of {"model": ..., "prompt": ...} records and yields a BatchResult for each as it finishes, in
+    completion order. A record's index is its position in the input unless it has its own "index".
+
+    `clients` is either a mapping of model name to LLM instances (a list of them to answer several prompts of that
+    model at once), or a function returning a fresh LLM (or an awaitable of one) for a model name, called once per
+    prompt with at most `concurrency` prompts per model in flight. Clients should share one session so connections
+    get reused.
+
+    With a `checkpoint` file every result is appended to it as a JSON line, and a later run with the same file skips
+    the records that already succeeded. `raw_retention` ("none", "lazy" or "full", see LLMResponse) slims down the
+    responses in the results, for when a lot of them are kept around.
+    """
+
+    def __init__(
+        self,
+        clients: ClientSource,
+        concurrency: int = 4,
+        max_in_flight: int = 64,
+        timeout: Optional[float] = 60,
+        checkpoint: Optional[str] = None,
+        raw_retention: Optional[str] = None,
+    ):
+        self.clients = clients
+        self.concurrency = concurrency
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.checkpoint = checkpoint
+        self.raw_retention = raw_retention
+        self.stats = BatchStats()
+        self._slots: Dict[str, _ModelSlots] = {}
+
+    def completed_indexes(self) -> Set[int]:
+        """
+        Indexes the checkpoint file says have already been answered
+        """
+        done = set()
+        if not self.checkpoint or not os.path.exists(self.checkpoint):
+            return done
+        with open(self.checkpoint) as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # A line cut short by a crash
+                if result.get("error") is None:
+                    done.add(result["index"])
+                else:
+                    done.discard(result["index"])
+        return done
+
+    def knows(self, model: str) -> bool:
+        return not isinstance(self.clients, Mapping) or model in self.clients
+
+    async def _run_one(self, index: int, record: dict) -> BatchResult:
+        model = record.get("model", "")
+        if not self.knows(model):
+            return BatchResult(index, model, error=KeyError(f"model not found: {model}"))
+        if model not in self._slots:
+            self._slots[model] = _ModelSlots(self.clients, model, self.concurrency)
+        slots = self._slots[model]
+
+        try:
+            client = await slots.acquire()
+        except Exception as e:
+            return BatchResult(index, model, error=e)
+        start = time.monotonic()
+        try:
+            response = await asyncio.wait_for(client.query(record.get("prompt", "")), self.timeout)
+            if self.raw_retention:
+                response.retain(self.raw_retention)
+            return BatchResult(index, model, response=response, elapsed=time.monotonic() - start)
+        except Exception as e:
+            return BatchResult(index, model, error=e, elapsed=time.monotonic() - start)
+        finally:
+            slots.release(client)
+
+    async def run(self, records: Union[Iterable[dict], AsyncIterable[dict]]) -> AsyncIterator[BatchResult]:
+        done = self.completed_indexes()
+        checkpoint = open(self.checkpoint, "a") if self.checkpoint else None
+        in_flight = asyncio.Semaphore(self.max_in_flight)
+        results: asyncio.Queue = asyncio.Queue()
+        tasks = set()
+        started = time.monotonic()
+
+        async def run_one(index, record):
+            try:
+                await results.put(await self._run_one(index, record))
+            finally:
+                in_flight.release()
+
+        async def feed():
+            # Reading the input waits for a free slot, so a huge batch isn't all turned into tasks up front
+            index = 0
+            async for record in _aiter(records):
+                index = record.get("index", index)
+                if index in done:
+                    self.stats.skipped += 1
+                else:
+                    await in_flight.acquire()
+                    task = asyncio.create_task(run_one(index, record))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                index += 1
+
+        feeder = asyncio.create_task(feed())
+        try:
+            while not (feeder.done() and not tasks and results.empty()):
+                getter = asyncio.create_task(results.get())
+                await asyncio.wait({getter, feeder} if not feeder.done() else {getter}, return_when=asyncio.FIRST_COMPLETED)
+                if not getter.done():
+                    getter.cancel()
+                    feeder.result()  # Input errors surface here
+                    continue
+                result = getter.result()
+                if result.ok:
+                    self.stats.completed += 1
+                else:
+                    self.stats.failed += 1
+                if checkpoint:
+                    checkpoint.write(json.dumps(result.to_json()) + "\n")
+                    checkpoint.flush()
+                yield result
+            feeder.result()
+        finally:
+            self.stats.elapsed = time.monotonic() - started
+            feeder.cancel()
+            for task in list(tasks):
+                task.cancel()
+            await asyncio.gather(feeder, *tasks, return_exceptions=True)
+            if checkpoint:
+                checkpoint.close()
+
+
+async def _aiter(records):
+    if hasattr(records, "__aiter__"):
+        async for record in records:
+            yield record
+    else:
+        for record in records:
+            yield record
@@ -0,0 +1,151 @@
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Awaitable, ClassVar, Dict, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    pass
+
+
+@dataclass
+class DeadlineStats:
+    exceeded: int = 0  # deadlines that passed before the work under them was done
+    cancelled: Dict[str, int] = field(default_factory=dict)  # upstream requests abandoned mid-flight, per provider
+
+
+class Deadline:
+    """
+    When the work done for one request (e.g. an Ollama API call) has to be finished by.
+
+    Set it with deadline() around the work, or run()/iterate() it under one. It's kept in a context variable, so
+    everything awaited inside, and every task started from there, sees it without it being passed along: LLM
+    requests are given no more than the time left, retries and polls stop waiting once it's gone, and run() cancels
+    whatever is still going when it passes.
+    """
+
+    stats: ClassVar[DeadlineStats] = DeadlineStats()
+
+    def __init__(self, seconds: float):
+        self.expires = time.monotonic() + seconds
+        self._counted = False
+
+    def exceeded(self) -> DeadlineExceeded:
+        """
+        The error to raise now that the deadline has passed, counting the deadline (once) in stats
+        """
+        if not self._counted:
+            self._counted = True
+            Deadline.stats.exceeded += 1
+        return DeadlineExceeded("Deadline exceeded")
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires
+
+    @staticmethod
+    def current() -> Optional["Deadline"]:
+        return _current.get()
+
+    @staticmethod
+    def cap(timeout: Optional[float]) -> Optional[float]:
+        """
+        timeout, shortened to whatever is left of the current deadline
+        """
+        deadline = _current.get()
+        if deadline is None:
+            return timeout
+        return deadline.remaining() if timeout is None else min(timeout, deadline.remaining())
+
+    @staticmethod
+    def check():
+        """
+        Raises DeadlineExceeded if the current deadline has passed
+        """
+        deadline = _current.get()
+        if deadline is not None and deadline.expired:
+            raise deadline.exceeded()
+
+    @staticmethod
+    async def sleep(delay: float):
+        """
+        asyncio.sleep that wakes up and raises DeadlineExceeded if the current deadline comes first
+        """
+        capped = Deadline.cap(delay)
+        await asyncio.sleep(max(0.0, capped))
+        if capped < delay:
+            Deadline.check()
+
+    @staticmethod
+    async def run(awaitable: Awaitable[T], deadline: Optional["Deadline"] = None) -> T:
+        """
+        Awaits awaitable under deadline (by default the current one), cancelling it and raising DeadlineExceeded if
+        the deadline passes first
+        """
+        deadline = deadline or _current.get()
+        if deadline is None:
+            return await awaitable
+        token = _current.set(deadline)
+        try:
+            return await asyncio.wait_for(awaitable, deadline.remaining())
+        except DeadlineExceeded:
+            raise
+        except asyncio.TimeoutError:
+            if not deadline.expired:
+                raise
+            raise deadline.exceeded() from None
+        finally:
+            _current.reset(token)
+
+    @staticmethod
+    async def iterate(agen: AsyncIterator[T], deadline: Optional["Deadline"] = None) -> AsyncIterator[T]:
+        """
+        Iterates agen under deadline (by default the current one) like run(), closing it if the deadline passes.
+
+        Each step is run under the deadline separately, so this also works where every step runs in its own task
+        (e.g. a generator driven from another thread), where a deadline() around the loop wouldn't carry over
+        """
+        try:
+            while True:
+                try:
+                    item = await Deadline.run(agen.__anext__(), deadline)
+                except StopAsyncIteration:
+                    return
+                yield item
+        finally:
+            await agen.aclose()
+
+    @staticmethod
+    def cancelled(provider: str):
+        """
+        Counts an upstream request to provider that was given up on (cancelled, or out of time) before it finished
+        """
+        Deadline.stats.cancelled[provider] = Deadline.stats.cancelled.get(provider, 0) + 1
+
+
+_current: ContextVar[Optional[Deadline]] = ContextVar("openllms_deadline", default=None)
+
+
+@contextmanager
+def deadline(seconds: Optional[float]) -> Iterator[Optional[Deadline]]:
+    """
+    Sets the deadline for the work done inside to seconds from now. An enclosing deadline that's sooner still wins,
+    None leaves the current one as it is
+    """
+    current = _current.get()
+    if seconds is None or (current is not None and current.remaining() <= seconds):
+        yield current
+        return
+    new = Deadline(seconds)
+    token = _current.set(new)
+    try:
+        yield new
+    finally:
+        _current.reset(token)
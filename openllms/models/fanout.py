@@ -0,0 +1,57 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Iterable, Optional
+
+from openllms.models.llm import LLM, LLMResponse
+
+
+@dataclass
+class FanoutResult:
+    llm: LLM
+    response: Optional[LLMResponse] = None
+    error: Optional[BaseException] = None
+    elapsed: float = 0.0  # seconds spent on the query itself, not waiting for a concurrency slot
+
+    @property
+    def name(self) -> str:
+        return self.llm.name
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+async def fan_out(
+    llms: Iterable[LLM],
+    message: str,
+    concurrency: int = 8,
+    timeout: Optional[float] = 60,
+    **kwargs,
+) -> AsyncIterator[FanoutResult]:
+    """
+    Sends the same message to every llm at once and yields a FanoutResult for each as soon as it finishes, so comparing
+    providers takes as long as the slowest one rather than all of them added up.
+
+    At most `concurrency` queries run at a time and each gets `timeout` seconds. A failing or timed out provider is
+    reported in its result's error instead of raising. Breaking out of the loop early cancels whatever is still running.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(llm: LLM) -> FanoutResult:
+        async with semaphore:
+            start = time.monotonic()
+            try:
+                response = await asyncio.wait_for(llm.query(message, **kwargs), timeout)
+                return FanoutResult(llm, response=response, elapsed=time.monotonic() - start)
+            except Exception as e:
+                return FanoutResult(llm, error=e, elapsed=time.monotonic() - start)
+
+    tasks = [asyncio.create_task(run(llm)) for llm in llms]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
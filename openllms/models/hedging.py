@@ -0,0 +1,130 @@
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, ClassVar, Deque, Dict, List, Optional, Union
+
+from openllms.models.llm import LLM, LLMResponse
+
+# A backup provider, or something that creates one (e.g. checks it out of a SessionPool) when it's first needed
+Backup = Union[LLM, Callable[[], Awaitable[LLM]]]
+
+
+class HedgedLLM(LLM):
+    """
+    Treats several interchangeable providers (e.g. the ChatWith bots, or the Decagon brands) as one LLM to cut tail latency.
+
+    A query goes to the first provider. If it hasn't answered within the hedge delay (the `percentile` of that
+    provider's recent latencies, or `delay` until there's enough history) the query also goes to the next provider,
+    and so on. The first answer wins and every other in-flight query is cancelled, which also stops any polling loops
+    they were running. A provider that fails triggers the next one straight away.
+
+    Backups after the first provider can be given as factories, so a backup client (and its session handshake) is
+    only set up once a hedge actually goes to it. One that's set up but not needed after all, because an answer came
+    in meanwhile, is handed to `release` (e.g. SessionPool.checkin) at the end of the query.
+    """
+    name = "hedged"
+
+    # Recent successful latencies per provider name, shared by every HedgedLLM so history survives between queries
+    _latencies: ClassVar[Dict[str, Deque[float]]] = {}
+    history_size = 100
+    min_samples = 5
+
+    def __init__(
+        self,
+        llms: List[Backup],
+        percentile: float = 0.9,
+        delay: float = 2.0,
+        min_delay: float = 0.1,
+        release: Optional[Callable[[LLM], None]] = None,
+        **kwargs,
+    ):
+        if not llms or not isinstance(llms[0], LLM):
+            raise ValueError("HedgedLLM needs at least one provider, and the first one can't be a factory")
+        super().__init__(llms[0].client, **kwargs)
+        self.llms = llms
+        self.launched: List[LLM] = []  # the providers queries actually went to
+        self.percentile = percentile
+        self.delay = delay
+        self.min_delay = min_delay
+        self.release = release
+        self.hedges = 0  # backup requests launched by this instance
+
+    @classmethod
+    def record(cls, name: str, elapsed: float):
+        cls._latencies.setdefault(name, deque(maxlen=cls.history_size)).append(elapsed)
+
+    def hedge_delay(self, llm: LLM) -> float:
+        samples = sorted(self._latencies.get(llm.name, ()))
+        if len(samples) < self.min_samples:
+            return self.delay
+        index = min(int(len(samples) * self.percentile), len(samples) - 1)
+        return max(samples[index], self.min_delay)
+
+    async def query(self, message: str, **kwargs) -> LLMResponse:
+        message = self.build_prompt(message)
+        pending: Dict[asyncio.Task, LLM] = {}
+        started: Dict[asyncio.Task, float] = {}
+        marks: Dict[asyncio.Task, Dict[str, float]] = {}
+        remaining = list(self.llms)
+        error: Optional[BaseException] = None
+        self.launched = []
+
+        async def launch():
+            nonlocal error
+            while remaining:
+                if not isinstance(remaining[0], LLM):
+                    factory = remaining[0]
+                    try:
+                        llm = await factory()
+                    except Exception as e:
+                        remaining.pop(0)
+                        error = e
+                        self.logger.warning("Couldn't set up a hedge provider: %s", e)
+                        continue
+                    remaining[0] = llm
+                    if any(task.done() for task in pending):
+                        return None  # an answer came in while it was being set up, see to that first
+                llm = remaining.pop(0)
+                self.launched.append(llm)
+                task = asyncio.create_task(llm.query(message, **kwargs))
+                pending[task] = llm
+                started[task] = time.monotonic()
+                marks[task] = llm.timings.snapshot()
+                return llm
+            return None
+
+        try:
+            current = await launch()
+            while pending:
+                wait = self.hedge_delay(current) if remaining else None
+                done, _ = await asyncio.wait(pending, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    # Nobody answered in time, bring in the next provider without giving up on the others
+                    self.hedges += 1
+                    current = await launch() or current
+                    continue
+
+                for task in done:
+                    llm = pending.pop(task)
+                    if task.exception() is None:
+                        self.record(llm.name, time.monotonic() - started[task])
+                        # Report the winner's phases as our own
+                        self.timings.add(llm.timings.since(marks[task]))
+                        return task.result()
+                    error = task.exception()
+                    self.logger.warning("Hedged query to %s failed: %s", llm.name, error)
+
+                if remaining:
+                    current = await launch() or current
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            self.queue_wait = sum(llm.queue_wait for llm in self.launched)
+            if self.release is not None:
+                for llm in remaining:
+                    if isinstance(llm, LLM) and llm not in self.llms:
+                        self.release(llm)  # set up from a factory but never sent anything
+
+        raise error
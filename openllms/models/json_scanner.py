@@ -0,0 +1,79 @@
+import re
+from typing import List
+
+_OBJECT_START = re.compile(r"\{")
+_STRUCTURE = re.compile(r'[{}"]')
+_STRING = re.compile(r'["\\]')
+
+
+class JSONObjectScanner:
+    """
+    Finds balanced {...} objects in text that arrives in pieces, e.g. JSON a model writes in the middle of a reply.
+
+    Feed it text as it comes in and it returns the source of every top-level object completed by it (objects inside
+    an array count as top-level too). Braces inside strings are skipped over properly, and each character is only
+    looked at once, so a reply full of stray braces stays linear rather than backtracking. Whether an object is
+    valid JSON is left to whoever parses it.
+    """
+
+    def __init__(self):
+        self._object: List[str] = []  # pieces of the object being read
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, text: str) -> List[str]:
+        found = []
+        pos = 0
+        while pos < len(text):
+            if self._depth == 0:
+                match = _OBJECT_START.search(text, pos)
+                if match is None:
+                    break
+                pos = match.start()
+                self._depth = 1
+                self._object = []
+                start = pos
+                pos += 1
+            else:
+                start = pos
+            pos = self._scan(text, pos)
+            self._object.append(text[start:pos])
+            if self._depth == 0:
+                found.append("".join(self._object))
+                self._object = []
+        return found
+
+    def _scan(self, text: str, pos: int) -> int:
+        """
+        Moves through the current object until it closes (returning just past its final brace) or the text runs out
+        """
+        while pos < len(text):
+            if self._escaped:
+                self._escaped = False
+                pos += 1
+                continue
+            if self._in_string:
+                match = _STRING.search(text, pos)
+                if match is None:
+                    return len(text)
+                pos = match.end()
+                if match.group() == "\\":
+                    self._escaped = True
+                else:
+                    self._in_string = False
+                continue
+            match = _STRUCTURE.search(text, pos)
+            if match is None:
+                return len(text)
+            pos = match.end()
+            char = match.group()
+            if char == '"':
+                self._in_string = True
+            elif char == "{":
+                self._depth += 1
+            else:
+                self._depth -= 1
+                if self._depth == 0:
+                    return pos
+        return pos
@@ -1,13 +1,38 @@
+import asyncio
+import json
 import logging
 from abc import ABC, abstractmethod
+from contextlib import AsyncExitStack, asynccontextmanager
 import aiohttp
-from dataclasses import dataclass
-from typing import Optional
+from yarl import URL
+from dataclasses import dataclass, field, InitVar
+from typing import Any, AsyncIterator, ClassVar, Optional, Tuple, Union
 
-@dataclass
+from openllms.models.deadline import Deadline, DeadlineExceeded
+from openllms.models.rate_limit import RateLimits
+from openllms.models.resilience import CircuitBreakers, RetryPolicy, is_failure
+from openllms.models.timing import PhaseTimer
+from openllms.models.transport import Transport
+
+RAW_RETENTIONS = ("none", "lazy", "full")
+
+
+@dataclass(slots=True)
 class LLMResponse(ABC):
+    """
+    Responses use __slots__, and how much of the raw provider JSON they hold on to is up to raw_retention:
+    "full" keeps the decoded JSON (a body given as bytes is only decoded, once, the first time .raw is read), "lazy"
+    keeps it as compact JSON bytes that .raw decodes on every access and "none" drops it (.raw is then {}). Set it on
+    LLMResponse for every provider or on a subclass for one.
+    """
     message: str
-    raw: dict
+    raw: InitVar[Union[dict, bytes, None]]
+    _raw: Any = field(init=False, default=None, repr=False, compare=False)
+
+    raw_retention: ClassVar[str] = "full"
+
+    def __post_init__(self, raw):
+        self.retain(self.raw_retention, raw)
 
     @classmethod
     @abstractmethod
@@ -18,16 +43,52 @@ class LLMResponse(ABC):
         """
         pass
 
+    def retain(self, retention: str, raw: Union[dict, bytes, None] = None):
+        """
+        Switches this response to another raw_retention, e.g. to slim down results that are being kept around
+        """
+        if retention not in RAW_RETENTIONS:
+            raise ValueError(f"raw_retention must be one of {RAW_RETENTIONS}, not {retention!r}")
+        raw = self._raw if raw is None else raw
+        if retention == "none" or raw is None:
+            self._raw = None
+        elif retention == "lazy":
+            self._raw = bytes(raw) if isinstance(raw, bytes) else json.dumps(raw, separators=(",", ":")).encode()
+        else:
+            self._raw = _Undecoded(raw) if isinstance(raw, bytes) else raw
+
+
+class _Undecoded(bytes):
+    """
+    A body kept under "full" retention that hasn't been read yet, decoded in place by .raw the first time it is
+    """
+
+
+def _raw(self) -> dict:
+    if isinstance(self._raw, _Undecoded):
+        self._raw = json.loads(self._raw)
+    return json.loads(self._raw) if isinstance(self._raw, bytes) else (self._raw if self._raw is not None else {})
+
+
+# Set after the class is built, a property in the class body would be taken as the raw InitVar's default
+LLMResponse.raw = property(_raw, doc="The provider's JSON, as far as raw_retention kept it")
+
 class LLM(ABC):
     name: str
     prepend_prompt: str
     append_prompt: str
+    # True when the provider remembers earlier turns of a session, so follow-up queries only need the new message
+    keeps_history: bool = False
+    # How failed requests to this provider are retried, subclasses can swap in their own
+    retry_policy: ClassVar[RetryPolicy] = RetryPolicy()
 
-    def __init__(self, client: aiohttp.ClientSession, prepend_prompt="", append_prompt="", logger=None):
+    def __init__(self, client: "aiohttp.ClientSession | Transport", prepend_prompt="", append_prompt="", logger=None):
         self.client = client
         self.logger = logger or logging.getLogger(__name__)
         self.prepend_prompt = prepend_prompt
         self.append_prompt = append_prompt
+        self.queue_wait = 0.0 # seconds this client's requests spent waiting on rate/concurrency limits
+        self.timings = PhaseTimer() # where this client's time goes: auth, queue, send, receive, poll, parse, retry
 
     def build_prompt(self, message: str) -> str:
         """
@@ -35,13 +96,97 @@ class LLM(ABC):
         """
         return f"{self.prepend_prompt}{message}{self.append_prompt}"
 
+    @asynccontextmanager
+    async def _request(self, method: str, url: str, idempotent: Optional[bool] = None, **kwargs):
+        """
+        Every request to a provider goes through here (directly, or via _get/_post) so the provider's and host's
+        rate/concurrency limits apply. Use it like client.request when you need the raw response (e.g. to stream it).
+        self.client is normally the shared ClientSession, or a Transport to record, replay or fake the traffic
+
+        Connection errors and 5xx/429 answers are retried with jittered backoff, but only for idempotent requests
+        (GET etc, or idempotent=True) unless the request never left. Outcomes feed the provider's breaker for the host,
+        which raises CircuitOpenError straight away while it's open rather than piling more requests onto a dead backend
+
+        Under a Deadline the request (body included) gets no more than the time left, and isn't retried when the
+        deadline would pass before the retry. Requests cut off by cancellation or the deadline are counted in
+        Deadline.stats
+        """
+        policy = self.retry_policy
+        breaker = CircuitBreakers.breaker(self.name, URL(url).host or "")
+        attempt = 1
+        own_timeout = "timeout" in kwargs
+        while True:
+            Deadline.check()
+            remaining = Deadline.cap(None)
+            if remaining is not None and not own_timeout:
+                kwargs["timeout"] = aiohttp.ClientTimeout(total=remaining)
+            breaker.before_request()
+            retry_delay = None
+            async with AsyncExitStack() as stack:
+                try:
+                    with self.timings.phase("queue"):
+                        self.queue_wait += await stack.enter_async_context(RateLimits.slot(self.name, url))
+                    # Up to the response headers, i.e. time to first byte
+                    with self.timings.phase("send"):
+                        resp = await stack.enter_async_context(self.client.request(method, url, **kwargs))
+                except BaseException as e:
+                    if self._given_up(e):
+                        breaker.cancel()
+                        self._raise_expired(e)
+                        raise
+                    breaker.record(not is_failure(error=e))
+                    retry_delay = policy.delay(attempt)
+                    if (attempt >= policy.attempts or not policy.can_retry(method, idempotent, error=e)
+                            or Deadline.cap(retry_delay) < retry_delay):
+                        raise
+                    self.logger.warning("%s %s failed (%s), retrying", method, url, e)
+                else:
+                    retry_delay = policy.delay(attempt, resp.headers.get("Retry-After"))
+                    if (attempt < policy.attempts and policy.can_retry(method, idempotent, status=resp.status)
+                            and Deadline.cap(retry_delay) >= retry_delay):
+                        breaker.record(not is_failure(resp.status))
+                        self.logger.warning("%s %s answered %s, retrying", method, url, resp.status)
+                    else:
+                        try:
+                            with self.timings.phase("receive"):
+                                yield resp
+                        except BaseException as e:
+                            if self._given_up(e):
+                                breaker.cancel()
+                                self._raise_expired(e)
+                            else:
+                                breaker.record(not is_failure(resp.status, e))
+                            raise
+                        breaker.record(not is_failure(resp.status))
+                        return
+            with self.timings.phase("retry"):
+                await asyncio.sleep(retry_delay)
+            attempt += 1
+
+    def _given_up(self, error: BaseException) -> bool:
+        """
+        Whether a request failed because we stopped waiting on it (cancelled, or out of time) rather than because the
+        provider failed, counting it if so. Those say nothing about the provider's health
+        """
+        deadline = Deadline.current()
+        if isinstance(error, Exception) and not (isinstance(error, asyncio.TimeoutError) and deadline and deadline.expired):
+            return False
+        Deadline.cancelled(self.name)
+        return True
+
+    @staticmethod
+    def _raise_expired(error: BaseException):
+        # aiohttp's timeout, set from the deadline, is reported as the deadline passing
+        if isinstance(error, asyncio.TimeoutError) and not isinstance(error, DeadlineExceeded):
+            raise Deadline.current().exceeded() from error
+
     async def _get(self, url: str, **kwargs):
-        async with self.client.get(url, **kwargs) as resp:
+        async with self._request("GET", url, **kwargs) as resp:
             resp.raise_for_status()
             return await resp.json()
 
     async def _post(self, url: str, **kwargs):
-        async with self.client.post(url, **kwargs) as resp:
+        async with self._request("POST", url, **kwargs) as resp:
             resp.raise_for_status()
             return await resp.json()
 
@@ -49,6 +194,15 @@ class LLM(ABC):
     async def query(self, **params) -> LLMResponse:
         pass
 
+    async def stream(self, *args, **kwargs) -> AsyncIterator[str]:
+        """
+        Yields the response text in pieces (deltas) as the provider generates it, joining them gives the full message.
+
+        Providers that can't stream just yield the whole query() message once, subclasses that can should override this.
+        """
+        resp = await self.query(*args, **kwargs)
+        yield resp.message
+
 class AuthenticatedClient(LLM, ABC):
     """
     Some clients require some form of anonymous authentication.
@@ -56,6 +210,8 @@ class AuthenticatedClient(LLM, ABC):
     (Some clients require you to login to their website not anonymously, but that's out of scope)
     """
     session_id: Optional[str] = None
+    # Attributes that make up the upstream session, saved by session_state() and put back by restore_session()
+    session_fields: ClassVar[Tuple[str, ...]] = ("session_id",)
 
     def __init__(
         self,
@@ -78,5 +234,19 @@ class AuthenticatedClient(LLM, ABC):
         Sets the session_id by calling fetch_session_id on the client
         """
         if self.session_id is None:
-            self.session_id = await self.fetch_session_id()
+            with self.timings.phase("auth"):
+                self.session_id = await self.fetch_session_id()
 
+    def session_state(self) -> dict:
+        """
+        The upstream session as JSON-able state, e.g. to keep in a SessionStore and resume after a restart
+        """
+        return {name: getattr(self, name) for name in self.session_fields}
+
+    def restore_session(self, state: dict):
+        """
+        Carries on the session session_state() returned, so authenticate() has nothing left to do
+        """
+        for name in self.session_fields:
+            if name in state:
+                setattr(self, name, state[name])
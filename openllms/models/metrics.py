@@ -0,0 +1,120 @@
+import asyncio
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in labels.values())
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + "}"
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name: str, labels: Dict[str, str]) -> List[str]:
+        out = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ["+Inf"], self.counts):
+            cumulative += count
+            out.append(f"{name}_bucket{_labels({**labels, 'le': str(bound)})} {cumulative}")
+        out.append(f"{name}_sum{_labels(labels)} {self.sum}")
+        out.append(f"{name}_count{_labels(labels)} {self.count}")
+        return out
+
+
+class Metrics:
+    """
+    Per-model request latency and phase histograms, error and cancellation counters and in-flight gauges, rendered in
+    the Prometheus text exposition format
+    """
+
+    BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+    def __init__(self, buckets: Sequence[float] = BUCKETS):
+        self.buckets = buckets
+        self.latency: Dict[str, Histogram] = {}
+        self.phases: Dict[Tuple[str, str], Histogram] = {}
+        self.errors: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.in_flight: Dict[str, int] = defaultdict(int)
+        self.cancelled: Dict[str, int] = defaultdict(int)
+
+    @contextmanager
+    def track(self, model: str) -> Iterator[None]:
+        """
+        Times one request to model, counting it as in flight while it runs and as an error if it raises (or as
+        cancelled, e.g. when the client disconnected)
+        """
+        self.in_flight[model] += 1
+        start = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            self.errors[(model, type(e).__name__)] += 1
+            raise
+        except asyncio.CancelledError:
+            self.cancelled[model] += 1
+            raise
+        finally:
+            self.in_flight[model] -= 1
+            self.observe(model, time.monotonic() - start)
+
+    def observe(self, model: str, seconds: float):
+        self.latency.setdefault(model, Histogram(self.buckets)).observe(seconds)
+
+    def observe_phases(self, model: str, phases: Dict[str, float]):
+        for phase, seconds in phases.items():
+            self.phases.setdefault((model, phase), Histogram(self.buckets)).observe(seconds)
+
+    def error(self, model: str, error: BaseException):
+        self.errors[(model, type(error).__name__)] += 1
+
+    def render(self) -> str:
+        lines = [
+            "# HELP openllms_request_duration_seconds Time taken to answer a request, per model",
+            "# TYPE openllms_request_duration_seconds histogram",
+        ]
+        for model, histogram in sorted(self.latency.items()):
+            lines += histogram.lines("openllms_request_duration_seconds", {"model": model})
+
+        lines += [
+            "# HELP openllms_phase_duration_seconds Time requests spent in each phase (auth, queue, send, receive, poll, parse)",
+            "# TYPE openllms_phase_duration_seconds histogram",
+        ]
+        for (model, phase), histogram in sorted(self.phases.items()):
+            lines += histogram.lines("openllms_phase_duration_seconds", {"model": model, "phase": phase})
+
+        lines += [
+            "# HELP openllms_request_errors_total Requests that failed, per model and error type",
+            "# TYPE openllms_request_errors_total counter",
+        ]
+        for (model, error), count in sorted(self.errors.items()):
+            lines.append(f"openllms_request_errors_total{_labels({'model': model, 'error': error})} {count}")
+
+        lines += [
+            "# HELP openllms_requests_cancelled_total Requests abandoned before they were answered, per model",
+            "# TYPE openllms_requests_cancelled_total counter",
+        ]
+        for model, count in sorted(self.cancelled.items()):
+            lines.append(f"openllms_requests_cancelled_total{_labels({'model': model})} {count}")
+
+        lines += [
+            "# HELP openllms_requests_in_flight Requests currently being answered, per model",
+            "# TYPE openllms_requests_in_flight gauge",
+        ]
+        for model, count in sorted(self.in_flight.items()):
+            lines.append(f"openllms_requests_in_flight{_labels({'model': model})} {count}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,154 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Mapping, Optional
+
+Listener = Callable[[Mapping[str, dict]], None]
+
+
+class ModelRegistry(Mapping[str, dict]):
+    """
+    Named model definitions (e.g. ollama_server's derived models), optionally kept in a SQLite file so they survive
+    restarts and are shared by every process using the same path.
+
+    Reads never touch the database or take a lock: they go to an in-process snapshot that's swapped out whole
+    (never changed in place) whenever the models change. create() and delete() are single transactions. A watcher
+    thread notices commits from other processes through SQLite's data_version, reloads the snapshot and calls the
+    subscribed listeners with it, as does a change made by this process. Listeners are called one notification at a
+    time, always with the latest snapshot, so the last call they get is for the current models.
+    """
+
+    def __init__(self, path: Optional[str] = None, poll_interval: float = 1.0, logger=None):
+        self.logger = logger or logging.getLogger(__name__)
+        self._models: Dict[str, dict] = {}
+        self._listeners: List[Listener] = []
+        self._lock = threading.Lock()
+        self._notify_lock = threading.RLock()  # reentrant, a listener may itself create or delete a model
+        self._db: Optional[sqlite3.Connection] = None
+        self._data_version = None
+        self._closed = threading.Event()
+        if path:
+            self.open(path, poll_interval)
+
+    def __getitem__(self, name: str) -> dict:
+        return self._models[name]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._models)
+
+    def __len__(self) -> int:
+        return len(self._models)
+
+    def __contains__(self, name) -> bool:
+        return name in self._models
+
+    def get(self, name: str, default=None):
+        return self._models.get(name, default)
+
+    def open(self, path: str, poll_interval: float = 1.0):
+        """
+        Switches to the SQLite file at path. Models created in memory before this are written to it
+        """
+        db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("CREATE TABLE IF NOT EXISTS models (name TEXT PRIMARY KEY, definition TEXT, modified REAL)")
+        with self._lock:
+            self._db = db
+            for name, definition in self._models.items():
+                self._write("INSERT OR IGNORE INTO models VALUES (?, ?, ?)", self._row(name, definition))
+            self._reload()
+        self._notify()
+        if poll_interval:
+            threading.Thread(target=self._watch, args=(poll_interval,), daemon=True, name="model-registry").start()
+
+    def subscribe(self, listener: Listener):
+        self._listeners.append(listener)
+
+    def create(self, name: str, definition: dict, replace: bool = True) -> bool:
+        """
+        Adds (or with replace, overwrites) a model. Returns False if it already existed and replace is off
+        """
+        definition = {**definition, "modified": time.time()}
+        with self._lock:
+            if self._db is None:
+                if name in self._models and not replace:
+                    return False
+                self._models = {**self._models, name: definition}
+            else:
+                verb = "INSERT OR REPLACE" if replace else "INSERT OR IGNORE"
+                if not self._write(f"{verb} INTO models VALUES (?, ?, ?)", self._row(name, definition)):
+                    return False
+                self._reload()
+        self._notify()
+        return True
+
+    def delete(self, name: str) -> bool:
+        """
+        Removes a model, returns whether it was there
+        """
+        with self._lock:
+            if self._db is None:
+                if name not in self._models:
+                    return False
+                self._models = {k: v for k, v in self._models.items() if k != name}
+            else:
+                if not self._write("DELETE FROM models WHERE name = ?", (name,)):
+                    return False
+                self._reload()
+        self._notify()
+        return True
+
+    def refresh(self) -> bool:
+        """
+        Reloads if another process changed the models since the last look, returns whether it did
+        """
+        with self._lock:
+            if self._db is None:
+                return False
+            version = self._db.execute("PRAGMA data_version").fetchone()[0]
+            if version == self._data_version:
+                return False
+            self._reload()
+        self._notify()
+        return True
+
+    def close(self):
+        self._closed.set()
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    @staticmethod
+    def _row(name: str, definition: dict):
+        return name, json.dumps(definition), definition.get("modified", time.time())
+
+    def _write(self, sql: str, params) -> bool:
+        # One statement per change, so it's atomic without an explicit transaction
+        return self._db.execute(sql, params).rowcount > 0
+
+    def _reload(self):
+        rows = self._db.execute("SELECT name, definition FROM models ORDER BY modified, name").fetchall()
+        self._models = {name: json.loads(definition) for name, definition in rows}
+        self._data_version = self._db.execute("PRAGMA data_version").fetchone()[0]
+
+    def _notify(self):
+        with self._notify_lock:
+            # Read under the lock, so a notification that was overtaken can't hand out an older snapshot last
+            models = self._models
+            for listener in self._listeners:
+                try:
+                    listener(models)
+                except Exception as e:
+                    self.logger.warning("Model registry listener failed: %s", e)
+
+    def _watch(self, poll_interval: float):
+        while not self._closed.wait(poll_interval):
+            try:
+                self.refresh()
+            except sqlite3.Error as e:
+                if self._closed.is_set():
+                    return
+                self.logger.warning("Couldn't check the model registry for changes: %s", e)
@@ -0,0 +1,50 @@
+from typing import AsyncIterator, List
+
+
+class LineSplitter:
+    """
+    Incremental newline-delimited splitter. Feed it bytes as they arrive off the wire and it returns the complete,
+    non-blank lines (without their line ending) while holding on to a partial line until the rest shows up. Bytes
+    already searched for a newline aren't searched again, so a long line arriving in many pieces stays linear.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._scanned = 0  # how much of the buffer is known not to contain a newline
+
+    def feed(self, chunk: bytes) -> List[bytes]:
+        self._buffer += chunk
+        lines = []
+        start = 0
+        while True:
+            end = self._buffer.find(b"\n", max(start, self._scanned))
+            if end == -1:
+                break
+            line = bytes(self._buffer[start:end]).strip()
+            if line:
+                lines.append(line)
+            start = end + 1
+        del self._buffer[:start]
+        self._scanned = len(self._buffer)
+        return lines
+
+    def close(self) -> List[bytes]:
+        """
+        Flushes whatever is left once the stream ends (a last line without its trailing newline)
+        """
+        line = bytes(self._buffer).strip()
+        self._buffer.clear()
+        self._scanned = 0
+        return [line] if line else []
+
+
+async def iter_lines(content) -> AsyncIterator[bytes]:
+    """
+    Yields the lines of an aiohttp response body (response.content) as they arrive
+    """
+    splitter = LineSplitter()
+    async for chunk in content.iter_any():
+        for line in splitter.feed(chunk):
+            yield line
+    for line in splitter.close():
+        yield line
@@ -0,0 +1,150 @@
+import time
+from dataclasses import dataclass, asdict
+from typing import Any, Awaitable, Callable, ClassVar, Dict, Optional, Tuple
+
+from openllms.models.deadline import Deadline
+
+
+@dataclass
+class PollStats:
+    polls: int = 0
+    wasted_polls: int = 0  # polls that came back without the answer
+    completions: int = 0
+    timeouts: int = 0
+
+
+class AdaptivePoller:
+    """
+    Polls a provider for an answer around the time it's predicted to be ready, instead of on a fixed interval.
+
+    The first poll happens quickly (short answers are often ready almost immediately), at the predicted completion time
+    if that's sooner. The prediction is an EWMA of how long this provider took on previous answers, the second poll is
+    scheduled at it and after that the gap between polls backs off exponentially up to max_interval.
+
+    A poll only shows an answer became ready somewhere since the previous one, so the middle of that span is what's
+    learned. An answer found by the first poll was ready by the time that poll was sent: the middle of that span is
+    learned if it was sent before the prediction, otherwise the prediction is nudged down (by first_hit_shrink).
+    Taking the poll time as the completion time instead would keep it from ever getting below the first poll's delay.
+
+    Pollers are meant to be shared per provider (see for_provider) so the prediction is learned across queries.
+    """
+
+    _providers: ClassVar[Dict[str, "AdaptivePoller"]] = {}
+
+    def __init__(
+        self,
+        name: str = "",
+        first_delay: float = 0.5,
+        initial_estimate: float = 3.0,
+        alpha: float = 0.3,
+        min_interval: float = 0.25,
+        max_interval: float = 8.0,
+        backoff: float = 1.6,
+        first_hit_shrink: float = 0.9,
+    ):
+        self.name = name
+        self.first_delay = first_delay
+        self.estimate = initial_estimate
+        self.alpha = alpha
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.first_hit_shrink = first_hit_shrink
+        self.stats = PollStats()
+
+    @classmethod
+    def for_provider(cls, name: str, **kwargs) -> "AdaptivePoller":
+        """
+        Returns the poller shared by every client of the named provider, creating it on first use
+        """
+        if name not in cls._providers:
+            cls._providers[name] = cls(name=name, **kwargs)
+        return cls._providers[name]
+
+    @classmethod
+    def all_stats(cls) -> Dict[str, dict]:
+        return {name: poller.snapshot() for name, poller in cls._providers.items()}
+
+    def snapshot(self) -> dict:
+        return {**asdict(self.stats), "estimate": self.estimate}
+
+    def observe(self, elapsed: float):
+        """
+        Folds a measured completion time into the prediction
+        """
+        self.estimate = self.alpha * elapsed + (1 - self.alpha) * self.estimate
+
+    def next_delay(self, attempt: int, elapsed: float, late: int, max_interval: float) -> float:
+        """
+        How long to wait before poll number `attempt` (0 based), `elapsed` seconds after the request was sent and after
+        `late` polls already missed past the predicted completion time
+        """
+        if attempt == 0:
+            if self.stats.completions:
+                return min(self.first_delay, max(0.0, self.estimate - elapsed), max_interval)
+            return min(self.first_delay, max_interval)
+
+        until_ready = self.estimate - elapsed
+        if until_ready > self.min_interval:
+            # Still ahead of the prediction, wait for it (but never longer than max_interval in one go)
+            return min(until_ready, max_interval)
+
+        # Past the prediction, back off from a gap proportional to how long answers usually take
+        base = max(self.min_interval, self.estimate * 0.1)
+        return min(base * self.backoff ** late, max_interval)
+
+    async def poll(
+        self,
+        fetch: Callable[[], Awaitable[Any]],
+        find: Callable[[Any], Optional[Tuple[Any, Any]]],
+        last_seen_id: Any = None,
+        timeout: float = 60,
+        max_interval: Optional[float] = None,
+        started: Optional[float] = None,
+    ) -> Tuple[Any, Any]:
+        """
+        Repeatedly calls fetch() until find() locates the answer and returns it as (message_id, message).
+
+        find(result) should return (message_id, message) for the newest reply or None if there isn't one yet. A reply whose
+        id equals last_seen_id is the previous answer, so it's treated as not ready yet.
+        `started` is the time.monotonic() the request was sent at, if it was before this was called.
+        """
+        max_interval = max_interval or self.max_interval
+        start = started if started is not None else time.monotonic()
+        attempt = 0
+        late = 0
+        last_miss = None
+
+        while True:
+            elapsed = time.monotonic() - start
+            remaining = timeout - elapsed
+            delay = self.next_delay(attempt, elapsed, late, max_interval)
+            # Under a Deadline this wakes up early (raising DeadlineExceeded) if the request runs out of time first
+            await Deadline.sleep(max(0.0, min(delay, remaining)))
+
+            polled = time.monotonic() - start
+            self.stats.polls += 1
+            found = find(await fetch())
+            elapsed = time.monotonic() - start
+
+            if found is not None and (last_seen_id is None or found[0] != last_seen_id):
+                self.stats.completions += 1
+                if last_miss is None and polled < self.estimate:
+                    # Ready sooner than predicted, somewhere since the request was sent
+                    self.observe(polled / 2)
+                elif last_miss is None:
+                    self.observe(polled * self.first_hit_shrink)
+                else:
+                    # The answer became ready somewhere between the last miss and now
+                    self.observe((last_miss + elapsed) / 2)
+                return found
+
+            self.stats.wasted_polls += 1
+            last_miss = elapsed
+            attempt += 1
+            if attempt > 1 and elapsed >= self.estimate:
+                late += 1
+
+            if elapsed >= timeout:
+                self.stats.timeouts += 1
+                raise TimeoutError(f"Timed out waiting for {self.name or 'provider'} response")
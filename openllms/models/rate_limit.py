@@ -0,0 +1,138 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, asdict
+from typing import AsyncIterator, ClassVar, Dict, Optional
+
+from yarl import URL
+
+
+@dataclass
+class LimitSettings:
+    rate: Optional[float] = None  # requests per second, None for no rate limit
+    burst: Optional[int] = None  # requests allowed back to back before the rate kicks in, defaults to max(1, rate)
+    concurrency: Optional[int] = None  # requests in flight at once, None for no limit
+
+
+@dataclass
+class LimitStats:
+    requests: int = 0
+    in_flight: int = 0
+    queue_time: float = 0.0  # total seconds requests spent waiting for a slot
+    max_queue_time: float = 0.0
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        # Waiters queue on the lock so tokens are handed out first come first served
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class Limit:
+    """
+    A token bucket plus a concurrency semaphore for one provider or host
+    """
+
+    def __init__(self, settings: LimitSettings):
+        self.settings = settings
+        self.bucket = None
+        if settings.rate:
+            self.bucket = TokenBucket(settings.rate, settings.burst or max(1, int(settings.rate)))
+        self.semaphore = asyncio.Semaphore(settings.concurrency) if settings.concurrency else None
+        self.stats = LimitStats()
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[float]:
+        """
+        Waits until a request is allowed and holds a concurrency slot for as long as the block runs.
+        Yields the seconds spent waiting
+        """
+        start = time.monotonic()
+        if self.bucket is not None:
+            await self.bucket.acquire()
+        if self.semaphore is not None:
+            await self.semaphore.acquire()
+        waited = time.monotonic() - start
+
+        self.stats.requests += 1
+        self.stats.in_flight += 1
+        self.stats.queue_time += waited
+        self.stats.max_queue_time = max(self.stats.max_queue_time, waited)
+        try:
+            yield waited
+        finally:
+            self.stats.in_flight -= 1
+            if self.semaphore is not None:
+                self.semaphore.release()
+
+
+class RateLimits:
+    """
+    Process wide rate and concurrency limits, configured per provider name (LLM.name) and/or per host.
+
+    Every request an LLM makes has to get through both its provider's limit and the limit of the host it's going to,
+    so e.g. all of the Decagon brands can be kept under one budget for api.decagon.ai. Nothing is limited unless it's
+    been configured.
+    """
+
+    _settings: ClassVar[Dict[str, LimitSettings]] = {}
+    _limits: ClassVar[Dict[str, Limit]] = {}
+
+    @classmethod
+    def configure(cls, key: str, rate: Optional[float] = None, burst: Optional[int] = None,
+                  concurrency: Optional[int] = None):
+        """
+        Sets the limits for a provider name or a host (e.g. "substack" or "api.decagon.ai")
+        """
+        cls._settings[key] = LimitSettings(rate=rate, burst=burst, concurrency=concurrency)
+        cls._limits.pop(key, None)
+
+    @classmethod
+    def limit(cls, key: str) -> Optional[Limit]:
+        if key not in cls._settings:
+            return None
+        if key not in cls._limits:
+            cls._limits[key] = Limit(cls._settings[key])
+        return cls._limits[key]
+
+    @classmethod
+    @asynccontextmanager
+    async def slot(cls, provider: str, url: str) -> AsyncIterator[float]:
+        """
+        Holds the provider's and the host's slots for the duration of a request, yields the total seconds waited
+        """
+        provider_limit = cls.limit(provider)
+        host_limit = cls.limit(URL(url).host or "")
+        async with cls._slot(provider_limit) as provider_wait, cls._slot(host_limit) as host_wait:
+            yield provider_wait + host_wait
+
+    @staticmethod
+    @asynccontextmanager
+    async def _slot(limit: Optional[Limit]) -> AsyncIterator[float]:
+        if limit is None:
+            yield 0.0
+            return
+        async with limit.slot() as waited:
+            yield waited
+
+    @classmethod
+    def snapshot(cls) -> Dict[str, dict]:
+        return {
+            key: {**asdict(cls._settings[key]), **asdict(limit.stats)}
+            for key, limit in cls._limits.items()
+        }
@@ -0,0 +1,196 @@
+import asyncio
+import random
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import ClassVar, Deque, Dict, FrozenSet, Optional, Tuple
+
+import aiohttp
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of sending a request while a provider's circuit breaker is open
+    """
+
+    def __init__(self, key: str, retry_in: float):
+        super().__init__(f"{key} is failing, not sending requests for another {retry_in:.1f}s")
+        self.key = key
+        self.retry_in = retry_in
+
+
+@dataclass
+class RetryPolicy:
+    attempts: int = 3  # total tries, including the first
+    base_delay: float = 0.25
+    max_delay: float = 4.0
+    # Statuses worth another try. 429 is always safe to retry since the request was turned away, not processed
+    retry_statuses: FrozenSet[int] = frozenset({429, 500, 502, 503, 504})
+    idempotent_methods: FrozenSet[str] = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+
+    def delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """
+        Seconds to wait before retry number `attempt` (starting at 1): full jitter exponential backoff, or the
+        server's Retry-After if it sent one
+        """
+        if retry_after:
+            try:
+                return min(float(retry_after), self.max_delay)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def can_retry(self, method: str, idempotent: Optional[bool], status: Optional[int] = None,
+                  error: Optional[BaseException] = None) -> bool:
+        if idempotent is None:
+            idempotent = method.upper() in self.idempotent_methods
+        if status is not None:
+            return status in self.retry_statuses and (idempotent or status == 429)
+        if not isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError)):
+            return False
+        # A request that never connected was never sent, so even a POST can go again
+        return idempotent or isinstance(error, aiohttp.ClientConnectorError)
+
+
+@dataclass
+class BreakerSettings:
+    window: int = 20  # most recent requests the failure rate is worked out over
+    min_requests: int = 5  # don't trip on the first couple of failures
+    failure_rate: float = 0.5
+    reset_timeout: float = 30  # seconds to stay open before letting a probe request through
+
+
+@dataclass
+class BreakerStats:
+    state: str = "closed"
+    failures: int = 0
+    successes: int = 0
+    rejected: int = 0  # requests failed fast while open
+    opened: int = 0  # times the breaker has tripped
+
+
+class CircuitBreaker:
+    """
+    closed: requests go through and their outcomes are recorded.
+    open: once the failure rate over the window passes the threshold, requests fail fast with CircuitOpenError.
+    half_open: after reset_timeout a single probe is let through, success closes the breaker and failure reopens it.
+    """
+
+    def __init__(self, key: str, settings: BreakerSettings):
+        self.key = key
+        self.settings = settings
+        self.outcomes: Deque[bool] = deque(maxlen=settings.window)
+        self.opened_at = 0.0
+        self.probing = False
+        self.stats = BreakerStats()
+
+    @property
+    def state(self) -> str:
+        return self.stats.state
+
+    def before_request(self):
+        if self.state == "open":
+            retry_in = self.opened_at + self.settings.reset_timeout - time.monotonic()
+            if retry_in > 0:
+                self.stats.rejected += 1
+                raise CircuitOpenError(self.key, retry_in)
+            self.stats.state = "half_open"
+        if self.state == "half_open":
+            if self.probing:
+                self.stats.rejected += 1
+                raise CircuitOpenError(self.key, 0)
+            self.probing = True
+
+    def record(self, ok: bool):
+        self.probing = False
+        if ok:
+            self.stats.successes += 1
+        else:
+            self.stats.failures += 1
+
+        if self.state == "half_open":
+            if ok:
+                self.outcomes.clear()
+                self.stats.state = "closed"
+            else:
+                self._trip()
+            return
+
+        self.outcomes.append(ok)
+        failures = self.outcomes.count(False)
+        if (len(self.outcomes) >= self.settings.min_requests
+                and failures / len(self.outcomes) >= self.settings.failure_rate):
+            self._trip()
+
+    def cancel(self):
+        """
+        The request was abandoned (e.g. cancelled) before it had an outcome
+        """
+        self.probing = False
+
+    def _trip(self):
+        self.stats.state = "open"
+        self.stats.opened += 1
+        self.opened_at = time.monotonic()
+        self.outcomes.clear()
+
+    def snapshot(self) -> dict:
+        out = {"state": self.state, **{k: v for k, v in vars(self.stats).items() if k != "state"}}
+        if self.state == "open":
+            out["retry_in"] = max(0.0, self.opened_at + self.settings.reset_timeout - time.monotonic())
+        return out
+
+
+class CircuitBreakers:
+    """
+    Process wide circuit breakers, one per provider name (LLM.name) and host, so one of a provider's backends failing
+    (e.g. its auth host) doesn't cut off the others. Every provider gets the default settings unless configured
+    otherwise.
+    """
+
+    default: ClassVar[BreakerSettings] = BreakerSettings()
+    _settings: ClassVar[Dict[str, BreakerSettings]] = {}
+    _breakers: ClassVar[Dict[Tuple[str, str], CircuitBreaker]] = {}
+
+    @classmethod
+    def configure(cls, key: Optional[str] = None, **settings):
+        """
+        Changes the breaker settings for one provider (on every host), or the defaults when no key is given
+        """
+        if key is None:
+            cls.default = BreakerSettings(**settings)
+            cls._breakers.clear()
+        else:
+            cls._settings[key] = BreakerSettings(**settings)
+            for provider, host in list(cls._breakers):
+                if provider == key:
+                    del cls._breakers[provider, host]
+
+    @classmethod
+    def breaker(cls, provider: str, host: str) -> CircuitBreaker:
+        key = (provider, host)
+        if key not in cls._breakers:
+            cls._breakers[key] = CircuitBreaker(f"{provider} ({host})", cls._settings.get(provider, cls.default))
+        return cls._breakers[key]
+
+    @classmethod
+    def snapshot(cls) -> Dict[str, Dict[str, dict]]:
+        """
+        Every breaker's state, by provider and then host
+        """
+        out: Dict[str, Dict[str, dict]] = {}
+        for (provider, host), breaker in cls._breakers.items():
+            out.setdefault(provider, {})[host] = breaker.snapshot()
+        return out
+
+
+def is_failure(status: Optional[int] = None, error: Optional[BaseException] = None) -> bool:
+    """
+    Whether an outcome says something about the provider's health. 4xx answers (other than 429) are our fault, not
+    theirs, any other error counts, e.g. a timeout or a body that doesn't parse
+    """
+    if isinstance(error, aiohttp.ClientResponseError):
+        status = error.status
+    if status is not None and 400 <= status < 500 and status != 429:
+        return False
+    return error is not None or (status is not None and (status >= 500 or status == 429))
@@ -0,0 +1,174 @@
+import asyncio
+import hashlib
+import importlib
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, asdict
+from typing import Dict, Optional
+
+from openllms.models.cache import LRUCache
+from openllms.models.llm import LLM, LLMResponse
+
+
+@dataclass(slots=True)
+class TextResponse(LLMResponse):
+    """
+    A response that's only known as text, e.g. one put together from streamed deltas
+    """
+
+    @classmethod
+    def from_raw(cls, data: dict) -> "TextResponse":
+        return cls(message=data.get("message", ""), raw=data)
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    stores: int = 0
+
+
+class CacheBackend(ABC):
+    @abstractmethod
+    async def get(self, key: str) -> Optional[LLMResponse]:
+        pass
+
+    @abstractmethod
+    async def set(self, key: str, response: LLMResponse, ttl: Optional[float]):
+        pass
+
+    def close(self):
+        pass
+
+
+class MemoryCacheBackend(CacheBackend):
+    """
+    Keeps responses in a size-bounded LRU in this process
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.entries = LRUCache(max_entries=max_entries)
+
+    async def get(self, key):
+        return self.entries.get(key)
+
+    async def set(self, key, response, ttl):
+        self.entries.put(key, response, ttl=ttl)
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """
+    Stores responses in a SQLite file so they survive restarts and are shared by every process using the same path.
+
+    Responses are stored as their raw provider JSON and rebuilt with from_raw on the way out (as a TextResponse when
+    the raw JSON wasn't kept).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, cls TEXT, raw TEXT, expires REAL)"
+        )
+
+    async def get(self, key):
+        row = await asyncio.to_thread(self._get, key)
+        if row is None:
+            return None
+        cls_path, raw = row
+        module, _, name = cls_path.rpartition(".")
+        cls = getattr(importlib.import_module(module), name)
+        return cls.from_raw(json.loads(raw))
+
+    async def set(self, key, response, ttl):
+        cls, raw = type(response), response.raw
+        if not raw:
+            # Not kept (raw_retention="none"), the text is all that can be rebuilt
+            cls, raw = TextResponse, {"message": response.message}
+        expires = time.time() + ttl if ttl is not None else None
+        row = (key, f"{cls.__module__}.{cls.__qualname__}", json.dumps(raw), expires)
+        await asyncio.to_thread(self._set, row)
+
+    def _get(self, key):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT cls, raw FROM responses WHERE key = ? AND (expires IS NULL OR expires > ?)",
+                (key, time.time()),
+            ).fetchone()
+        return row
+
+    def _set(self, row):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)", row)
+            self._db.execute("DELETE FROM responses WHERE expires < ?", (time.time(),))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class ResponseCache:
+    """
+    Caches LLM responses keyed on (model name, built prompt, query kwargs that change the answer).
+
+    ttls overrides the default time to live for specific provider/model names, a ttl of None never expires.
+    """
+
+    # Query kwargs that change how we wait for an answer rather than what the answer is
+    IGNORED_KWARGS = {"timeout", "poll_interval"}
+
+    def __init__(
+        self,
+        backend: Optional[CacheBackend] = None,
+        ttl: Optional[float] = 300,
+        ttls: Optional[Dict[str, Optional[float]]] = None,
+    ):
+        self.backend = backend or MemoryCacheBackend()
+        self.ttl = ttl
+        self.ttls = ttls or {}
+        self.stats = CacheStats()
+        self.provider_stats: Dict[str, CacheStats] = {}
+
+    def key(self, name: str, prompt: str, kwargs: Optional[dict] = None) -> str:
+        kwargs = {k: v for k, v in (kwargs or {}).items() if k not in self.IGNORED_KWARGS}
+        raw = json.dumps([name, prompt, kwargs], sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def snapshot(self) -> dict:
+        return {
+            **asdict(self.stats),
+            "providers": {name: asdict(stats) for name, stats in self.provider_stats.items()},
+        }
+
+    async def get(self, name: str, prompt: str, kwargs: Optional[dict] = None) -> Optional[LLMResponse]:
+        response = await self.backend.get(self.key(name, prompt, kwargs))
+        provider = self.provider_stats.setdefault(name, CacheStats())
+        if response is None:
+            self.stats.misses += 1
+            provider.misses += 1
+        else:
+            self.stats.hits += 1
+            provider.hits += 1
+        return response
+
+    async def put(self, name: str, prompt: str, response: LLMResponse, kwargs: Optional[dict] = None):
+        ttl = self.ttls.get(name, self.ttl)
+        await self.backend.set(self.key(name, prompt, kwargs), response, ttl)
+        self.stats.stores += 1
+        self.provider_stats.setdefault(name, CacheStats()).stores += 1
+
+    async def query(self, llm: LLM, message: str, **kwargs) -> LLMResponse:
+        """
+        llm.query(message, **kwargs), answered from the cache when possible
+        """
+        prompt = llm.build_prompt(message)
+        response = await self.get(llm.name, prompt, kwargs)
+        if response is None:
+            response = await llm.query(message, **kwargs)
+            await self.put(llm.name, prompt, response, kwargs)
+        return response
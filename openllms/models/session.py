@@ -0,0 +1,27 @@
+import aiohttp
+
+
+def create_client_session(
+    limit: int = 100,
+    limit_per_host: int = 20,
+    keepalive_timeout: float = 60,
+    ttl_dns_cache: int = 300,
+    connect_timeout: float = 10,
+    **kwargs,
+) -> aiohttp.ClientSession:
+    """
+    Builds a connection-pooled ClientSession meant to be shared by every LLM instance for the lifetime of a process.
+
+    Keeping one session around means TCP+TLS connections to the providers are kept alive and reused between
+    queries instead of being renegotiated for every prompt. Connecting to a host gives up after connect_timeout seconds
+    so an unreachable provider fails (and gets retried) quickly instead of holding a request open. Must be called from inside a running event loop,
+    and the caller is responsible for closing it.
+    """
+    connector = aiohttp.TCPConnector(
+        limit=limit,
+        limit_per_host=limit_per_host,
+        keepalive_timeout=keepalive_timeout,
+        ttl_dns_cache=ttl_dns_cache,
+    )
+    kwargs.setdefault("timeout", aiohttp.ClientTimeout(total=300, sock_connect=connect_timeout))
+    return aiohttp.ClientSession(connector=connector, **kwargs)
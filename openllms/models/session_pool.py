@@ -0,0 +1,178 @@
+import asyncio
+import contextvars
+import logging
+import time
+import uuid
+import weakref
+from collections import deque
+from dataclasses import dataclass, asdict
+from typing import Deque, Dict, Optional, Set, Tuple, Type
+
+import aiohttp
+
+from openllms.models.llm import LLM, AuthenticatedClient
+from openllms.models.session_store import SessionStore
+
+
+@dataclass
+class PoolStats:
+    hits: int = 0  # checkouts served by an already authenticated client
+    misses: int = 0  # checkouts that had to handshake on the request path
+    refills: int = 0
+    refill_errors: int = 0
+    expired: int = 0
+    returned: int = 0  # checked out clients handed back unused with checkin()
+    resumed: int = 0  # sessions taken back from the store (e.g. warmed before a restart) rather than handshaken
+
+
+class SessionPool:
+    """
+    Keeps a few ready-to-use, already authenticated clients per model so starting a new conversation doesn't pay for
+    fetch_session_id (e.g. Decagon's /conversation/new or Shopify's anonymous user + conversation redirect) inline.
+
+    Call warm() to say a model should have warm sessions, checkout() to take one, and checkin() to hand back one that
+    ended up not being used. Every checkout kicks off a background refill back up to the model's target size. Clients that aren't AuthenticatedClients have nothing to
+    warm up and are just instantiated.
+
+    With a store, warm sessions are saved there until they're checked out (close() leaves them there), and a
+    model's saved sessions are taken back the first time it's warmed or checked out. So after a restart the sessions
+    warmed before it are used before any new handshake, without reviving every model at startup.
+    """
+
+    def __init__(
+        self,
+        client: aiohttp.ClientSession,
+        size: int = 2,
+        max_age: float = 600,
+        store: Optional[SessionStore] = None,
+        logger=None,
+    ):
+        self.client = client
+        self.size = size
+        self.max_age = max_age  # Upstream sessions go stale eventually, so don't hand out old ones
+        self.store = store
+        self.logger = logger or logging.getLogger(__name__)
+        self.stats = PoolStats()
+        self._ready: Dict[Type[LLM], Deque[Tuple[float, AuthenticatedClient, str]]] = {}
+        self._targets: Dict[Type[LLM], int] = {}
+        self._refills: Dict[Type[LLM], asyncio.Task] = {}
+        self._rehydrated: Set[Type[LLM]] = set()
+        self._out: "weakref.WeakKeyDictionary[LLM, float]" = weakref.WeakKeyDictionary()  # warm clients handed out -> created
+
+    def warm(self, cls: Type[LLM], size: Optional[int] = None):
+        """
+        Asks for `size` warm sessions of cls to be kept around and starts filling them in the background.
+        Must be called from the event loop the pool's ClientSession belongs to.
+        """
+        if not issubclass(cls, AuthenticatedClient):
+            return
+        self._targets[cls] = max(self._targets.get(cls, 0), size or self.size)
+        self._schedule_refill(cls)
+
+    async def checkout(self, cls: Type[LLM]) -> LLM:
+        """
+        Returns a client of cls, already authenticated if a warm one was available
+        """
+        self._rehydrate(cls)
+        taken = self._take(cls)
+        if taken is None:
+            if issubclass(cls, AuthenticatedClient):
+                self.stats.misses += 1
+            client = cls(client=self.client)
+        else:
+            created, client = taken
+            self._out[client] = created
+            self.stats.hits += 1
+
+        if cls in self._targets:
+            self._schedule_refill(cls)
+        return client
+
+    def checkin(self, client: LLM):
+        """
+        Puts a warm client that was checked out but never sent anything back with the ready ones. Anything else
+        (e.g. a client that hadn't authenticated yet) is just dropped
+        """
+        created = self._out.pop(client, None)
+        if created is None or time.time() - created > self.max_age:
+            return
+        self._add(type(client), client, created)
+        self.stats.returned += 1
+
+    def ready_count(self, cls: Type[LLM]) -> int:
+        return len(self._ready.get(cls, ()))
+
+    def snapshot(self) -> dict:
+        return {
+            **asdict(self.stats),
+            "ready": {cls.__name__: len(ready) for cls, ready in self._ready.items()},
+        }
+
+    async def close(self):
+        for task in self._refills.values():
+            task.cancel()
+        await asyncio.gather(*self._refills.values(), return_exceptions=True)
+        self._refills.clear()
+        self._ready.clear()
+
+    def _take(self, cls: Type[LLM]) -> Optional[Tuple[float, AuthenticatedClient]]:
+        """
+        The oldest unexpired ready client of cls, with when it was authenticated (a unix time)
+        """
+        ready = self._ready.get(cls)
+        now = time.monotonic()
+        while ready:
+            created, client, key = ready.popleft()
+            if self.store is not None:
+                self.store.pop(key)
+            if now - created <= self.max_age:
+                return time.time() - (now - created), client
+            self.stats.expired += 1
+        return None
+
+    def _rehydrate(self, cls: Type[LLM]):
+        """
+        The first time cls is asked for, takes its sessions saved by an earlier process back from the store
+        """
+        if self.store is None or cls in self._rehydrated or not issubclass(cls, AuthenticatedClient):
+            return
+        self._rehydrated.add(cls)
+        saved = []
+        while (entry := self.store.pop_any(f"pool/{cls.__name__}/")) is not None:
+            saved.append(entry)
+        for entry in saved:
+            client = cls(client=self.client)
+            client.restore_session(entry["state"])
+            self._add(cls, client, entry["created"])
+            self.stats.resumed += 1
+
+    def _add(self, cls: Type[LLM], client: AuthenticatedClient, created: float):
+        """
+        Adds a warm client that was authenticated at created (a unix time), saving it to the store if there is one
+        """
+        key = f"pool/{cls.__name__}/{uuid.uuid4().hex}"
+        age = time.time() - created
+        if self.store is not None:
+            self.store.put(key, {"state": client.session_state(), "created": created}, ttl=self.max_age - age)
+        self._ready.setdefault(cls, deque()).append((time.monotonic() - age, client, key))
+
+    def _schedule_refill(self, cls: Type[LLM]):
+        task = self._refills.get(cls)
+        if task is None or task.done():
+            # An empty context, so a refill started by a request's checkout doesn't take on e.g. its Deadline
+            self._refills[cls] = contextvars.Context().run(asyncio.create_task, self._refill(cls))
+
+    async def _refill(self, cls: Type[LLM]):
+        self._rehydrate(cls)
+        ready = self._ready.setdefault(cls, deque())
+        while len(ready) < self._targets.get(cls, 0):
+            client = cls(client=self.client)
+            try:
+                await client.authenticate()
+            except Exception as e:
+                # Leave it for the next checkout to try again instead of hammering a failing provider
+                self.stats.refill_errors += 1
+                self.logger.warning("Failed to warm a %s session: %s", cls.__name__, e)
+                return
+            self.stats.refills += 1
+            self._add(cls, client, time.time())
@@ -0,0 +1,147 @@
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Optional, Tuple
+
+
+class SessionStore(ABC):
+    """
+    Keeps AuthenticatedClients' session state (see AuthenticatedClient.session_state) so an upstream session can be
+    picked up again by another client, e.g. after a restart, instead of doing the handshake over.
+
+    Entries expire after their ttl (None keeps them until they're popped). Taking an entry with pop() or pop_any()
+    removes it, so a session is only ever resumed by one client.
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[dict]:
+        pass
+
+    @abstractmethod
+    def put(self, key: str, state: dict, ttl: Optional[float] = None):
+        pass
+
+    @abstractmethod
+    def pop(self, key: str) -> Optional[dict]:
+        pass
+
+    @abstractmethod
+    def pop_any(self, prefix: str) -> Optional[dict]:
+        """
+        Takes any unexpired entry whose key starts with prefix
+        """
+        pass
+
+    def close(self):
+        pass
+
+
+class MemorySessionStore(SessionStore):
+    """
+    Keeps sessions in this process only
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.entries: Dict[str, Tuple[dict, Optional[float]]] = {}  # key -> (state, expires as a unix time)
+
+    def get(self, key):
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None or self._expired(entry):
+                return None
+            return entry[0]
+
+    def put(self, key, state, ttl=None):
+        with self._lock:
+            self._set(key, state, time.time() + ttl if ttl is not None else None)
+
+    def pop(self, key):
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self._remove(key)
+            return None if self._expired(entry) else entry[0]
+
+    def pop_any(self, prefix):
+        with self._lock:
+            for key, entry in list(self.entries.items()):
+                if not key.startswith(prefix):
+                    continue
+                self._remove(key)
+                if not self._expired(entry):
+                    return entry[0]
+        return None
+
+    @staticmethod
+    def _expired(entry) -> bool:
+        return entry[1] is not None and entry[1] <= time.time()
+
+    def _set(self, key, state, expires):
+        self.entries[key] = (state, expires)
+
+    def _remove(self, key):
+        del self.entries[key]
+
+
+class FileSessionStore(MemorySessionStore):
+    """
+    Keeps sessions in memory and in a JSON lines file they're loaded back from on startup.
+
+    Every change is appended to the file as one short line, and the file is rewritten with just the live entries
+    once most of its lines are stale, so it stays small however long the process runs. One process per file.
+    """
+
+    def __init__(self, path: str, compact_after: int = 256):
+        super().__init__()
+        self.path = path
+        self.compact_after = compact_after  # stale lines to tolerate before rewriting the file
+        self._lines = 0
+        self._file = None
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        key, state, expires = json.loads(line)
+                    except ValueError:
+                        continue  # e.g. a line cut short when the process died mid-write
+                    if state is None:
+                        self.entries.pop(key, None)
+                    else:
+                        self.entries[key] = (state, expires)
+        self._compact()
+
+    def _set(self, key, state, expires):
+        super()._set(key, state, expires)
+        self._append([key, state, expires])
+
+    def _remove(self, key):
+        super()._remove(key)
+        self._append([key, None, None])
+
+    def _append(self, record):
+        self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self._file.flush()
+        self._lines += 1
+        if self._lines - len(self.entries) > max(self.compact_after, len(self.entries)):
+            self._compact()
+
+    def _compact(self):
+        self.entries = {key: entry for key, entry in self.entries.items() if not self._expired(entry)}
+        temp = f"{self.path}.tmp"
+        with open(temp, "w", encoding="utf-8") as f:
+            for key, (state, expires) in self.entries.items():
+                f.write(json.dumps([key, state, expires], separators=(",", ":")) + "\n")
+        if self._file is not None:
+            self._file.close()
+        os.replace(temp, self.path)
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._lines = len(self.entries)
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
@@ -0,0 +1,136 @@
+import asyncio
+import contextvars
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional
+
+
+@dataclass
+class FlightStats:
+    calls: int = 0  # calls actually made
+    coalesced: int = 0  # callers that shared a call already in flight instead of making their own
+    abandoned: int = 0  # calls cancelled because every caller waiting on them went away
+
+
+def _detached(coro) -> asyncio.Task:
+    # Shared calls start in an empty context so they don't take on context variables of whichever caller started
+    # them (e.g. its Deadline), every caller applies its own around the waiting instead
+    return contextvars.Context().run(asyncio.ensure_future, coro)
+
+
+class _Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class _SharedStream:
+    """
+    One run of an async iterator that any number of consumers read from the start, at their own pace
+    """
+
+    def __init__(self, source: AsyncIterator):
+        self.items: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+        self._changed = asyncio.Event()
+        self.task = _detached(self._produce(source))
+
+    async def _produce(self, source: AsyncIterator):
+        try:
+            async for item in source:
+                self.items.append(item)
+                self._notify()
+        except BaseException as e:
+            self.error = e
+            if not isinstance(e, Exception):
+                raise
+        finally:
+            self.done = True
+            self._notify()
+            if hasattr(source, "aclose"):
+                await source.aclose()
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def consume(self) -> AsyncIterator:
+        index = 0
+        while True:
+            if index < len(self.items):
+                index += 1
+                yield self.items[index - 1]
+            elif self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            else:
+                await self._changed.wait()
+
+
+class SingleFlight:
+    """
+    Lets concurrent callers asking for the same thing (same key) share one call rather than each making their own.
+
+    run() is for a coroutine, stream() for an async iterator (everyone sharing it gets every item from the first
+    one on, however late they joined). All callers get the same result or exception. A caller that's cancelled or
+    stops reading only stops waiting, the call goes on for the others, and is cancelled once nobody is left waiting
+    on it. The call doesn't see the callers' context variables, so a caller's deadline only bounds its own wait. Once a call is finished the next caller with its key starts a new one, nothing is cached.
+    """
+
+    def __init__(self):
+        self.stats = FlightStats()
+        self._calls: Dict[Hashable, _Flight] = {}
+        self._streams: Dict[Hashable, _SharedStream] = {}
+
+    def in_flight(self) -> int:
+        return len(self._calls) + len(self._streams)
+
+    async def run(self, key: Hashable, call: Callable[[], Awaitable]) -> Any:
+        flight = self._calls.get(key)
+        if flight is None:
+            flight = _Flight(_detached(call()))
+            self._calls[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(self._calls, key, flight))
+            self.stats.calls += 1
+        else:
+            self.stats.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            self._abandon(self._calls, key, flight)
+
+    async def stream(self, key: Hashable, source: Callable[[], AsyncIterator]) -> AsyncIterator:
+        shared = self._streams.get(key)
+        if shared is None:
+            shared = _SharedStream(source())
+            self._streams[key] = shared
+            shared.task.add_done_callback(lambda _: self._forget(self._streams, key, shared))
+            self.stats.calls += 1
+        else:
+            self.stats.coalesced += 1
+
+        shared.waiters += 1
+        items = shared.consume()
+        try:
+            async for item in items:
+                yield item
+        finally:
+            await items.aclose()
+            shared.waiters -= 1
+            self._abandon(self._streams, key, shared)
+
+    def _abandon(self, flights: dict, key: Hashable, flight):
+        if flight.waiters == 0 and not flight.task.done():
+            flight.task.cancel()
+            self.stats.abandoned += 1
+            self._forget(flights, key, flight)
+
+    @staticmethod
+    def _forget(flights: dict, key: Hashable, flight):
+        if flights.get(key) is flight:
+            del flights[key]
@@ -0,0 +1,93 @@
+from dataclasses import dataclass
+from typing import AsyncIterator, List, Optional
+
+
+@dataclass
+class SSEEvent:
+    event: str = "message"
+    data: str = ""
+    id: Optional[str] = None
+
+
+class SSEParser:
+    """
+    Incremental text/event-stream parser. Feed it bytes as they arrive off the wire and it returns whichever events
+    were completed by them, holding on to any partial line until the rest shows up.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._event = "message"
+        self._data: List[str] = []
+        self._id: Optional[str] = None
+
+    def feed(self, chunk: bytes) -> List[SSEEvent]:
+        self._buffer += chunk
+        events = []
+        while True:
+            end = self._line_end()
+            if end is None:
+                return events
+            line, sep = bytes(self._buffer[:end]), end + 1
+            if self._buffer[end:end + 2] == b"\r\n":
+                sep += 1
+            del self._buffer[:sep]
+            event = self._handle_line(line.decode("utf-8", errors="replace"))
+            if event is not None:
+                events.append(event)
+
+    def close(self) -> List[SSEEvent]:
+        """
+        Flushes whatever is left once the stream ends (a final event without its trailing blank line)
+        """
+        events = self.feed(b"\n") if self._buffer else []
+        event = self._dispatch()
+        if event is not None:
+            events.append(event)
+        return events
+
+    def _line_end(self) -> Optional[int]:
+        lf = self._buffer.find(b"\n")
+        cr = self._buffer.find(b"\r")
+        if cr == -1 or (lf != -1 and lf < cr):
+            return lf if lf != -1 else None
+        # A \r at the very end of the buffer might be the first half of a \r\n
+        return cr if cr + 1 < len(self._buffer) else None
+
+    def _handle_line(self, line: str) -> Optional[SSEEvent]:
+        if not line:
+            return self._dispatch()
+        if line.startswith(":"):
+            return None  # comment / keep-alive
+
+        field, _, value = line.partition(":")
+        if value.startswith(" "):
+            value = value[1:]
+
+        if field == "data":
+            self._data.append(value)
+        elif field == "event":
+            self._event = value
+        elif field == "id":
+            self._id = value
+        return None
+
+    def _dispatch(self) -> Optional[SSEEvent]:
+        event = None
+        if self._data:
+            event = SSEEvent(event=self._event, data="\n".join(self._data), id=self._id)
+        self._event = "message"
+        self._data = []
+        return event
+
+
+async def iter_sse(content) -> AsyncIterator[SSEEvent]:
+    """
+    Yields events from an aiohttp response body (response.content) as they arrive
+    """
+    parser = SSEParser()
+    async for chunk in content.iter_any():
+        for event in parser.feed(chunk):
+            yield event
+    for event in parser.close():
+        yield event
@@ -0,0 +1,45 @@
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+
+class PhaseTimer:
+    """
+    Adds up how long an LLM spends in each phase of its queries (auth, queue, send, receive, poll, parse, ...).
+
+    Phases can nest, but time only counts towards the outermost one: a request made while polling is poll time,
+    not send time, so the phases of a query always add up to (at most) its wall clock time. Every phase entered is
+    still counted in `counts`, nested or not. Meant for one query at a time, like the LLM it belongs to.
+    """
+
+    def __init__(self):
+        self.durations: Dict[str, float] = defaultdict(float)
+        self.counts: Dict[str, int] = defaultdict(int)
+        self._depth = 0
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        self.counts[name] += 1
+        self._depth += 1
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            if self._depth == 0:
+                self.durations[name] += time.monotonic() - start
+
+    def snapshot(self) -> Dict[str, float]:
+        return dict(self.durations)
+
+    def since(self, snapshot: Dict[str, float]) -> Dict[str, float]:
+        """
+        Seconds spent in each phase since snapshot() was taken
+        """
+        return {name: total - snapshot.get(name, 0.0) for name, total in self.durations.items()
+                if total - snapshot.get(name, 0.0) > 0}
+
+    def add(self, durations: Dict[str, float]):
+        for name, seconds in durations.items():
+            self.durations[name] += seconds
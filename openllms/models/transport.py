@@ -0,0 +1,318 @@
+import asyncio
+import base64
+import gzip
+import hashlib
+import inspect
+import json
+import re
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+import aiohttp
+from multidict import CIMultiDict, CIMultiDictProxy
+from yarl import URL
+
+
+class Transport(ABC):
+    """
+    What an LLM sends its HTTP requests through (LLM._request is the only place that does).
+
+    An aiohttp.ClientSession is already a transport as far as LLM is concerned, these are for when the I/O should
+    be captured (RecordingTransport), served from a recording (ReplayTransport) or faked (MemoryTransport).
+    request() is used like ClientSession.request and yields something that behaves like a ClientResponse.
+    """
+
+    @abstractmethod
+    def request(self, method: str, url: str, **kwargs):
+        pass
+
+    async def close(self):
+        pass
+
+
+class ChunkStream:
+    """
+    The parts of aiohttp's StreamReader the clients use (line iteration, iter_any, read) over any source of chunks
+    """
+
+    def __init__(self, chunks: AsyncIterator[bytes]):
+        self._chunks = chunks
+
+    async def iter_any(self) -> AsyncIterator[bytes]:
+        async for chunk in self._chunks:
+            yield chunk
+
+    def __aiter__(self):
+        return self._lines()
+
+    async def _lines(self) -> AsyncIterator[bytes]:
+        buffer = b""
+        async for chunk in self._chunks:
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                yield line + b"\n"
+        if buffer:
+            yield buffer
+
+    async def read(self) -> bytes:
+        return b"".join([chunk async for chunk in self._chunks])
+
+
+class StreamedResponse:
+    """
+    Enough of a ClientResponse for the clients: status, headers, raise_for_status, read/text/json and .content
+    """
+
+    def __init__(self, method: str, url: str, status: int, headers: Dict[str, str], chunks: AsyncIterator[bytes]):
+        self.method = method
+        self.url = URL(url)
+        self.status = status
+        self.headers = CIMultiDictProxy(CIMultiDict(headers))
+        self.content = ChunkStream(chunks)
+        self._body: Optional[bytes] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.status < 400
+
+    def raise_for_status(self):
+        if not self.ok:
+            info = aiohttp.RequestInfo(self.url, self.method, CIMultiDictProxy(CIMultiDict()), self.url)
+            raise aiohttp.ClientResponseError(info, (), status=self.status, message="", headers=self.headers)
+
+    async def read(self) -> bytes:
+        if self._body is None:
+            self._body = await self.content.read()
+        return self._body
+
+    async def text(self, encoding: Optional[str] = None, errors: str = "strict") -> str:
+        return (await self.read()).decode(encoding or "utf-8", errors)
+
+    async def json(self, **kwargs) -> Any:
+        return json.loads(await self.text())
+
+    def release(self):
+        pass
+
+
+async def timed_chunks(chunks: List[Tuple[float, bytes]], time_scale: float = 1.0) -> AsyncIterator[bytes]:
+    """
+    Yields (offset, chunk) pairs with each chunk arriving `offset` seconds (times time_scale) after the first call
+    """
+    start = time.monotonic()
+    for offset, chunk in chunks:
+        wait = start + offset * time_scale - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        yield chunk
+
+
+class MemoryResponse:
+    """
+    A canned answer for MemoryTransport. `chunks` sends the body in pieces, each `chunk_delay` seconds apart
+    """
+
+    def __init__(self, status: int = 200, body: Any = b"", headers: Optional[Dict[str, str]] = None,
+                 chunks: Optional[List[bytes]] = None, delay: float = 0.0, chunk_delay: float = 0.0):
+        if not isinstance(body, (bytes, str)):
+            body = json.dumps(body)
+            headers = {"Content-Type": "application/json", **(headers or {})}
+        if isinstance(body, str):
+            body = body.encode()
+        self.status = status
+        self.headers = headers or {}
+        self.chunks = [c.encode() if isinstance(c, str) else c for c in chunks] if chunks is not None else [body]
+        self.delay = delay  # seconds before the headers arrive
+        self.chunk_delay = chunk_delay
+
+    def timed_chunks(self) -> List[Tuple[float, bytes]]:
+        return [(i * self.chunk_delay, chunk) for i, chunk in enumerate(self.chunks)]
+
+
+Handler = Callable[[str, str, dict], Any]
+
+
+class MemoryTransport(Transport):
+    """
+    Answers requests from memory, without a network.
+
+    Either give it a handler(method, url, kwargs) returning a MemoryResponse (or an awaitable of one), or add()
+    canned responses per method and URL (query string ignored). Several responses added for one URL are handed out
+    in order, and the last keeps being repeated. Every request is kept in `requests` to check afterwards.
+    """
+
+    def __init__(self, handler: Optional[Handler] = None, time_scale: float = 1.0):
+        self.handler = handler
+        self.time_scale = time_scale
+        self.responses: Dict[Tuple[str, str], Deque[MemoryResponse]] = defaultdict(deque)
+        self.requests: List[Tuple[str, str, dict]] = []
+
+    def add(self, method: str, url: str, response: Optional[MemoryResponse] = None, **kwargs):
+        self.responses[(method.upper(), str(URL(url).with_query(None)))].append(response or MemoryResponse(**kwargs))
+
+    async def respond(self, method: str, url: str, kwargs: dict) -> MemoryResponse:
+        if self.handler is not None:
+            response = self.handler(method, url, kwargs)
+            return await response if inspect.isawaitable(response) else response
+        queue = self.responses.get((method.upper(), str(URL(url).with_query(None))))
+        if not queue:
+            return MemoryResponse(status=404, body=f"No response for {method} {url}")
+        return queue.popleft() if len(queue) > 1 else queue[0]
+
+    @asynccontextmanager
+    async def request(self, method: str, url: str, **kwargs):
+        self.requests.append((method, url, kwargs))
+        response = await self.respond(method, url, kwargs)
+        if response.delay:
+            await asyncio.sleep(response.delay * self.time_scale)
+        yield StreamedResponse(method, url, response.status, response.headers,
+                               timed_chunks(response.timed_chunks(), self.time_scale))
+
+
+# Cassettes: JSON lines (gzipped if the path ends in .gz), one exchange or query per line
+
+# Response headers that describe the connection rather than the answer, left out of cassettes
+DROPPED_HEADERS = {"date", "server", "set-cookie", "content-length", "transfer-encoding", "connection", "keep-alive",
+                   "content-encoding"}
+# Path segments that are per-session ids (uuids, long hex or digit runs), masked out when matching requests up
+ID_SEGMENT = re.compile(r"^([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}|[0-9a-f]{16,}|\d+)$", re.I)
+
+
+def _open(path: str, mode: str):
+    return gzip.open(path, mode + "t", encoding="utf-8") if path.endswith(".gz") else open(path, mode, encoding="utf-8")
+
+
+def _encode(chunk: bytes):
+    try:
+        return chunk.decode("utf-8")
+    except UnicodeDecodeError:
+        return {"b64": base64.b64encode(chunk).decode()}
+
+
+def _decode(chunk) -> bytes:
+    return base64.b64decode(chunk["b64"]) if isinstance(chunk, dict) else chunk.encode("utf-8")
+
+
+def request_key(method: str, url: str) -> str:
+    """
+    Which recorded exchanges can answer a request: same method, host and path, ignoring ids and the query string
+    """
+    parsed = URL(url)
+    path = "/".join("*" if ID_SEGMENT.match(segment) else segment for segment in parsed.path.split("/"))
+    return f"{method.upper()} {parsed.host}{path}"
+
+
+def request_fingerprint(kwargs: dict) -> str:
+    sent = {k: kwargs.get(k) for k in ("params", "json", "data") if kwargs.get(k) is not None}
+    return hashlib.sha256(json.dumps(sent, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def read_cassette(path: str) -> Iterator[dict]:
+    with _open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+class RecordingTransport(Transport):
+    """
+    Passes requests on to another transport (usually the shared ClientSession) and writes every exchange to a
+    cassette: the request, the status, headers and the body chunks with when each arrived. Whatever the client
+    read of the body by the time it's done with the response is what's recorded.
+
+    note_query() adds a finished (model, prompt, answer) to the cassette too, which is what cache prewarming uses.
+    """
+
+    def __init__(self, inner, path: str):
+        self.inner = inner
+        self.path = path
+        self._file = _open(path, "a")
+
+    def write(self, entry: dict):
+        self._file.write(json.dumps(entry, separators=(",", ":")) + "\n")
+        self._file.flush()
+
+    def note_query(self, model: str, prompt: str, message: str):
+        self.write({"type": "query", "model": model, "prompt": prompt, "message": message})
+
+    @asynccontextmanager
+    async def request(self, method: str, url: str, **kwargs):
+        start = time.monotonic()
+        chunks: List[Tuple[float, bytes]] = []
+
+        async with self.inner.request(method, url, **kwargs) as resp:
+            ttfb = time.monotonic() - start
+
+            async def tee():
+                async for chunk in resp.content.iter_any():
+                    chunks.append((time.monotonic() - start - ttfb, chunk))
+                    yield chunk
+
+            headers = {k: v for k, v in resp.headers.items() if k.lower() not in DROPPED_HEADERS}
+            try:
+                yield StreamedResponse(method, str(resp.url), resp.status, headers, tee())
+            finally:
+                self.write({
+                    "type": "exchange",
+                    "key": request_key(method, url),
+                    "fingerprint": request_fingerprint(kwargs),
+                    "method": method,
+                    "url": url,
+                    "request": {k: kwargs[k] for k in ("params", "json") if kwargs.get(k) is not None},
+                    "status": resp.status,
+                    "headers": headers,
+                    "ttfb": round(ttfb, 4),
+                    "chunks": [[round(offset, 4), _encode(chunk)] for offset, chunk in chunks],
+                })
+
+    async def close(self):
+        self._file.close()
+
+
+class ReplayTransport(MemoryTransport):
+    """
+    Serves requests from a cassette instead of the network.
+
+    A request is answered by a recorded exchange with the same method, host and path (ids masked out), preferring
+    one that sent the same params/body, otherwise the next in recorded order. Once a path's recordings run out the
+    last one keeps being served, so e.g. a client that polls more often than it did while recording still gets an
+    answer. time_scale=1 keeps the original timings, 0.5 plays back twice as fast and 0 is instant.
+    """
+
+    def __init__(self, path: str, time_scale: float = 1.0):
+        super().__init__(time_scale=time_scale)
+        self.path = path
+        self.exchanges: Dict[str, List[dict]] = defaultdict(list)
+        self.last: Dict[str, dict] = {}
+        for entry in read_cassette(path):
+            if entry.get("type") == "exchange":
+                self.exchanges[entry["key"]].append(entry)
+
+    async def respond(self, method: str, url: str, kwargs: dict) -> MemoryResponse:
+        key = request_key(method, url)
+        recorded = self.exchanges.get(key)
+        if recorded:
+            fingerprint = request_fingerprint(kwargs)
+            index = next((i for i, e in enumerate(recorded) if e["fingerprint"] == fingerprint), 0)
+            self.last[key] = recorded.pop(index)
+        exchange = self.last.get(key)
+        if exchange is None:
+            return MemoryResponse(status=404, body=f"Not in cassette: {method} {url}")
+
+        response = MemoryResponse(status=exchange["status"], headers=exchange["headers"], delay=exchange["ttfb"])
+        response.timed_chunks = lambda: [(offset, _decode(chunk)) for offset, chunk in exchange["chunks"]]
+        return response
+
+
+def recorded_queries(path: str) -> Iterator[dict]:
+    """
+    The (model, prompt, message) queries noted in a cassette
+    """
+    for entry in read_cassette(path):
+        if entry.get("type") == "query":
+            yield entry